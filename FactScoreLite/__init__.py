@@ -1,4 +1,45 @@
-from .atomic_facts import AtomicFactGenerator
-from .openai_agent import OpenAIAgent
-from .fact_scorer import FactScorer
-from .factscore import FactScore
+import importlib
+
+# Same as typing.TYPE_CHECKING, without importing typing
+TYPE_CHECKING = False
+
+# Public names by the module defining them. They are imported on first access (PEP 562),
+# so importing the package does not import openai, nltk and the pipeline modules.
+EXPORTS = {
+    "AtomicFactGenerator": "atomic_facts",
+    "OpenAIAgent": "openai_agent",
+    "AsyncOpenAIAgent": "openai_agent",
+    "FactScorer": "fact_scorer",
+    "FactScore": "factscore",
+    "UsageStats": "usage",
+    "BudgetExceeded": "usage",
+    "LLMBackend": "backends",
+    "FakeBackend": "backends",
+    "Metrics": "metrics",
+}
+
+__all__ = list(EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(f".{EXPORTS[name]}", __name__), name)
+    # Later accesses skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted(list(globals()) + __all__)
+
+
+if TYPE_CHECKING:
+    from .atomic_facts import AtomicFactGenerator
+    from .openai_agent import OpenAIAgent, AsyncOpenAIAgent
+    from .fact_scorer import FactScorer
+    from .factscore import FactScore
+    from .usage import UsageStats, BudgetExceeded
+    from .backends import LLMBackend, FakeBackend
+    from .metrics import Metrics
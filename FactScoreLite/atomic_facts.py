@@ -1,21 +1,121 @@
 import re
-import numpy as np
-from nltk.tokenize import sent_tokenize
-from .openai_agent import OpenAIAgent
+import asyncio
+import contextlib
+import threading
+from concurrent.futures import Future
+from .openai_agent import OpenAIAgent, AsyncOpenAIAgent, estimate_tokens
+from .concurrency import ordered_map, pack_by_budget
+from .cache import MemoCache, make_key, get_sentence_cache
+from .prompts import PromptPrefixes, get_demons
+from .usage import UsageStats
+from .backends import LLMBackend, AsyncBackendAgent, get_backend_name
+from .metrics import Metrics
 from . import configs
 import json
 
 
+def sent_tokenize(text: str) -> list:
+    """
+    Splits a text into sentences with NLTK's sent_tokenize, importing nltk on first use.
+    """
+    from nltk.tokenize import sent_tokenize
+
+    return sent_tokenize(text)
+
+
 class AtomicFactGenerator:
-    def __init__(self):
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        max_workers: int = None,
+        pack_token_budget: int = None,
+        sentence_cache: MemoCache = None,
+        usage: UsageStats = None,
+        backend: LLMBackend = None,
+        metrics: Metrics = None,
+    ):
         # Examples (demonstrations) that is used in prompt generation
-        self.demons = self.load_demons()
+        self.demons = get_demons(configs.atomic_facts_demons_path, self.load_demons)
+        # Token accounting and budget shared with the rest of the run
+        self.usage = usage
+        # Timings, in-flight calls and errors of the stage
+        self.metrics = metrics if metrics is not None else Metrics()
+        # The LLM to send the prompts to (None uses the OpenAI agents)
+        self.backend = backend
         # To interact with OpenAI APIs
-        self.openai_agent = OpenAIAgent()
+        self.openai_agent = (
+            backend
+            if backend is not None
+            else OpenAIAgent(usage=usage, stage="extraction", metrics=self.metrics)
+        )
+        # Async agent is created on first use so sync-only callers never build one
+        self.max_concurrency = max_concurrency
+        self._async_openai_agent = None
+        # Number of sentences sent in parallel by run
+        self.max_workers = max_workers or configs.max_workers
+        # Prompt token budget of a packed request (None sends one request per sentence)
+        self.pack_token_budget = pack_token_budget or configs.extraction_token_budget
+        # Atomic facts of sentences shared across generations (and runs if persisted)
+        self.sentence_cache = (
+            sentence_cache if sentence_cache is not None else get_sentence_cache()
+        )
+        # Sentences being extracted right now, so concurrent callers wait instead of resending
+        self.in_flight = {}
+        self.async_in_flight = {}
+        self.in_flight_lock = threading.Lock()
+
+    @property
+    def async_openai_agent(self) -> AsyncOpenAIAgent:
+        if self._async_openai_agent is None and self.backend is not None:
+            self._async_openai_agent = AsyncBackendAgent(self.backend)
+        elif self._async_openai_agent is None:
+            self._async_openai_agent = AsyncOpenAIAgent(
+                self.max_concurrency,
+                usage=self.usage,
+                stage="extraction",
+                metrics=self.metrics,
+            )
+
+        return self._async_openai_agent
+
+    def generate(self, prompt: str, system: str = None) -> str:
+        """
+        Sends a prompt to the LLM, timing the call.
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Returns:
+            str: The output of the LLM.
+        """
+        with self.metrics.track_call("extraction"):
+            return self.openai_agent.generate(prompt, system=system)
+
+    async def agenerate(self, prompt: str, system: str = None) -> str:
+        """
+        Async version of generate.
+        """
+        with self.metrics.track_call("extraction"):
+            return await self.async_openai_agent.generate(prompt, system=system)
+
+    @property
+    def demons(self) -> list:
+        return self._demons
+
+    @demons.setter
+    def demons(self, demons: list):
+        # The static prompt prefixes and the cache keys depend on the demons
+        self._demons = demons
+        self.demons_hash = make_key(demons)
+        self.prefixes = PromptPrefixes(
+            make_key(type(self).__qualname__, self.demons_hash)
+        )
 
     def run(self, text: str) -> list:
         """
         Extracts atomic facts from a text.
+        With max_workers > 1 the sentences are sent in parallel on a thread pool.
 
         Args:
             text (str): The text to extract atomic facts from.
@@ -24,18 +124,103 @@ class AtomicFactGenerator:
             list: A list of atomic facts and the associatated sentence extracted from the text.
         """
 
-        sentences = []
+        sentences = self.split_sentences(text)
 
-        initials = self.detect_initials(text)
-        sentences = sent_tokenize(text)
-        sentences = self.fix_sentence_splitter(sentences, initials)
+        atoms = self.get_sentences_af(sentences)
 
-        atoms = []
-        for sent in sentences:
-            atom = self.get_sentence_af(sent)
-            atoms.append((sent, atom))
+        return list(zip(sentences, atoms))
 
-        return atoms
+    def run_many(self, texts: list) -> list:
+        """
+        Extracts atomic facts from several texts.
+        In packed mode the sentences of all the texts share the packed requests.
+
+        Args:
+            texts (list): The texts to extract atomic facts from.
+
+        Returns:
+            list: The output of run for each text.
+        """
+
+        sentences_of_texts = [self.split_sentences(text) for text in texts]
+        atoms = self.get_sentences_af(
+            [sent for sentences in sentences_of_texts for sent in sentences]
+        )
+
+        return self.group_atoms(sentences_of_texts, atoms)
+
+    async def arun(self, text: str) -> list:
+        """
+        Async version of run. The sentences of the text are sent concurrently,
+        bounded by the max_concurrency of the async agent.
+
+        Args:
+            text (str): The text to extract atomic facts from.
+
+        Returns:
+            list: A list of atomic facts and the associatated sentence extracted from the text.
+        """
+
+        sentences = self.split_sentences(text)
+
+        atoms = await self.aget_sentences_af(sentences)
+
+        return list(zip(sentences, atoms))
+
+    async def arun_many(self, texts: list) -> list:
+        """
+        Async version of run_many.
+
+        Args:
+            texts (list): The texts to extract atomic facts from.
+
+        Returns:
+            list: The output of run for each text.
+        """
+
+        sentences_of_texts = [self.split_sentences(text) for text in texts]
+        atoms = await self.aget_sentences_af(
+            [sent for sentences in sentences_of_texts for sent in sentences]
+        )
+
+        return self.group_atoms(sentences_of_texts, atoms)
+
+    def group_atoms(self, sentences_of_texts: list, atoms: list) -> list:
+        """
+        Regroups the atomic facts of flattened sentences per text.
+
+        Args:
+            sentences_of_texts (list): The sentences of each text.
+            atoms (list): The atomic facts of every sentence, flattened in the same order.
+
+        Returns:
+            list: A list of (sentence, atomic facts) pairs for each text.
+        """
+        results = []
+        start = 0
+
+        for sentences in sentences_of_texts:
+            results.append(list(zip(sentences, atoms[start : start + len(sentences)])))
+            start += len(sentences)
+
+        return results
+
+    def split_sentences(self, text: str) -> list:
+        """
+        Splits a text into sentences, taking care of initials.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            list: A list of sentences.
+        """
+        with self.metrics.time("sentence_splitting"):
+            initials = self.detect_initials(text)
+            sentences = sent_tokenize(text)
+            sentences = self.fix_sentence_splitter(sentences, initials)
+
+        return sentences
 
     def load_demons(self):
         """
@@ -51,6 +236,42 @@ class AtomicFactGenerator:
         return demons
 
     def get_instructions(self) -> str:
+        """
+        Returns the instructions for the prompt generation, sent as the system message.
+        They are built once and shared by every extraction prompt.
+
+        Returns:
+            str: The instructions for the prompt generation.
+        """
+        return self.prefixes.get("extraction", self.build_instructions)
+
+    def get_pack_instructions(self) -> str:
+        """
+        Returns the instructions of packed prompts, sent as the system message.
+
+        Returns:
+            str: The instructions followed by the packed answer format.
+        """
+        return self.prefixes.get(
+            "packed_extraction",
+            lambda: self.get_instructions()
+            + (
+                "Please breakdown each of the following sentences into independent facts. "
+                "Answer with one JSON object per line for every sentence, in the format "
+                '{"sentence": <number>, "facts": ["<fact>", ...]}.\n\n'
+            ),
+        )
+
+    def get_prompt_stats(self) -> dict:
+        """
+        Returns the estimated tokens of the static prompt prefixes, which every request repeats.
+
+        Returns:
+            dict: The prefix tokens by prefix name.
+        """
+        return self.prefixes.stats()
+
+    def build_instructions(self) -> str:
         """
         Prepare instructions for the prompt generation.
         Instructions include the examples given in the atomic_facts_demons.json file.
@@ -78,6 +299,463 @@ class AtomicFactGenerator:
 
         return instructions
 
+    def get_sentences_af(self, sentences: list) -> list:
+        """
+        Gets atomic facts for a list of sentences.
+        Sentences already extracted (in this or a previous generation) are taken from the
+        sentence cache, identical sentences are only sent once, and sentences that another
+        thread is extracting right now are waited for instead of being sent again.
+
+        Args:
+            sentences (list): The sentences to extract atomic facts from.
+
+        Returns:
+            list: A list of atomic facts for each sentence.
+        """
+        keys = [self.get_sentence_key(sent) for sent in sentences]
+        atoms, owned, waiting = self.lookup_sentences(sentences, keys)
+
+        try:
+            extracted = self.extract_sentences(list(owned.values()))
+        except BaseException as e:
+            self.release_in_flight(self.in_flight, owned, error=e)
+            raise
+
+        atoms.update(zip(owned, extracted))
+        self.release_in_flight(self.in_flight, owned, atoms=atoms)
+
+        for key, future in waiting.items():
+            atoms[key] = future.result()
+
+        return [atoms[key] for key in keys]
+
+    async def aget_sentences_af(self, sentences: list) -> list:
+        """
+        Async version of get_sentences_af.
+
+        Args:
+            sentences (list): The sentences to extract atomic facts from.
+
+        Returns:
+            list: A list of atomic facts for each sentence.
+        """
+        keys = [self.get_sentence_key(sent) for sent in sentences]
+        atoms, owned, waiting = self.lookup_sentences(sentences, keys, is_async=True)
+
+        try:
+            extracted = await self.aextract_sentences(list(owned.values()))
+        except BaseException as e:
+            self.release_in_flight(self.async_in_flight, owned, error=e)
+            raise
+
+        atoms.update(zip(owned, extracted))
+        self.release_in_flight(self.async_in_flight, owned, atoms=atoms)
+
+        for key, future in waiting.items():
+            atoms[key] = await future
+
+        return [atoms[key] for key in keys]
+
+    async def astream_sentences_af(self, sentences: list, on_fact) -> list:
+        """
+        Streaming version of aget_sentences_af: on_fact is called with every atomic fact
+        as soon as it is parsed from the output stream, so it can be scored right away.
+        Cached sentences and sentences extracted by another caller report their facts when available.
+
+        Args:
+            sentences (list): The sentences to extract atomic facts from.
+            on_fact (callable): Called with each atomic fact (once per distinct sentence).
+
+        Returns:
+            list: A list of atomic facts for each sentence.
+        """
+        keys = [self.get_sentence_key(sent) for sent in sentences]
+        atoms, owned, waiting = self.lookup_sentences(sentences, keys, is_async=True)
+
+        for facts in atoms.values():
+            for fact in facts:
+                on_fact(fact)
+
+        async def extract(sent):
+            facts = []
+
+            async with contextlib.aclosing(self.astream_sentence_af(sent)) as stream:
+                async for fact in stream:
+                    on_fact(fact)
+                    facts.append(fact)
+
+            return facts
+
+        async def wait(future):
+            facts = await future
+
+            for fact in facts:
+                on_fact(fact)
+
+            return facts
+
+        try:
+            extracted = await asyncio.gather(
+                *(extract(sent) for sent in owned.values())
+            )
+        except BaseException as e:
+            self.release_in_flight(self.async_in_flight, owned, error=e)
+            raise
+
+        atoms.update(zip(owned, extracted))
+        self.release_in_flight(self.async_in_flight, owned, atoms=atoms)
+        atoms.update(
+            zip(waiting, await asyncio.gather(*(wait(f) for f in waiting.values())))
+        )
+
+        return [atoms[key] for key in keys]
+
+    async def astream_sentence_af(self, sent: str):
+        """
+        Streaming version of aget_sentence_af. A "- fact" is complete once the next one starts
+        (or the output ends), so the facts are the same as gpt_output_to_sentences would parse.
+
+        Args:
+            sent (str): The sentence to extract atomic facts from.
+
+        Yields:
+            str: Each atomic fact extracted from the sentence.
+        """
+        buffer = ""
+
+        stream = self.async_openai_agent.stream(
+            self.get_prompt(sent), system=self.get_instructions()
+        )
+
+        # Closing the stream releases its request slot even if the facts are not all consumed
+        with self.metrics.track_call("extraction"):
+            async with contextlib.aclosing(stream):
+                async for chunk in stream:
+                    parts = (buffer + chunk).split("- ")
+
+                    # The first part precedes the first fact and the last one may still grow
+                    for part in parts[1:-1]:
+                        for fact in self.gpt_output_to_sentences("- " + part):
+                            yield fact
+
+                    buffer = "- " + parts[-1] if len(parts) > 1 else parts[0]
+
+        for fact in self.gpt_output_to_sentences(buffer):
+            yield fact
+
+    def lookup_sentences(self, sentences: list, keys: list, is_async=False) -> tuple:
+        """
+        Sorts the distinct sentences into cached ones, ones extracted by another caller right now,
+        and ones the caller has to extract (registered as in flight).
+
+        Args:
+            sentences (list): The sentences.
+            keys (list): The sentence key of each sentence.
+            is_async (bool): Whether to look at the async in-flight sentences.
+
+        Returns:
+            tuple: The cached atomic facts by key, the sentences to extract by key,
+                and the futures of the sentences extracted by another caller by key.
+        """
+        atoms = {}
+        owned = {}
+        waiting = {}
+        in_flight = self.async_in_flight if is_async else self.in_flight
+
+        for sent, key in zip(sentences, keys):
+            if key in atoms or key in owned or key in waiting:
+                continue
+
+            with self.in_flight_lock:
+                if key in in_flight:
+                    waiting[key] = in_flight[key]
+                    continue
+
+            cached = (
+                self.sentence_cache.get(key)
+                if self.sentence_cache is not None
+                else None
+            )
+
+            if cached is not None:
+                atoms[key] = cached
+                continue
+
+            with self.in_flight_lock:
+                # Another caller may have started it since the first check
+                if key in in_flight:
+                    waiting[key] = in_flight[key]
+                    continue
+
+                in_flight[key] = (
+                    asyncio.get_running_loop().create_future() if is_async else Future()
+                )
+
+            owned[key] = sent
+
+        return atoms, owned, waiting
+
+    def release_in_flight(self, in_flight: dict, owned: dict, atoms=None, error=None):
+        """
+        Publishes the result (or the error) of the sentences extracted by the caller
+        to the cache and to the callers waiting for them.
+
+        Args:
+            in_flight (dict): The in-flight futures (sync or async).
+            owned (dict): The sentences extracted by the caller by key.
+            atoms (dict): The atomic facts by key, if the extraction succeeded.
+            error (BaseException): The error raised by the extraction, if it failed.
+        """
+        for key in owned:
+            if error is None and self.sentence_cache is not None:
+                self.sentence_cache.set(key, atoms[key])
+
+            with self.in_flight_lock:
+                future = in_flight.pop(key, None)
+
+            if future is None or future.done():
+                continue
+
+            if error is None:
+                future.set_result(atoms[key])
+            else:
+                future.set_exception(error)
+
+    def get_requests(self, texts: list) -> list:
+        """
+        Lists the single sentence requests run would send for the sentences of texts
+        missing from the sentence cache, e.g. to send them through the Batch API.
+
+        Args:
+            texts (list): The texts to extract atomic facts from.
+
+        Returns:
+            list: The (prompt, system message) pairs, one per distinct sentence.
+        """
+        requests = {}
+
+        for text in texts:
+            for sent in self.split_sentences(text):
+                key = self.get_sentence_key(sent)
+
+                if key in requests or (
+                    self.sentence_cache is not None
+                    and self.sentence_cache.get(key) is not None
+                ):
+                    continue
+
+                requests[key] = (self.get_prompt(sent), self.get_instructions())
+
+        return list(requests.values())
+
+    def get_sentence_key(self, sent: str) -> str:
+        """
+        Returns the sentence cache key of a sentence.
+
+        Args:
+            sent (str): The sentence.
+
+        Returns:
+            str: A hash of the sentence and the extraction config.
+        """
+        return make_key(sent.strip(), self.get_config())
+
+    def get_config(self) -> dict:
+        """
+        Returns the extraction settings the atomic facts depend on.
+
+        Returns:
+            dict: The model name, temperature, max tokens, demons hash and backend.
+        """
+        config = {
+            "model_name": configs.model_name,
+            "temp": configs.temp,
+            "max_tokens": configs.max_tokens,
+            "atomic_facts_demons": self.demons_hash,
+        }
+
+        if self.backend is not None:
+            # Outputs of another backend must not be mistaken for the model's
+            config["backend"] = get_backend_name(self.backend)
+
+        return config
+
+    def get_cache_stats(self) -> dict:
+        """
+        Returns the counters of the sentence cache. Every hit is an LLM call avoided.
+
+        Returns:
+            dict: The number of hits, misses and the hit rate.
+        """
+        if self.sentence_cache is None:
+            return {"hits": 0, "misses": 0, "hit_rate": 0.0}
+
+        return self.sentence_cache.stats()
+
+    def extract_sentences(self, sentences: list) -> list:
+        """
+        Extracts the atomic facts of sentences with the LLM.
+        Sends one request per sentence, or packed requests when pack_token_budget is set.
+
+        Args:
+            sentences (list): The sentences to extract atomic facts from.
+
+        Returns:
+            list: A list of atomic facts for each sentence.
+        """
+        if not self.pack_token_budget:
+            return list(ordered_map(self.get_sentence_af, sentences, self.max_workers))
+
+        packs = self.get_packs(sentences)
+        atoms = ordered_map(self.get_pack_af, packs, self.max_workers)
+
+        return [atom for pack_atoms in atoms for atom in pack_atoms]
+
+    async def aextract_sentences(self, sentences: list) -> list:
+        """
+        Async version of extract_sentences.
+
+        Args:
+            sentences (list): The sentences to extract atomic facts from.
+
+        Returns:
+            list: A list of atomic facts for each sentence.
+        """
+        if not self.pack_token_budget:
+            return list(
+                await asyncio.gather(*[self.aget_sentence_af(s) for s in sentences])
+            )
+
+        atoms = await asyncio.gather(
+            *[self.aget_pack_af(pack) for pack in self.get_packs(sentences)]
+        )
+
+        return [atom for pack_atoms in atoms for atom in pack_atoms]
+
+    def get_packs(self, sentences: list) -> list:
+        """
+        Splits sentences into packs whose prompts fit in pack_token_budget.
+
+        Args:
+            sentences (list): The sentences to pack.
+
+        Returns:
+            list: A list of lists of sentences (in order).
+        """
+        budget = self.pack_token_budget - estimate_tokens(
+            self.get_pack_instructions() + self.get_pack_prompt([])
+        )
+
+        # Each sentence also costs its number and a newline
+        return pack_by_budget(sentences, budget, lambda s: estimate_tokens(s) + 2)
+
+    def get_pack_af(self, sentences: list) -> list:
+        """
+        Gets atomic facts for a pack of sentences with a single request.
+        Sentences whose facts cannot be parsed from the output are sent on their own.
+
+        Args:
+            sentences (list): The sentences of the pack.
+
+        Returns:
+            list: A list of atomic facts for each sentence.
+        """
+        if len(sentences) == 1:
+            return [self.get_sentence_af(sentences[0])]
+
+        output = self.generate(
+            self.get_pack_prompt(sentences), system=self.get_pack_instructions()
+        )
+        with self.metrics.time("extraction_parsing"):
+            atoms = self.pack_output_to_sentences(output, len(sentences))
+
+        return [
+            atom if atom is not None else self.get_sentence_af(sent)
+            for sent, atom in zip(sentences, atoms)
+        ]
+
+    async def aget_pack_af(self, sentences: list) -> list:
+        """
+        Async version of get_pack_af.
+        """
+        if len(sentences) == 1:
+            return [await self.aget_sentence_af(sentences[0])]
+
+        output = await self.agenerate(
+            self.get_pack_prompt(sentences), system=self.get_pack_instructions()
+        )
+        with self.metrics.time("extraction_parsing"):
+            atoms = self.pack_output_to_sentences(output, len(sentences))
+
+        async def fallback(sent, atom):
+            if atom is not None:
+                return atom
+
+            return await self.aget_sentence_af(sent)
+
+        return list(
+            await asyncio.gather(
+                *[fallback(sent, atom) for sent, atom in zip(sentences, atoms)]
+            )
+        )
+
+    def get_pack_prompt(self, sentences: list) -> str:
+        """
+        Prepares the prompt that extracts the atomic facts of several sentences at once.
+        The facts are requested (by get_pack_instructions) as one JSON object per line
+        so they can be split back per sentence.
+
+        Args:
+            sentences (list): The sentences of the pack.
+
+        Returns:
+            str: The user message to send to GPT after the pack instructions.
+        """
+        prompt = "Sentences:\n"
+
+        for i, sent in enumerate(sentences, 1):
+            prompt += f"{i}. {sent}\n"
+
+        prompt += "Independent Facts:\n"
+
+        return prompt
+
+    def pack_output_to_sentences(self, text: str, num_sentences: int) -> list:
+        """
+        Parses the JSON lines output of a packed prompt.
+
+        Args:
+            text (str): The output from GPT.
+            num_sentences (int): Number of sentences in the pack.
+
+        Returns:
+            list: A list of cleaned facts for each sentence, or None if they could not be parsed.
+        """
+        atoms = [None] * num_sentences
+
+        for line in text.splitlines():
+            line = line.strip()
+
+            if not line.startswith("{"):
+                continue
+
+            try:
+                entry = json.loads(line)
+                number = int(entry["sentence"])
+                facts = entry["facts"]
+            except (ValueError, TypeError, KeyError):
+                continue
+
+            if not 1 <= number <= num_sentences or not isinstance(facts, list):
+                continue
+
+            facts = [str(fact).strip() for fact in facts if str(fact).strip()]
+            atoms[number - 1] = [
+                fact + "." if fact[-1] != "." else fact for fact in facts
+            ]
+
+        return atoms
+
     def get_sentence_af(self, sent: str) -> list:
         """
         Gets atomic facts for a sentence using OpenAI APIs.
@@ -88,16 +766,44 @@ class AtomicFactGenerator:
         Returns:
             list: A list of atomic facts extracted from the sentence.
         """
-        atoms = None
-        instructions = self.get_instructions()
+        prompt = self.get_prompt(sent)
 
-        prompt = instructions + f"Sentence:\n{sent}\nIndependent Facts:"
+        output = self.generate(prompt, system=self.get_instructions())
+        with self.metrics.time("extraction_parsing"):
+            atoms = self.gpt_output_to_sentences(output)
 
-        output = self.openai_agent.generate(prompt)
-        atoms = self.gpt_output_to_sentences(output)
+        return atoms
+
+    async def aget_sentence_af(self, sent: str) -> list:
+        """
+        Async version of get_sentence_af.
+
+        Args:
+            sent (str): The sentence to extract atomic facts from.
+
+        Returns:
+            list: A list of atomic facts extracted from the sentence.
+        """
+        prompt = self.get_prompt(sent)
+
+        output = await self.agenerate(prompt, system=self.get_instructions())
+        with self.metrics.time("extraction_parsing"):
+            atoms = self.gpt_output_to_sentences(output)
 
         return atoms
 
+    def get_prompt(self, sent: str) -> str:
+        """
+        Prepares the prompt that extracts the atomic facts of a sentence.
+
+        Args:
+            sent (str): The sentence to extract atomic facts from.
+
+        Returns:
+            str: The user message to send to GPT after the instructions.
+        """
+        return f"Sentence:\n{sent}\nIndependent Facts:"
+
     def gpt_output_to_sentences(self, text: str) -> list:
         """
         Clears the output from GPT and returns a list of cleaned sentences.
@@ -147,7 +853,7 @@ class AtomicFactGenerator:
         containing only one word or starting with a lowercase letter to ensure proper formatting.
         """
         for initial in initials:
-            if not np.any([initial in sent for sent in sentences]):
+            if not any(initial in sent for sent in sentences):
                 alpha1, alpha2 = [
                     t.strip() for t in initial.split(".") if len(t.strip()) > 0
                 ]
@@ -0,0 +1,342 @@
+import asyncio
+import contextlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Protocol, runtime_checkable
+from .cache import make_key
+from .concurrency import ordered_map
+from .retry import RetryPolicy
+from . import configs
+
+
+@runtime_checkable
+class LLMBackend(Protocol):
+    """
+    The interface AtomicFactGenerator, FactScorer and FactScore need from an LLM.
+    Without a backend they use OpenAIAgent and AsyncOpenAIAgent.
+    """
+
+    def generate(self, prompt: str, system: str = None) -> str:
+        """
+        Answers a prompt.
+
+        Args:
+            prompt (str): The user message.
+            system (str): The static prefix of the prompt, sent as the system message.
+
+        Returns:
+            str: The output of the model.
+        """
+
+    async def agenerate(self, prompt: str, system: str = None) -> str:
+        """
+        Async version of generate.
+        """
+
+    def generate_batch(self, requests: list) -> list:
+        """
+        Answers several prompts.
+
+        Args:
+            requests (list): The (prompt, system message) pairs.
+
+        Returns:
+            list: The output of each request, in order.
+        """
+
+    async def agenerate_batch(self, requests: list) -> list:
+        """
+        Async version of generate_batch.
+        """
+
+
+def get_backend_name(backend) -> str:
+    """
+    Returns the name identifying the outputs of a backend in cache and state keys.
+
+    Args:
+        backend (LLMBackend): The backend.
+
+    Returns:
+        str: Its name attribute, or its class name.
+    """
+    return getattr(backend, "name", None) or type(backend).__name__
+
+
+class AsyncBackendAgent:
+    """
+    Exposes the async methods of a backend the way AsyncOpenAIAgent does (an awaitable generate),
+    so the components call injected backends and the OpenAI agents the same way.
+    """
+
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+
+    async def generate(self, prompt: str, system: str = None) -> str:
+        return await self.backend.agenerate(prompt, system)
+
+    async def generate_batch(self, requests: list) -> list:
+        return await self.backend.agenerate_batch(requests)
+
+    async def stream(self, prompt: str, system: str = None):
+        # Backends without an astream method answer in a single chunk
+        if not hasattr(self.backend, "astream"):
+            yield await self.backend.agenerate(prompt, system)
+            return
+
+        async with contextlib.aclosing(self.backend.astream(prompt, system)) as chunks:
+            async for chunk in chunks:
+                yield chunk
+
+
+class FakeBackendError(Exception):
+    """
+    The error FakeBackend raises for the requests it is configured to fail.
+    """
+
+
+# Prompts of the extraction and verification stages (see AtomicFactGenerator.get_prompt,
+# get_pack_prompt and FactScorer.get_prompt, get_batch_prompt)
+SENTENCE_PATTERN = re.compile(r"^Sentence:\n(.*)\nIndependent Facts:", re.DOTALL)
+NUMBERED_LINE_PATTERN = re.compile(r"^(\d+)\. (.*)$", re.MULTILINE)
+
+
+class FakeBackend:
+    """
+    A deterministic in-process backend answering the prompts of the pipeline without any network,
+    to measure its throughput offline or load-test it.
+    Every attempt of a request waits a latency drawn from a log-normal distribution
+    (median latency, spread latency_sigma; 0 gives a constant latency) and fails with
+    probability error_rate. Draws are seeded by the request and its attempt number,
+    so a run is reproducible whatever the concurrency, and retries of a failed request can succeed.
+    Extraction prompts get facts_per_sentence facts per sentence and each fact is
+    supported with probability support_rate; respond replaces these canned answers.
+    With a retry_policy (e.g. RetryPolicy(errors=(FakeBackendError,))) failed attempts are retried.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latency_sigma: float = 0.0,
+        error_rate: float = 0.0,
+        error: type = FakeBackendError,
+        support_rate: float = 0.8,
+        facts_per_sentence: int = 2,
+        respond=None,
+        retry_policy: RetryPolicy = None,
+        seed: int = 0,
+        max_concurrency: int = None,
+        max_workers: int = None,
+        name: str = "fake",
+    ):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error = error
+        self.support_rate = support_rate
+        self.facts_per_sentence = facts_per_sentence
+        self.respond = respond or self.default_respond
+        self.retry_policy = retry_policy
+        self.seed = seed
+        # Maximum number of async requests in flight, like AsyncOpenAIAgent
+        self.max_concurrency = max_concurrency or configs.max_concurrency
+        # Number of threads of generate_batch
+        self.max_workers = max_workers or configs.max_workers
+        self.name = name
+        self.attempts = {}
+        self.calls = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.semaphore = None
+        self.semaphore_loop = None
+
+    def get_semaphore(self) -> asyncio.Semaphore:
+        """
+        Returns the semaphore bounding the requests in flight (one per event loop).
+
+        Returns:
+            asyncio.Semaphore: The semaphore of the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        if self.semaphore is None or self.semaphore_loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.semaphore_loop = loop
+
+        return self.semaphore
+
+    def draw(self, prompt: str, system: str = None) -> tuple:
+        """
+        Draws the latency and the outcome of the next attempt of a request.
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Returns:
+            tuple: The latency in seconds and whether the attempt fails.
+        """
+        key = make_key(system, prompt)
+
+        with self.lock:
+            attempt = self.attempts.get(key, 0)
+            self.attempts[key] = attempt + 1
+            self.calls += 1
+
+        rng = random.Random(make_key(self.seed, key, attempt))
+        latency = 0.0
+
+        if self.latency > 0:
+            latency = rng.lognormvariate(math.log(self.latency), self.latency_sigma)
+
+        fails = rng.random() < self.error_rate
+
+        with self.lock:
+            if fails:
+                self.errors += 1
+            else:
+                # Only the failed requests are retried, so a long run keeps no count per request
+                self.attempts.pop(key, None)
+
+        return latency, fails
+
+    def answer(self, prompt: str, system: str, fails: bool) -> str:
+        if fails:
+            raise self.error("Fake backend error.")
+
+        return self.respond(prompt, system)
+
+    def generate(self, prompt: str, system: str = None) -> str:
+        if self.retry_policy is None:
+            return self.request(prompt, system)
+
+        return self.retry_policy.call(self.request, prompt, system)
+
+    async def agenerate(self, prompt: str, system: str = None) -> str:
+        if self.retry_policy is None:
+            return await self.arequest(prompt, system)
+
+        return await self.retry_policy.acall(self.arequest, prompt, system)
+
+    def request(self, prompt: str, system: str = None) -> str:
+        latency, fails = self.draw(prompt, system)
+
+        if latency > 0:
+            time.sleep(latency)
+
+        return self.answer(prompt, system, fails)
+
+    async def arequest(self, prompt: str, system: str = None) -> str:
+        async with self.get_semaphore():
+            latency, fails = self.draw(prompt, system)
+
+            if latency > 0:
+                await asyncio.sleep(latency)
+
+        return self.answer(prompt, system, fails)
+
+    async def astream(self, prompt: str, system: str = None):
+        """
+        Streams the answer of a prompt line by line, spreading the latency of the request
+        over the lines. Only the start of the request is retried (like AsyncOpenAIAgent.stream).
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Yields:
+            str: The lines of the answer.
+        """
+        if self.retry_policy is None:
+            latency, output = self.open_stream(prompt, system)
+        else:
+            latency, output = await self.retry_policy.acall(
+                self.aopen_stream, prompt, system
+            )
+
+        lines = output.splitlines(keepends=True) or [output]
+
+        async with self.get_semaphore():
+            for line in lines:
+                if latency > 0:
+                    await asyncio.sleep(latency / len(lines))
+
+                yield line
+
+    def open_stream(self, prompt: str, system: str = None) -> tuple:
+        latency, fails = self.draw(prompt, system)
+        return latency, self.answer(prompt, system, fails)
+
+    async def aopen_stream(self, prompt: str, system: str = None) -> tuple:
+        return self.open_stream(prompt, system)
+
+    def generate_batch(self, requests: list) -> list:
+        return list(
+            ordered_map(
+                lambda request: self.generate(*request), requests, self.max_workers
+            )
+        )
+
+    async def agenerate_batch(self, requests: list) -> list:
+        return list(
+            await asyncio.gather(*(self.agenerate(*request) for request in requests))
+        )
+
+    def is_supported(self, fact: str) -> bool:
+        return (
+            int(make_key(self.seed, fact.strip()), 16) % 1000 < self.support_rate * 1000
+        )
+
+    def get_facts(self, sentence: str) -> list:
+        sentence = sentence.strip().rstrip(".")
+
+        return [f"{sentence} ({i})." for i in range(1, self.facts_per_sentence + 1)]
+
+    def default_respond(self, prompt: str, system: str = None) -> str:
+        """
+        Answers the prompts of the pipeline in the format the components parse.
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Returns:
+            str: The canned output.
+        """
+        match = SENTENCE_PATTERN.match(prompt)
+
+        if match:
+            return "\n".join(f"- {fact}" for fact in self.get_facts(match.group(1)))
+
+        if prompt.startswith("Sentences:\n"):
+            return "\n".join(
+                json.dumps({"sentence": int(number), "facts": self.get_facts(sentence)})
+                for number, sentence in NUMBERED_LINE_PATTERN.findall(prompt)
+            )
+
+        if "\nStatements:\n" in prompt:
+            statements = prompt.split("\nStatements:\n", 1)[1]
+            return "\n".join(
+                f"{number}. {self.is_supported(fact)}"
+                for number, fact in NUMBERED_LINE_PATTERN.findall(statements)
+            )
+
+        if "\nStatement:\n" in prompt:
+            fact = prompt.split("\nStatement:\n", 1)[1].split(" True or False?")[0]
+            return str(self.is_supported(fact))
+
+        return ""
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the backend.
+
+        Returns:
+            dict: The number of calls (attempts) and of failed calls.
+        """
+        with self.lock:
+            return {"calls": self.calls, "errors": self.errors}
@@ -0,0 +1,334 @@
+import contextlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from . import configs
+from .cache import DiskCache
+from .openai_agent import get_client, get_messages
+
+# Statuses after which a batch does not change anymore
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchRunner:
+    """
+    Sends the requests of a stage through the OpenAI Batch API instead of one call per request.
+    The requests are written as JSONL files, submitted as batches and polled until they are done;
+    the responses are then stored in the response cache of the agent, so the normal
+    extraction and verification code reads them instead of calling the API
+    (under attach for agents without a cache of their own).
+    The submitted batches of each phase are recorded in work_dir, so an interrupted run
+    resumes polling them instead of submitting the requests again.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        work_dir=None,
+        poll_interval: float = None,
+        max_requests: int = None,
+        price_factor: float = None,
+    ):
+        self.client = client if client is not None else get_client()
+        self.work_dir = Path(work_dir or configs.batch_dir)
+        self.poll_interval = (
+            poll_interval if poll_interval is not None else configs.batch_poll_interval
+        )
+        self.max_requests = max_requests or configs.batch_max_requests
+        self.price_factor = (
+            price_factor if price_factor is not None else configs.batch_price_factor
+        )
+        self.cache = None
+
+    def get_cache(self) -> DiskCache:
+        """
+        Returns the response cache used for agents without one (created on first use).
+
+        Returns:
+            DiskCache: The cache stored in work_dir.
+        """
+        if self.cache is None:
+            self.work_dir.mkdir(parents=True, exist_ok=True)
+            self.cache = DiskCache(self.work_dir / "responses.sqlite")
+
+        return self.cache
+
+    @contextlib.contextmanager
+    def attach(self, agent):
+        """
+        Gives an agent without a response cache the cache of the runner,
+        and restores the agent's own cache on exit.
+
+        Args:
+            agent (OpenAIAgent): The agent reading the responses.
+
+        Yields:
+            DiskCache: The cache receiving the responses.
+        """
+        cache = agent.cache
+
+        if cache is None:
+            agent.cache = self.get_cache()
+
+        try:
+            yield agent.cache
+        finally:
+            agent.cache = cache
+
+    def run(self, phase: str, requests: list, agent) -> int:
+        """
+        Gets the responses of the requests of a phase through the Batch API into the agent's cache.
+        Batches of the phase left unfinished by a previous run are polled and ingested first,
+        then the requests still missing from the cache are submitted.
+        Requests that fail in the batch are left out of the cache, so they are sent normally later.
+        An agent without a cache only reads the responses under attach.
+
+        Args:
+            phase (str): The name of the phase (e.g. "extraction"), naming its files.
+            requests (list): The (prompt, system message) pairs of the phase.
+            agent (OpenAIAgent): The agent that will read the responses (its settings build the requests).
+
+        Returns:
+            int: The number of responses ingested.
+        """
+        with self.attach(agent):
+            return self.send(phase, requests, agent)
+
+    def send(self, phase: str, requests: list, agent) -> int:
+        """
+        Runs a phase with the agent's cache set (see run).
+        """
+        state = self.load_state(phase)
+        ingested = self.finish(phase, state, agent)
+
+        pending = {}
+
+        for prompt, system in requests:
+            key = agent.get_cache_key(prompt, system)
+
+            if key not in pending and agent.cache.get(key) is None:
+                pending[key] = (prompt, system)
+
+        if not pending:
+            return ingested
+
+        # Nothing is submitted once the budget of the run is spent
+        agent.check_budget()
+        items = list(pending.items())
+
+        for start in range(0, len(items), self.max_requests):
+            batch = self.submit(
+                phase,
+                len(state["batches"]),
+                items[start : start + self.max_requests],
+                agent,
+            )
+            state["batches"].append({"id": batch.id, "ingested": False})
+            self.save_state(phase, state)
+
+        ingested += self.finish(phase, state, agent)
+        missing = sum(agent.cache.get(key) is None for key in pending)
+
+        if missing:
+            logging.warning(
+                f"{missing} {phase} requests failed in the batches and will be sent one by one."
+            )
+
+        return ingested
+
+    def get_state_path(self, phase: str) -> Path:
+        return self.work_dir / f"{phase}.json"
+
+    def load_state(self, phase: str) -> dict:
+        """
+        Loads the batches submitted for a phase.
+
+        Args:
+            phase (str): The name of the phase.
+
+        Returns:
+            dict: The state, with the batch ids and whether they were ingested.
+        """
+        path = self.get_state_path(phase)
+
+        if not path.exists():
+            return {"batches": []}
+
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_state(self, phase: str, state: dict):
+        """
+        Saves the batches submitted for a phase (atomically, so a crash never loses a batch id).
+
+        Args:
+            phase (str): The name of the phase.
+            state (dict): The state to save.
+        """
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        path = self.get_state_path(phase)
+        tmp_path = path.with_suffix(".json.tmp")
+
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+
+    def get_request_line(self, key: str, prompt: str, system: str, agent) -> dict:
+        """
+        Builds the Batch API line of a request, with the same settings as the agent's calls.
+
+        Args:
+            key (str): The cache key of the request, used as its custom id.
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+            agent (OpenAIAgent): The agent whose settings are used.
+
+        Returns:
+            dict: The request line.
+        """
+        return {
+            "custom_id": key,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": agent.model_name,
+                "messages": get_messages(prompt, system),
+                "max_tokens": agent.max_tokens,
+                "temperature": agent.temp,
+            },
+        }
+
+    def submit(self, phase: str, index: int, items: list, agent):
+        """
+        Writes the requests to a JSONL file, uploads it and creates the batch.
+
+        Args:
+            phase (str): The name of the phase.
+            index (int): The number of the batch in the phase.
+            items (list): The (cache key, (prompt, system message)) pairs of the batch.
+            agent (OpenAIAgent): The agent whose settings are used.
+
+        Returns:
+            The created batch.
+        """
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        path = self.work_dir / f"{phase}-{index}.jsonl"
+
+        with open(path, "w", encoding="utf-8") as f:
+            for key, (prompt, system) in items:
+                line = self.get_request_line(key, prompt, system, agent)
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        print(f"Submitted {phase} batch {batch.id} with {len(items)} requests.")
+
+        return batch
+
+    def finish(self, phase: str, state: dict, agent) -> int:
+        """
+        Waits for the batches of a phase that were not ingested yet and ingests their responses.
+
+        Args:
+            phase (str): The name of the phase.
+            state (dict): The state of the phase (updated and saved as batches are ingested).
+            agent (OpenAIAgent): The agent whose cache receives the responses.
+
+        Returns:
+            int: The number of responses ingested.
+        """
+        ingested = 0
+
+        for entry in state["batches"]:
+            if entry["ingested"]:
+                continue
+
+            batch = self.wait(entry["id"])
+            ingested += self.ingest(batch, agent)
+            entry["ingested"] = True
+            self.save_state(phase, state)
+
+        return ingested
+
+    def wait(self, batch_id: str):
+        """
+        Polls a batch until it reaches a terminal status.
+
+        Args:
+            batch_id (str): The id of the batch.
+
+        Returns:
+            The finished batch.
+        """
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+
+            if batch.status in TERMINAL_STATUSES:
+                if batch.status != "completed":
+                    logging.warning(
+                        f"Batch {batch_id} ended with status {batch.status}."
+                    )
+
+                return batch
+
+            time.sleep(self.poll_interval)
+
+    def ingest(self, batch, agent) -> int:
+        """
+        Stores the successful responses of a finished batch in the agent's cache
+        and records their usage (at the batch price).
+
+        Args:
+            batch: The finished batch.
+            agent (OpenAIAgent): The agent whose cache receives the responses.
+
+        Returns:
+            int: The number of responses ingested.
+        """
+        # Expired and cancelled batches may still have the output of their finished requests
+        if not getattr(batch, "output_file_id", None):
+            return 0
+
+        ingested = 0
+        output = self.client.files.content(batch.output_file_id).text
+
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+
+            result = json.loads(line)
+            response = result.get("response") or {}
+
+            if response.get("status_code") != 200:
+                continue
+
+            body = response["body"]
+            content = body["choices"][0]["message"]["content"]
+
+            if content is None:
+                continue
+
+            agent.cache.set(result["custom_id"], content)
+            ingested += 1
+
+            if agent.usage is not None and body.get("usage"):
+                agent.usage.record(
+                    agent.stage,
+                    agent.model_name,
+                    int(body["usage"].get("prompt_tokens") or 0),
+                    int(body["usage"].get("completion_tokens") or 0),
+                    self.price_factor,
+                )
+
+        return ingested
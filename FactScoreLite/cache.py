@@ -0,0 +1,364 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from . import configs
+
+
+def make_key(*parts) -> str:
+    """
+    Builds a content-addressed cache key from JSON serializable parts.
+
+    Args:
+        *parts: The values identifying the cached entry (e.g. model name and prompt).
+
+    Returns:
+        str: The SHA-256 hex digest of the parts.
+    """
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    A persistent key-value cache stored in SQLite.
+    Values are JSON serialized. Entries older than max_age seconds are dropped and,
+    once there are more than max_entries entries, the oldest ones are evicted.
+    Every thread gets its own connection and SQLite's locking (WAL mode) makes
+    the same file safe to share between processes.
+    """
+
+    def __init__(self, path, max_entries: int = None, max_age: float = None):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.writes_since_eviction = 0
+
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Returns the connection of the calling thread (created on first use).
+
+        Returns:
+            sqlite3.Connection: The SQLite connection.
+        """
+        conn = getattr(self.local, "conn", None)
+
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+
+        return conn
+
+    def get(self, key: str):
+        """
+        Looks up a key.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            The cached value, or None if the key is missing or expired.
+        """
+        row = (
+            self.connect()
+            .execute("SELECT value, created FROM cache WHERE key = ?", (key,))
+            .fetchone()
+        )
+
+        if row is not None and self.max_age and time.time() - row[1] > self.max_age:
+            row = None
+
+        with self.lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, value):
+        """
+        Stores a value and evicts expired/extra entries from time to time.
+
+        Args:
+            key (str): The key to store the value under.
+            value: A JSON serializable value.
+        """
+        conn = self.connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+
+        with self.lock:
+            self.writes_since_eviction += 1
+            evict = self.writes_since_eviction >= configs.cache_eviction_interval
+
+            if evict:
+                self.writes_since_eviction = 0
+
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops the entries older than max_age and the oldest entries beyond max_entries.
+        """
+        conn = self.connect()
+        with conn:
+            if self.max_age:
+                conn.execute(
+                    "DELETE FROM cache WHERE created < ?", (time.time() - self.max_age,)
+                )
+
+            if self.max_entries:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    "SELECT key FROM cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        conn = self.connect()
+        with conn:
+            conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        return self.connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters of this process.
+
+        Returns:
+            dict: The number of hits, misses and the hit rate.
+        """
+        with self.lock:
+            hits, misses = self.hits, self.misses
+
+        total = hits + misses
+
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+class MemoCache:
+    """
+    An in-memory LRU cache holding at most max_size entries,
+    optionally backed by a DiskCache so that entries are shared across runs.
+    """
+
+    def __init__(self, max_size: int = None, disk: DiskCache = None):
+        self.max_size = max_size
+        self.disk = disk
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str):
+        """
+        Looks up a key in memory, then on disk.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            The cached value, or None if the key is missing.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        value = self.disk.get(key) if self.disk is not None else None
+
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.remember(key, value)
+
+        return value
+
+    def set(self, key: str, value):
+        """
+        Stores a value in memory (and on disk).
+
+        Args:
+            key (str): The key to store the value under.
+            value: A JSON serializable value.
+        """
+        with self.lock:
+            self.remember(key, value)
+
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def resize(self, max_size: int):
+        """
+        Changes the number of entries kept in memory, dropping the least recently used ones.
+
+        Args:
+            max_size (int): The new number of entries kept in memory.
+        """
+        with self.lock:
+            self.max_size = max_size
+
+            while self.max_size and len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def remember(self, key: str, value):
+        """
+        Stores a value in memory and drops the least recently used entries (lock must be held).
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        while self.max_size and len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters.
+
+        Returns:
+            dict: The number of hits, misses and the hit rate.
+        """
+        with self.lock:
+            hits, misses = self.hits, self.misses
+
+        total = hits + misses
+
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+# Caches shared by every agent of the process, by path
+caches = {}
+caches_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    Returns the response cache configured in configs, shared by the whole process.
+
+    Returns:
+        DiskCache: The response cache, or None if configs.cache_path is not set.
+    """
+    if not configs.cache_path:
+        return None
+
+    path = str(configs.cache_path)
+
+    with caches_lock:
+        if path not in caches:
+            caches[path] = DiskCache(
+                path,
+                max_entries=configs.cache_max_entries,
+                max_age=configs.cache_max_age,
+            )
+
+        return caches[path]
+
+
+# Memo caches shared by the whole process, by (name, path)
+memo_caches = {}
+
+
+def get_memo_cache(name: str, max_size: int, path=None):
+    """
+    Returns a memo cache shared by the whole process.
+    The cache of a (name, path) is shared whatever its size, so it is resized to the latest max_size.
+    Its SQLite file keeps every entry unless configs.memo_cache_max_entries or
+    configs.memo_cache_max_age is set.
+
+    Args:
+        name (str): The name of the cache (e.g. "decisions").
+        max_size (int): Number of entries kept in memory (0 disables the cache).
+        path (str): The SQLite file backing the cache, if any.
+
+    Returns:
+        MemoCache: The memo cache, or None if max_size is 0.
+    """
+    if not max_size:
+        return None
+
+    path = str(path) if path else None
+
+    with caches_lock:
+        if (name, path) not in memo_caches:
+            memo_caches[(name, path)] = MemoCache(
+                max_size,
+                disk=(
+                    DiskCache(
+                        path,
+                        max_entries=configs.memo_cache_max_entries,
+                        max_age=configs.memo_cache_max_age,
+                    )
+                    if path
+                    else None
+                ),
+            )
+
+        cache = memo_caches[(name, path)]
+
+    if cache.max_size != max_size:
+        cache.resize(max_size)
+
+    return cache
+
+
+def get_decision_cache():
+    """
+    Returns the decision cache configured in configs, shared by every FactScorer of the process.
+
+    Returns:
+        MemoCache: The decision cache, or None if configs.decision_cache_size is 0.
+    """
+    return get_memo_cache(
+        "decisions", configs.decision_cache_size, configs.decision_cache_path
+    )
+
+
+def get_sentence_cache():
+    """
+    Returns the sentence cache configured in configs, shared by every AtomicFactGenerator of the process.
+
+    Returns:
+        MemoCache: The sentence cache, or None if configs.sentence_cache_size is 0.
+    """
+    return get_memo_cache(
+        "sentences", configs.sentence_cache_size, configs.sentence_cache_path
+    )
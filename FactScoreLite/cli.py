@@ -0,0 +1,483 @@
+"""
+Scores the (generation, knowledge source) records of a JSONL file and writes one JSON line per record.
+
+    factscorelite input.jsonl -o results.jsonl
+    cat input.jsonl | factscorelite --max-cost 20 --state-backend sqlite > results.jsonl
+    factscorelite input.jsonl -o results-2.jsonl --shard 2 --num-shards 8
+    factscorelite merge --num-shards 8
+
+Each input line is a JSON object with a generation and a knowledge source (and an optional id).
+The records are read, scored and written as a stream, so memory use does not grow with the input,
+and the facts and decisions are saved as they finish, so an interrupted run resumes where it stopped.
+A sharded run only scores the records of its shard, so the shards of an input can run on
+different machines, and `merge` combines the decisions they saved into corpus scores.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+from .sharding import get_shard, get_shard_path, get_shard_paths, merge_shards
+from .state_handler import get_state_path
+from . import configs
+
+# Exit status of a run stopped by its budget (the results so far are written and saved)
+BUDGET_EXCEEDED_STATUS = 2
+
+
+def read_records(
+    lines,
+    generation_field: str,
+    knowledge_source_field: str,
+    id_field: str,
+    positions: dict,
+    shard: int = None,
+    num_shards: int = None,
+):
+    """
+    Parses the input lines lazily.
+
+    Args:
+        lines (iterable): The JSONL lines.
+        generation_field (str): The field holding the generation.
+        knowledge_source_field (str): The field holding the knowledge source.
+        id_field (str): The field holding the id of the record, copied to its result.
+        positions (dict): Receives the position ("index") and id of each yielded record
+            by the order it is yielded in, until its result is written.
+        shard (int): Only yields the records of this shard (see FactScoreLite.sharding).
+        num_shards (int): The number of shards.
+
+    Yields:
+        tuple: The (generation, knowledge source) pair of each record.
+
+    Raises:
+        ValueError: For a line that is not a JSON object with both fields.
+    """
+    index = 0
+    yielded = 0
+
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+            pair = (record[generation_field], record[knowledge_source_field])
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            raise ValueError(f"Invalid record on line {number}: {e!r}") from e
+
+        index += 1
+
+        if num_shards and get_shard(*pair, num_shards) != shard:
+            continue
+
+        position = {"index": index - 1}
+
+        if id_field in record:
+            position["id"] = record[id_field]
+
+        positions[yielded] = position
+        yielded += 1
+        yield pair
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="factscorelite",
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "input", nargs="?", default="-", help="JSONL file of records (- reads stdin)"
+    )
+    parser.add_argument(
+        "-o", "--output", default="-", help="JSONL file of results (- writes stdout)"
+    )
+    parser.add_argument("--generation-field", default="generation")
+    parser.add_argument("--knowledge-source-field", default="knowledge_source")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--gamma", type=int, default=10, help="length penalty")
+    parser.add_argument("--model", default=configs.model_name)
+
+    group = parser.add_argument_group("concurrency")
+    group.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="run the pipeline on asyncio instead of threads",
+    )
+    group.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=configs.max_concurrency,
+        help="requests in flight per stage (async)",
+    )
+    group.add_argument(
+        "--max-workers",
+        type=int,
+        default=configs.max_workers,
+        help="threads sending the sentences/facts of a generation (sync)",
+    )
+    group.add_argument("--split-workers", type=int, default=configs.split_workers)
+    group.add_argument(
+        "--extraction-workers", type=int, default=configs.extraction_workers
+    )
+    group.add_argument(
+        "--verification-workers", type=int, default=configs.verification_workers
+    )
+    group.add_argument(
+        "--queue-size",
+        type=int,
+        default=configs.pipeline_queue_size,
+        help="generations waiting in front of each stage",
+    )
+    group.add_argument(
+        "--batch-size",
+        type=int,
+        default=configs.verification_batch_size,
+        help="facts verified per prompt",
+    )
+    group.add_argument(
+        "--stream-extraction",
+        action="store_true",
+        help="verify facts while they are streamed (with --async)",
+    )
+
+    group = parser.add_argument_group("caches")
+    group.add_argument("--cache-path", help="SQLite response cache")
+    group.add_argument("--sentence-cache-path", help="SQLite sentence cache")
+    group.add_argument("--decision-cache-path", help="SQLite decision cache")
+    group.add_argument(
+        "--sentence-cache-size",
+        type=int,
+        default=configs.sentence_cache_size,
+        help="sentences kept in memory",
+    )
+    group.add_argument(
+        "--decision-cache-size",
+        type=int,
+        default=configs.decision_cache_size,
+        help="decisions kept in memory",
+    )
+    group.add_argument(
+        "--recent-entries",
+        type=int,
+        default=configs.pipeline_recent_entries,
+        help="new facts/decisions entries kept in memory",
+    )
+
+    group = parser.add_argument_group("state")
+    group.add_argument(
+        "--state-backend",
+        choices=["jsonl", "json", "sqlite"],
+        default=configs.state_backend,
+    )
+    group.add_argument(
+        "--facts-path",
+        help=f"facts state file ({configs.facts_db_path}, or .sqlite with --state-backend sqlite)",
+    )
+    group.add_argument(
+        "--decisions-path",
+        help=f"decisions state file ({configs.decisions_db_path}, or .sqlite with --state-backend sqlite)",
+    )
+    group.add_argument(
+        "--num-shards",
+        type=int,
+        help="split the input into this many shards (by a hash of each record)",
+    )
+    group.add_argument(
+        "--shard",
+        type=int,
+        help="only score this shard, saved to its own state files (e.g. facts-00002-of-00008.jsonl)",
+    )
+
+    group = parser.add_argument_group("budget")
+    group.add_argument("--max-tokens", type=int, help="token budget of the run")
+    group.add_argument("--max-cost", type=float, help="cost budget of the run (USD)")
+
+    group = parser.add_argument_group("other")
+    group.add_argument(
+        "--metrics-path", help="metrics dump (.json or Prometheus text format)"
+    )
+    group.add_argument(
+        "--fake-backend",
+        action="store_true",
+        help="answer with FakeBackend instead of OpenAI (dry runs)",
+    )
+
+    return parser
+
+
+def apply_configs(args: argparse.Namespace):
+    """
+    Sets the configs read by the components from the command-line options.
+    """
+    configs.model_name = args.model
+    configs.max_workers = args.max_workers
+    configs.split_workers = args.split_workers
+    configs.extraction_workers = args.extraction_workers
+    configs.verification_workers = args.verification_workers
+    configs.pipeline_queue_size = args.queue_size
+    configs.verification_batch_size = args.batch_size
+    configs.cache_path = args.cache_path
+    configs.sentence_cache_path = args.sentence_cache_path
+    configs.decision_cache_path = args.decision_cache_path
+    configs.sentence_cache_size = args.sentence_cache_size
+    configs.decision_cache_size = args.decision_cache_size
+    configs.pipeline_recent_entries = args.recent_entries
+    configs.state_backend = args.state_backend
+    configs.metrics_path = args.metrics_path
+
+
+def get_state_paths(args: argparse.Namespace) -> tuple:
+    """
+    Returns the facts and decisions state files of the run (of its shard if it is sharded),
+    with the file suffix of the state backend by default (see get_state_path).
+    """
+    facts_path = get_state_path(
+        args.facts_path or configs.facts_db_path, args.state_backend
+    )
+    decisions_path = get_decisions_path(args)
+
+    if not args.num_shards:
+        return facts_path, decisions_path
+
+    return (
+        get_shard_path(facts_path, args.shard, args.num_shards),
+        get_shard_path(decisions_path, args.shard, args.num_shards),
+    )
+
+
+def get_decisions_path(args: argparse.Namespace) -> str:
+    """
+    Returns the decisions state file of an unsharded run of the state backend.
+    """
+    return get_state_path(
+        args.decisions_path or configs.decisions_db_path, args.state_backend
+    )
+
+
+def write_results(fact_score, results, output, positions: dict) -> dict:
+    """
+    Writes one JSON line per result, with the position, id and usage of its record.
+
+    Args:
+        fact_score (FactScore): The scorer (its usage is popped per generation).
+        results (iterable): The results of iter_factscore.
+        output: The text file to write to.
+        positions (dict): The positions and ids of the records (popped as they are written).
+
+    Returns:
+        dict: The aggregate of the last result.
+    """
+    aggregate = {"count": 0, "score": None, "init_score": None}
+
+    for result in results:
+        aggregate = result["aggregate"]
+        record = {
+            **positions.pop(result["index"]),
+            "facts": result["facts"],
+            "decision": result["decision"],
+            "score": result["score"],
+            "init_score": result["init_score"],
+            "aggregate": aggregate,
+            "usage": fact_score.usage.pop_generation(
+                fact_score.get_facts_key(result["generation"])
+            ),
+        }
+
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+    return aggregate
+
+
+def iterate(results):
+    """
+    Iterates an async generator from sync code.
+    """
+    loop = asyncio.new_event_loop()
+
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(results.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
+
+
+def build_merge_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="factscorelite merge",
+        description="Combines the decisions saved by the shards of a run into corpus scores. "
+        "The files are only read. With the input of the run, every record is counted "
+        "like in the run, repeated pairs included.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="decisions state files of the shards (all the shards of --decisions-path by default)",
+    )
+    parser.add_argument(
+        "--decisions-path",
+        help=f"decisions state file of the run ({configs.decisions_db_path}, "
+        "or .sqlite with --state-backend sqlite)",
+    )
+    parser.add_argument("--num-shards", type=int)
+    parser.add_argument(
+        "--state-backend",
+        choices=["jsonl", "json", "sqlite"],
+        default=configs.state_backend,
+    )
+    parser.add_argument("--gamma", type=int, default=10, help="length penalty")
+    parser.add_argument(
+        "--input", help="JSONL file of the records of the run (- reads stdin)"
+    )
+    parser.add_argument("--generation-field", default="generation")
+    parser.add_argument("--knowledge-source-field", default="knowledge_source")
+    parser.add_argument(
+        "--config",
+        help="only merge the decisions of this settings hash (from the error listing them)",
+    )
+    return parser
+
+
+def merge(argv: list) -> int:
+    """
+    Prints the corpus scores of the shards of a run as JSON.
+    """
+    parser = build_merge_parser()
+    args = parser.parse_args(argv)
+
+    if not args.paths and not args.num_shards:
+        parser.error("either decisions state files or --num-shards is required")
+
+    paths = args.paths or get_shard_paths(get_decisions_path(args), args.num_shards)
+    generations = knowledge_sources = None
+
+    try:
+        if args.input is not None:
+            with contextlib.ExitStack() as stack:
+                lines = (
+                    sys.stdin
+                    if args.input == "-"
+                    else stack.enter_context(open(args.input, encoding="utf-8"))
+                )
+                records = list(
+                    read_records(
+                        lines,
+                        args.generation_field,
+                        args.knowledge_source_field,
+                        None,
+                        {},
+                    )
+                )
+
+            generations = [generation for generation, _ in records]
+            knowledge_sources = [knowledge_source for _, knowledge_source in records]
+
+        merged = merge_shards(
+            paths,
+            args.gamma,
+            args.state_backend,
+            args.config,
+            generations,
+            knowledge_sources,
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print(json.dumps(merged))
+    return 0
+
+
+def main(argv: list = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+
+    if argv[:1] == ["merge"]:
+        return merge(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if (args.shard is None) != (args.num_shards is None) or (
+        args.num_shards and not 0 <= args.shard < args.num_shards
+    ):
+        parser.error("--shard I and --num-shards K go together, with 0 <= I < K")
+
+    apply_configs(args)
+    facts_path, decisions_path = get_state_paths(args)
+
+    # Imported after the configs are set, since the components read them
+    from .factscore import FactScore
+    from .usage import BudgetExceeded
+    from .backends import FakeBackend
+
+    fact_score = FactScore(
+        gamma=args.gamma,
+        max_concurrency=args.max_concurrency,
+        max_workers=args.max_workers,
+        max_tokens=args.max_tokens,
+        max_cost=args.max_cost,
+        backend=FakeBackend() if args.fake_backend else None,
+        pipeline=True,
+        stream_extraction=args.stream_extraction,
+        facts_path=facts_path,
+        decisions_path=decisions_path,
+    )
+    positions = {}
+
+    with contextlib.ExitStack() as stack:
+        lines = (
+            sys.stdin
+            if args.input == "-"
+            else stack.enter_context(open(args.input, encoding="utf-8"))
+        )
+        output = (
+            sys.stdout
+            if args.output == "-"
+            else stack.enter_context(open(args.output, "w", encoding="utf-8"))
+        )
+        records = read_records(
+            lines,
+            args.generation_field,
+            args.knowledge_source_field,
+            args.id_field,
+            positions,
+            args.shard,
+            args.num_shards,
+        )
+        results = (
+            iterate(fact_score.aiter_factscore(records))
+            if args.use_async
+            else fact_score.iter_factscore(records)
+        )
+
+        try:
+            aggregate = write_results(fact_score, results, output, positions)
+        except BudgetExceeded as e:
+            print(f"{e} The results so far are saved.", file=sys.stderr)
+            return BUDGET_EXCEEDED_STATUS
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    usage = fact_score.usage.summary()
+    print(
+        f"Scored {aggregate['count']} generations: FactScore {aggregate['score']}, "
+        f"without length penalty {aggregate['init_score']} "
+        f"({usage['calls']} calls, ${usage['cost']:.4f}).",
+        file=sys.stderr,
+    )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,299 @@
+import asyncio
+import contextvars
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# End of the items of a stage queue
+DONE = object()
+
+
+def ordered_map(func, items, max_workers: int = 1):
+    """
+    Applies func to every item and yields the results in the order of items.
+    With more than one worker the calls run on a thread pool (in a copy of the caller's
+    context variables); at most 4 * max_workers
+    items are scheduled ahead of the consumer so memory stays bounded for long inputs,
+    while a call that is backing off at the head does not starve the other workers.
+
+    Args:
+        func (callable): The function to apply.
+        items (iterable): The items to apply func to.
+        max_workers (int): Number of worker threads (1 runs func in the calling thread).
+
+    Yields:
+        The result of func for each item, in order.
+    """
+    if max_workers is None or max_workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        pending = deque()
+
+        try:
+            for item in items:
+                pending.append(
+                    executor.submit(contextvars.copy_context().run, func, item)
+                )
+
+                if len(pending) >= 4 * max_workers:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+        finally:
+            # Do not run the scheduled calls if the consumer stopped or a call failed
+            for future in pending:
+                future.cancel()
+
+
+class StageError:
+    """
+    An error raised by a stage, passed to the consumer of a staged map.
+    """
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def staged_map(stages: list, items, queue_size: int = 1):
+    """
+    Passes every item through a pipeline of stages running on their own worker threads,
+    connected by bounded queues: an item enters a stage as soon as it left the previous one,
+    so the stages overlap, and a full queue blocks the stage before it (backpressure),
+    so at most queue_size items wait between two stages whatever the length of the input.
+    The calls run in copies of the caller's context variables.
+
+    Args:
+        stages (list): (func, workers) pairs; func maps the output of the previous stage
+            (or the item) to its own output, on `workers` threads.
+        items (iterable): The items, consumed lazily.
+        queue_size (int): Maximum number of items waiting in front of each stage.
+
+    Yields:
+        tuple: (index of the item, output of the last stage), in completion order.
+
+    Raises:
+        The first error raised by a stage or by the items. The other workers stop
+        after their current call.
+    """
+    queues = [queue.Queue(queue_size) for _ in range(len(stages) + 1)]
+    stop = threading.Event()
+    # Copied here, since the context of a worker thread is its own (empty) one
+    context = contextvars.copy_context()
+
+    def put(q, value):
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+        return DONE
+
+    def feed():
+        try:
+            for index, item in enumerate(items):
+                if not put(queues[0], (index, item)):
+                    return
+        except BaseException as error:
+            put(queues[-1], StageError(error))
+            return
+
+        put(queues[0], DONE)
+
+    def work(i, func, remaining):
+        while True:
+            value = get(queues[i])
+
+            if value is DONE:
+                # Let the other workers of the stage see the end too
+                put(queues[i], DONE)
+
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+
+                if last:
+                    put(queues[i + 1], DONE)
+
+                return
+
+            index, item = value
+
+            try:
+                output = context.copy().run(func, item)
+            except BaseException as error:
+                put(queues[-1], StageError(error))
+                return
+
+            if not put(queues[i + 1], (index, output)):
+                return
+
+    lock = threading.Lock()
+    threads = [threading.Thread(target=feed, daemon=True)]
+
+    for i, (func, workers) in enumerate(stages):
+        remaining = [max(workers, 1)]
+        threads.extend(
+            threading.Thread(target=work, args=(i, func, remaining), daemon=True)
+            for _ in range(remaining[0])
+        )
+
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            value = get(queues[-1])
+
+            if value is DONE:
+                return
+
+            if isinstance(value, StageError):
+                raise value.error
+
+            yield value
+
+    finally:
+        # Also stops the workers if the consumer stopped early
+        stop.set()
+
+        for thread in threads:
+            thread.join()
+
+
+async def astaged_map(stages: list, items, queue_size: int = 1):
+    """
+    Async version of staged_map: every stage runs on its own tasks.
+
+    Args:
+        stages (list): (async func, workers) pairs; func maps the output of the previous stage
+            (or the item) to its own output, on `workers` tasks.
+        items: The items, as an iterable or an async iterable, consumed lazily.
+        queue_size (int): Maximum number of items waiting in front of each stage.
+
+    Yields:
+        tuple: (index of the item, output of the last stage), in completion order.
+
+    Raises:
+        The first error raised by a stage or by the items. The other tasks are cancelled.
+    """
+    queues = [asyncio.Queue(queue_size) for _ in range(len(stages) + 1)]
+
+    async def feed():
+        index = 0
+
+        try:
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    await queues[0].put((index, item))
+                    index += 1
+            else:
+                for item in items:
+                    await queues[0].put((index, item))
+                    index += 1
+        except Exception as error:
+            await queues[-1].put(StageError(error))
+            return
+
+        await queues[0].put(DONE)
+
+    async def work(i, func, remaining):
+        while True:
+            value = await queues[i].get()
+
+            if value is DONE:
+                # Let the other workers of the stage see the end too
+                await queues[i].put(DONE)
+                remaining[0] -= 1
+
+                if remaining[0] == 0:
+                    await queues[i + 1].put(DONE)
+
+                return
+
+            index, item = value
+
+            try:
+                output = await func(item)
+            except Exception as error:
+                await queues[-1].put(StageError(error))
+                return
+
+            await queues[i + 1].put((index, output))
+
+    tasks = [asyncio.ensure_future(feed())]
+
+    for i, (func, workers) in enumerate(stages):
+        remaining = [max(workers, 1)]
+        tasks.extend(
+            asyncio.ensure_future(work(i, func, remaining)) for _ in range(remaining[0])
+        )
+
+    try:
+        while True:
+            value = await queues[-1].get()
+
+            if value is DONE:
+                return
+
+            if isinstance(value, StageError):
+                raise value.error
+
+            yield value
+
+    finally:
+        # Also stops the workers if the consumer stopped early
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def pack_by_budget(items: list, budget: int, cost) -> list:
+    """
+    Greedily groups consecutive items so that the total cost of each group stays within budget.
+    An item that exceeds the budget on its own gets its own group.
+
+    Args:
+        items (list): The items to group.
+        budget (int): The maximum total cost of a group.
+        cost (callable): Returns the cost of an item.
+
+    Returns:
+        list: A list of lists of items (in order).
+    """
+    packs = []
+    pack = []
+    total = 0
+
+    for item in items:
+        item_cost = cost(item)
+
+        if pack and total + item_cost > budget:
+            packs.append(pack)
+            pack = []
+            total = 0
+
+        pack.append(item)
+        total += item_cost
+
+    if pack:
+        packs.append(pack)
+
+    return packs
@@ -12,6 +12,108 @@ max_tokens = 1024
 temp = 0.7
 model_name = "gpt-4-turbo-preview"
 
+# Budget of a FactScore run (None means unlimited); new requests stop once it is spent
+max_run_tokens = None
+max_run_cost = None  # USD
+# USD per million (prompt, completion) tokens, used for the cost accounting
+token_prices = {
+    "gpt-4-turbo-preview": (10.0, 30.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+
+# Seed of the deterministic choice of the demonstrations of each prompt
+prompt_seed = 0
+
+# Maximum number of requests in flight for the async API
+max_concurrency = 8
+
+# Retries of transient errors (rate limits, timeouts, connection and 5xx errors)
+max_retries = 10
+retry_base_delay = 1  # seconds
+retry_max_delay = (
+    60  # cap of a single backoff, unless the server asks for a longer Retry-After
+)
+retry_deadline = 900  # seconds per call, retries included (None disables it)
+request_timeout = 120  # seconds per attempt
+# Consecutive failures after which all requests pause together (None disables the circuit breaker)
+circuit_breaker_threshold = 5
+circuit_breaker_timeout = 30  # seconds
+
+# Client-side quotas shared by every agent of the process (None disables the limiter)
+requests_per_minute = None
+tokens_per_minute = None
+
+# Batch API mode (FactScore.get_factscore_batch)
+batch_dir = (
+    "batches"  # request files, batch ids and the response cache of the batch runs
+)
+batch_poll_interval = 30  # seconds between two status checks of a batch
+batch_max_requests = 50_000  # requests per batch (the API limit)
+batch_price_factor = 0.5  # batch requests are billed at half price
+
+# Metrics of a FactScore run, dumped after get_factscore (None disables the dump);
+# a path ending with .json is written as JSON, anything else in the Prometheus text format
+metrics_path = None
+# Upper bounds (seconds) of the latency histogram buckets
+metrics_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+
+# Number of worker threads for the sync API (1 runs everything in the calling thread)
+max_workers = 1
+
+# Overlapped pipeline (sentence splitting -> extraction -> verification) of the streaming API,
+# also used by get_factscore/aget_factscore when enabled (states are then saved in completion order)
+pipeline = False
+# Generations processed at the same time by each stage (threads for the sync API, tasks for the async API)
+split_workers = 1
+extraction_workers = 4
+verification_workers = 4
+pipeline_queue_size = 8  # generations waiting in front of each stage (backpressure)
+# Entries saved by the pipeline that are kept in memory to reuse them for duplicates
+pipeline_recent_entries = 10_000
+# Verify each atomic fact as soon as it is streamed by the extraction request (async pipeline only)
+stream_extraction = False
+
 # Database path
-facts_db_path = "facts.json"
-decisions_db_path = "decisions.json"
+facts_db_path = "facts.jsonl"
+decisions_db_path = "decisions.jsonl"
+
+# State backend ("jsonl" appends one line per generation, "json" rewrites a JSON list,
+# "sqlite" stores one row per generation)
+state_backend = "jsonl"
+# Number of appended generations between two fsyncs (jsonl) or commits (sqlite)
+state_fsync_every = 32
+
+# Number of facts verified in a single prompt (1 sends one prompt per fact)
+verification_batch_size = 1
+
+# Prompt token budget for packing many sentences into one extraction request
+# (None sends one request per sentence)
+extraction_token_budget = None
+
+# Persistent LLM response cache (None disables it)
+cache_path = None
+cache_max_entries = None
+cache_max_age = None  # seconds
+cache_eviction_interval = 1000  # evict every N writes
+
+# Decisions memoized by (fact, knowledge source, scorer config) across generations
+decision_cache_size = 100_000  # entries kept in memory (0 disables the cache)
+decision_cache_path = None  # SQLite file to keep the decisions across runs
+
+# Atomic facts memoized by (sentence, extraction config) across generations
+sentence_cache_size = 100_000  # entries kept in memory (0 disables the cache)
+sentence_cache_path = None  # SQLite file to keep the facts across runs
+
+# Entries kept in the SQLite files of the decision and sentence caches (None keeps them all)
+memo_cache_max_entries = None
+memo_cache_max_age = None  # seconds
+
+# Retrieval of the passages relevant to each fact (None puts the whole knowledge source in the prompt)
+retrieval_top_k = None  # passages per fact
+retrieval_chunk_size = 128  # words per passage
+retrieval_chunk_overlap = 32  # words shared by consecutive passages
+retrieval_index_cache_size = 128  # knowledge source indexes kept in memory
@@ -1,16 +1,113 @@
 import string
-from .openai_agent import OpenAIAgent
+import asyncio
+from .openai_agent import OpenAIAgent, AsyncOpenAIAgent
+from .concurrency import ordered_map
+from .cache import MemoCache, make_key, get_decision_cache
+from .retrieval import Retriever
+from .prompts import PromptPrefixes, get_demons, select_demon
+from .usage import UsageStats
+from .backends import LLMBackend, AsyncBackendAgent, get_backend_name
+from .metrics import Metrics
 from . import configs
 import json
-import random
+import re
+
+
+def normalize_fact(fact: str) -> str:
+    """
+    Normalizes a fact so that trivially different spellings share a decision.
+
+    Args:
+        fact (str): The atomic fact.
+
+    Returns:
+        str: The lowercased fact with collapsed whitespace and without a trailing period.
+    """
+    return " ".join(fact.lower().split()).rstrip(".")
+
+
+# A numbered verdict line of a batched prompt, e.g. "3. True" or "3) false"
+BATCH_VERDICT_PATTERN = re.compile(
+    r"^\s*(\d+)\s*[.):\-]?\s*(true|false)\b", re.IGNORECASE | re.MULTILINE
+)
 
 
 class FactScorer:
-    def __init__(self):
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        max_workers: int = None,
+        batch_size: int = None,
+        decision_cache: MemoCache = None,
+        retriever: Retriever = None,
+        usage: UsageStats = None,
+        backend: LLMBackend = None,
+        metrics: Metrics = None,
+    ):
         # Examples (demonstrations) that is used in prompt generation
-        self.demons = self.load_demons()
+        self.demons = get_demons(configs.fact_scorer_demons_path, self.load_demons)
+        # Token accounting and budget shared with the rest of the run
+        self.usage = usage
+        # Timings, in-flight calls and errors of the stage
+        self.metrics = metrics if metrics is not None else Metrics()
+        # The LLM to send the prompts to (None uses the OpenAI agents)
+        self.backend = backend
         # To interact with OpenAI APIs
-        self.openai_agent = OpenAIAgent()
+        self.openai_agent = (
+            backend
+            if backend is not None
+            else OpenAIAgent(usage=usage, stage="verification", metrics=self.metrics)
+        )
+        # Async agent is created on first use so sync-only callers never build one
+        self.max_concurrency = max_concurrency
+        self._async_openai_agent = None
+        # Number of facts sent in parallel by get_score
+        self.max_workers = max_workers or configs.max_workers
+        # Number of facts verified in a single prompt (1 sends one prompt per fact)
+        self.batch_size = batch_size or configs.verification_batch_size
+        # Decisions shared across generations (and runs if persisted)
+        self.decision_cache = (
+            decision_cache if decision_cache is not None else get_decision_cache()
+        )
+        # Narrows long knowledge sources down to the passages relevant to the facts
+        if retriever is None and configs.retrieval_top_k:
+            retriever = Retriever()
+        self.retriever = retriever
+
+    @property
+    def async_openai_agent(self) -> AsyncOpenAIAgent:
+        if self._async_openai_agent is None and self.backend is not None:
+            self._async_openai_agent = AsyncBackendAgent(self.backend)
+        elif self._async_openai_agent is None:
+            self._async_openai_agent = AsyncOpenAIAgent(
+                self.max_concurrency,
+                usage=self.usage,
+                stage="verification",
+                metrics=self.metrics,
+            )
+
+        return self._async_openai_agent
+
+    def generate(self, prompt: str, system: str = None) -> str:
+        """
+        Sends a prompt to the LLM, timing the call.
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Returns:
+            str: The output of the LLM.
+        """
+        with self.metrics.track_call("verification"):
+            return self.openai_agent.generate(prompt, system=system)
+
+    async def agenerate(self, prompt: str, system: str = None) -> str:
+        """
+        Async version of generate.
+        """
+        with self.metrics.track_call("verification"):
+            return await self.async_openai_agent.generate(prompt, system=system)
 
     def load_demons(self):
         """
@@ -25,11 +122,56 @@ class FactScorer:
 
         return demons
 
-    def get_instructions(self) -> str:
+    @property
+    def demons(self) -> list:
+        return self._demons
+
+    @demons.setter
+    def demons(self, demons: list):
+        # The static prompt prefixes and the cache keys depend on the demons
+        self._demons = demons
+        self.demons_hash = make_key(demons)
+        self.prefixes = PromptPrefixes(
+            make_key(type(self).__qualname__, self.demons_hash)
+        )
+
+    def get_instructions(self, key: str = "") -> str:
+        """
+        Returns the instructions for the prompt generation, sent as the system message.
+        The false example is picked by a seeded hash of key, so there are only a few distinct
+        instructions, each built once and shared by every prompt picking it.
+
+        Args:
+            key (str): The text the false example is picked for (e.g. the atomic fact).
+
+        Returns:
+            str: The instructions for the prompt generation.
+        """
+        index = 1 + select_demon(
+            normalize_fact(key), len(self.demons) - 1, configs.prompt_seed
+        )
+
+        return self.prefixes.get(
+            f"verification_{index}", lambda: self.build_instructions(index)
+        )
+
+    def get_prompt_stats(self) -> dict:
+        """
+        Returns the estimated tokens of the static prompt prefixes, which every request repeats.
+
+        Returns:
+            dict: The prefix tokens by prefix name.
+        """
+        return self.prefixes.stats()
+
+    def build_instructions(self, false_index: int) -> str:
         """
         Prepare instructions for the prompt generation.
         Instructions include the examples given in the fact_scorer_demons.json file.
 
+        Args:
+            false_index (int): The index of the false example in the demons.
+
         Returns:
             str: The instructions for the prompt generation.
         """
@@ -37,7 +179,7 @@ class FactScorer:
         # instructions = "Evaluate the truthfulness of the statement based solely on the provided context.\n\n"
         instructions = "Instruction:\nOnly consider the statement true if it can be directly verified by the information in the context. If the information in the statement cannot be found in the context or differs from it, label it as false.\n\n"
         true_example = self.demons[0]
-        false_example = random.choice(self.demons[1:])
+        false_example = self.demons[false_index]
 
         for demon in [true_example, false_example]:
             instructions += f"Context:\n{demon['knowledge_source']}\n"
@@ -52,6 +194,11 @@ class FactScorer:
         """
         Calculates the score of each atomic fact based on the knowledge source.
         The score is caclulated by using the OpenAI API.
+        With max_workers > 1 the facts are sent in parallel on a thread pool.
+        With batch_size > 1 up to batch_size facts are verified in a single prompt.
+        Facts already scored against the same knowledge source (in this or a previous generation)
+        are taken from the decision cache.
+        With a retriever, each prompt only contains the passages of the knowledge source relevant to its facts.
 
         Args:
             facts (list): A list of atomic  to be scored.
@@ -61,49 +208,474 @@ class FactScorer:
             list: A list of dictionaries containing the atomic fact and its score.
         """
 
+        facts = [atom.strip() for atom in facts]
+        keys, decisions, missing = self.lookup_decisions(facts, knowledge_source)
+
+        scored = self.score_facts([atom for _, atom in missing], knowledge_source)
+        for (key, _), decision in zip(missing, scored):
+            self.remember_decision(key, decision, decisions)
+
+        return [dict(decisions[key], fact=atom) for atom, key in zip(facts, keys)]
+
+    async def aget_score(self, facts: list, knowledge_source: str) -> list:
+        """
+        Async version of get_score. The facts (or batches of facts) are scored concurrently,
+        bounded by the max_concurrency of the async agent.
+
+        Args:
+            facts (list): A list of atomic  to be scored.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            list: A list of dictionaries containing the atomic fact and its score (in the order of facts).
+        """
+
+        facts = [atom.strip() for atom in facts]
+        keys, decisions, missing = self.lookup_decisions(facts, knowledge_source)
+
+        scored = await self.ascore_facts(
+            [atom for _, atom in missing], knowledge_source
+        )
+        for (key, _), decision in zip(missing, scored):
+            self.remember_decision(key, decision, decisions)
+
+        return [dict(decisions[key], fact=atom) for atom, key in zip(facts, keys)]
+
+    def score_facts(self, facts: list, knowledge_source: str) -> list:
+        """
+        Scores (stripped) atomic facts with the LLM, one prompt per fact or per batch.
+
+        Args:
+            facts (list): The atomic facts to be scored.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            list: A list of dictionaries containing the atomic fact and its score.
+        """
+        if self.batch_size > 1:
+            batches = ordered_map(
+                lambda batch: self.score_batch(batch, knowledge_source),
+                self.get_batches(facts),
+                self.max_workers,
+            )
+            return [decision for batch in batches for decision in batch]
+
+        return list(
+            ordered_map(
+                lambda atom: self.score_fact(atom, knowledge_source),
+                facts,
+                self.max_workers,
+            )
+        )
+
+    async def ascore_facts(self, facts: list, knowledge_source: str) -> list:
+        """
+        Async version of score_facts.
+        """
+        if self.batch_size > 1:
+            batches = await asyncio.gather(
+                *[
+                    self.ascore_batch(batch, knowledge_source)
+                    for batch in self.get_batches(facts)
+                ]
+            )
+            return [decision for batch in batches for decision in batch]
+
+        return list(
+            await asyncio.gather(
+                *[self.ascore_fact(atom, knowledge_source) for atom in facts]
+            )
+        )
+
+    def lookup_decisions(self, facts: list, knowledge_source: str) -> tuple:
+        """
+        Looks up the decisions of the facts in the decision cache.
+
+        Args:
+            facts (list): The (stripped) atomic facts.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            tuple: The decision key of each fact, the known decisions by key,
+                and the (key, fact) pairs that still have to be scored (each key only once).
+        """
+        source_hash = make_key(knowledge_source)
+        keys = [self.get_decision_key(atom, source_hash) for atom in facts]
+        decisions = {}
+        missing = {}
+
+        for atom, key in zip(facts, keys):
+            if key in decisions or key in missing:
+                continue
+
+            decision = (
+                self.decision_cache.get(key)
+                if self.decision_cache is not None
+                else None
+            )
+
+            if decision is None:
+                missing[key] = atom
+            else:
+                decisions[key] = decision
+
+        return keys, decisions, list(missing.items())
+
+    def remember_decision(self, key: str, decision: dict, decisions: dict):
+        """
+        Stores the decision of a newly scored fact in the known decisions and the decision cache.
+
+        Args:
+            key (str): The decision key of the fact.
+            decision (dict): Its decision.
+            decisions (dict): The known decisions by key.
+        """
+        decisions[key] = {
+            "is_supported": decision["is_supported"],
+            "output": decision["output"],
+        }
+
+        if self.decision_cache is not None:
+            self.decision_cache.set(key, decisions[key])
+
+    def get_cache_stats(self) -> dict:
+        """
+        Returns the counters of the decision cache. Every hit is an LLM call avoided.
+
+        Returns:
+            dict: The number of hits, misses and the hit rate.
+        """
+        if self.decision_cache is None:
+            return {"hits": 0, "misses": 0, "hit_rate": 0.0}
+
+        return self.decision_cache.stats()
+
+    def get_decision_key(self, atom: str, source_hash: str) -> str:
+        """
+        Returns the decision cache key of a fact.
+
+        Args:
+            atom (str): The (stripped) atomic fact.
+            source_hash (str): The hash of the knowledge source.
+
+        Returns:
+            str: A hash of the normalized fact, the knowledge source hash and the scorer config.
+        """
+        return make_key(normalize_fact(atom), source_hash, self.get_config())
+
+    def get_config(self) -> dict:
+        """
+        Returns the scorer settings the decisions depend on.
+
+        Returns:
+            dict: The model name, temperature, max tokens, demons hash, prompt settings,
+                retrieval settings and backend.
+        """
+        config = {
+            "model_name": configs.model_name,
+            "temp": configs.temp,
+            "max_tokens": configs.max_tokens,
+            "fact_scorer_demons": self.demons_hash,
+            # The seed picks the false example of the prompt, and batching changes the prompt
+            "prompt_seed": configs.prompt_seed,
+            "batch_size": self.batch_size,
+            "retrieval": self.retriever.get_config() if self.retriever else None,
+        }
+
+        if self.backend is not None:
+            # Outputs of another backend must not be mistaken for the model's
+            config["backend"] = get_backend_name(self.backend)
+
+        return config
+
+    def get_context(self, facts: list, knowledge_source: str) -> str:
+        """
+        Returns the context to verify the facts against.
+
+        Args:
+            facts (list): The (stripped) atomic facts of the prompt.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            str: The passages relevant to the facts, or the whole knowledge source without a retriever.
+        """
+        if self.retriever is None:
+            return knowledge_source
+
+        return self.retriever.retrieve(facts, knowledge_source)
+
+    def score_fact(self, atom: str, knowledge_source: str) -> dict:
+        """
+        Scores a single (stripped) atomic fact with its own prompt.
+
+        Args:
+            atom (str): The atomic fact to be scored.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            dict: A dictionary containing the atomic fact, whether it is supported and the GPT output.
+        """
+        # Prompt that will be sent to GPT
+        prompt, system = self.get_fact_request(atom, knowledge_source)
+
+        output = self.generate(prompt, system=system)
+
+        with self.metrics.time("verification_parsing"):
+            return self.get_decision(atom, output)
+
+    async def ascore_fact(self, atom: str, knowledge_source: str) -> dict:
+        """
+        Async version of score_fact.
+        """
+        prompt, system = self.get_fact_request(atom, knowledge_source)
+
+        output = await self.agenerate(prompt, system=system)
+
+        with self.metrics.time("verification_parsing"):
+            return self.get_decision(atom, output)
+
+    def score_batch(self, facts: list, knowledge_source: str) -> list:
+        """
+        Scores a batch of (stripped) atomic facts with a single prompt.
+        Facts whose verdict cannot be parsed from the output are scored one by one.
+
+        Args:
+            facts (list): The atomic facts to be scored.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            list: A list of dictionaries containing the atomic fact and its score.
+        """
+        if len(facts) == 1:
+            return [self.score_fact(facts[0], knowledge_source)]
+
+        prompt, system = self.get_batch_request(facts, knowledge_source)
+        output = self.generate(prompt, system=system)
+        with self.metrics.time("verification_parsing"):
+            decisions = self.get_batch_decisions(facts, output)
+
+        return [
+            (
+                decision
+                if decision is not None
+                else self.score_fact(atom, knowledge_source)
+            )
+            for atom, decision in zip(facts, decisions)
+        ]
+
+    async def ascore_batch(self, facts: list, knowledge_source: str) -> list:
+        """
+        Async version of score_batch.
+        """
+        if len(facts) == 1:
+            return [await self.ascore_fact(facts[0], knowledge_source)]
+
+        prompt, system = self.get_batch_request(facts, knowledge_source)
+        output = await self.agenerate(prompt, system=system)
+        with self.metrics.time("verification_parsing"):
+            decisions = self.get_batch_decisions(facts, output)
+
+        async def fallback(atom, decision):
+            if decision is not None:
+                return decision
+
+            return await self.ascore_fact(atom, knowledge_source)
+
+        return list(
+            await asyncio.gather(
+                *[fallback(atom, decision) for atom, decision in zip(facts, decisions)]
+            )
+        )
+
+    def get_requests(self, facts: list, knowledge_source: str) -> list:
+        """
+        Lists the requests get_score would send for facts missing from the decision cache
+        (before any fallback for unparsable verdicts), e.g. to send them through the Batch API.
+
+        Args:
+            facts (list): A list of atomic facts to be scored.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            list: The (prompt, system message) pairs.
+        """
+        facts = [atom.strip() for atom in facts]
+        _, _, missing = self.lookup_decisions(facts, knowledge_source)
+        atoms = [atom for _, atom in missing]
+
+        if self.batch_size > 1:
+            return [
+                (
+                    self.get_batch_request(batch, knowledge_source)
+                    if len(batch) > 1
+                    else self.get_fact_request(batch[0], knowledge_source)
+                )
+                for batch in self.get_batches(atoms)
+            ]
+
+        return [self.get_fact_request(atom, knowledge_source) for atom in atoms]
+
+    def get_fact_request(self, atom: str, knowledge_source: str) -> tuple:
+        """
+        Builds the request verifying a single (stripped) atomic fact.
+
+        Args:
+            atom (str): The atomic fact to be scored.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            tuple: The prompt and the system message.
+        """
+        prompt = self.get_prompt(atom, self.get_context([atom], knowledge_source))
+
+        return prompt, self.get_instructions(atom)
+
+    def get_batch_request(self, facts: list, knowledge_source: str) -> tuple:
+        """
+        Builds the request verifying a batch of (stripped) atomic facts.
+
+        Args:
+            facts (list): The atomic facts of the batch.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            tuple: The prompt and the system message.
+        """
+        prompt = self.get_batch_prompt(facts, self.get_context(facts, knowledge_source))
+
+        return prompt, self.get_instructions("\n".join(facts))
+
+    def get_batches(self, facts: list) -> list:
+        """
+        Splits the facts into batches of batch_size.
+
+        Args:
+            facts (list): The atomic facts to be scored.
+
+        Returns:
+            list: A list of lists of facts.
+        """
+        return [
+            facts[i : i + self.batch_size]
+            for i in range(0, len(facts), self.batch_size)
+        ]
+
+    def get_prompt(self, atom: str, knowledge_source: str) -> str:
+        """
+        Prepares the prompt that verifies an atomic fact against the knowledge source.
+
+        Args:
+            atom (str): The (stripped) atomic fact.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            str: The user message to send to GPT after the instructions.
+        """
+        prompt = f"Context:\n{knowledge_source}\n"
+        prompt += f"Statement:\n{atom} True or False?\n"
+        prompt += "Output:\n"
+
+        return prompt
+
+    def get_batch_prompt(self, facts: list, knowledge_source: str) -> str:
+        """
+        Prepares a prompt that verifies several atomic facts against the same knowledge source.
+        The knowledge source is only included once.
+
+        Args:
+            facts (list): The (stripped) atomic facts.
+            knowledge_source (str): The knowledge source to be used for scoring.
+
+        Returns:
+            str: The user message to send to GPT after the instructions.
+        """
+        prompt = f"Context:\n{knowledge_source}\n"
+        prompt += "Statements:\n"
+
+        for i, atom in enumerate(facts, 1):
+            prompt += f"{i}. {atom}\n"
+
+        prompt += (
+            "For each statement answer True or False, one per line, "
+            'in the format "<number>. True" or "<number>. False".\n'
+        )
+        prompt += "Output:\n"
+
+        return prompt
+
+    def get_batch_decisions(self, facts: list, output: str) -> list:
+        """
+        Maps the numbered verdicts of a batched prompt back to the facts.
+
+        Args:
+            facts (list): The (stripped) atomic facts of the batch.
+            output (str): The output of GPT for the batch.
+
+        Returns:
+            list: A decision dictionary for each fact, or None if its verdict could not be parsed.
+        """
+        verdicts = {}
+
+        for match in BATCH_VERDICT_PATTERN.finditer(output):
+            number = int(match.group(1))
+            verdict = match.group(2).lower() == "true"
+
+            # Conflicting verdicts for the same statement cannot be trusted
+            if verdicts.get(number, (verdict,))[0] != verdict:
+                verdicts[number] = (None, None)
+            else:
+                verdicts[number] = (verdict, match.group(0).strip())
+
         decisions = []
+        for i, atom in enumerate(facts, 1):
+            is_supported, line = verdicts.get(i, (None, None))
 
-        for atom in facts:
-            atom = atom.strip()
-
-            # Prompt that will be sent to GPT
-            prompt = self.get_instructions()
-            prompt += f"Context:\n{knowledge_source}\n"
-            prompt += f"Statement:\n{atom} True or False?\n"
-            prompt += "Output:\n"
-
-            output = self.openai_agent.generate(prompt)
-
-            generated_answer = output.lower()
-            is_supported = None
-
-            if "true" in generated_answer or "false" in generated_answer:
-                if "true" in generated_answer and "false" not in generated_answer:
-                    is_supported = True
-                elif "false" in generated_answer and "true" not in generated_answer:
-                    is_supported = False
-                else:
-                    is_supported = generated_answer.index(
-                        "true"
-                    ) > generated_answer.index("false")
+            if is_supported is None:
+                decisions.append(None)
             else:
-                is_supported = all(
-                    [
-                        keyword
-                        not in generated_answer.lower()
-                        .translate(str.maketrans("", "", string.punctuation))
-                        .split()
-                        for keyword in [
-                            "not",
-                            "cannot",
-                            "unknown",
-                            "information",
-                        ]
-                    ]
+                decisions.append(
+                    {"fact": atom, "is_supported": is_supported, "output": line}
                 )
 
-            decisions.append(
-                {"fact": atom, "is_supported": is_supported, "output": output}
+        return decisions
+
+    def get_decision(self, atom: str, output: str) -> dict:
+        """
+        Interprets the output of GPT for an atomic fact.
+
+        Args:
+            atom (str): The (stripped) atomic fact.
+            output (str): The output of GPT for the fact.
+
+        Returns:
+            dict: A dictionary containing the atomic fact, whether it is supported and the GPT output.
+        """
+        generated_answer = output.lower()
+        is_supported = None
+
+        if "true" in generated_answer or "false" in generated_answer:
+            if "true" in generated_answer and "false" not in generated_answer:
+                is_supported = True
+            elif "false" in generated_answer and "true" not in generated_answer:
+                is_supported = False
+            else:
+                is_supported = generated_answer.index("true") > generated_answer.index(
+                    "false"
+                )
+        else:
+            is_supported = all(
+                [
+                    keyword
+                    not in generated_answer.lower()
+                    .translate(str.maketrans("", "", string.punctuation))
+                    .split()
+                    for keyword in [
+                        "not",
+                        "cannot",
+                        "unknown",
+                        "information",
+                    ]
+                ]
             )
 
-        return decisions
+        return {"fact": atom, "is_supported": is_supported, "output": output}
@@ -1,23 +1,114 @@
-import numpy as np
+import asyncio
+import math
 from . import FactScorer, AtomicFactGenerator
-from .state_handler import StateHandler
+from .state_handler import SavedEntries, get_state_handler
+from .concurrency import ordered_map, pack_by_budget, staged_map, astaged_map
+from .openai_agent import estimate_tokens
+from .cache import make_key
+from .usage import UsageStats, track_generation
+from .batch import BatchRunner
+from .backends import LLMBackend, get_backend_name
+from .metrics import Metrics
 from . import configs
 from tqdm import tqdm
 
 
+def mean(values: list) -> float:
+    """
+    Returns the mean of values (nan if there are none) without importing numpy.
+    """
+    return sum(values) / len(values) if len(values) else math.nan
+
+
+def calculate_score(decision: list, gamma: int) -> tuple:
+    """
+    Calculates the score of a generation based on whether its facts are supported by the knowledge source.
+
+    Args:
+        decision (list): A list containing dictionaries of {output, is_supported, fact} for each fact of a generation.
+        gamma (int): The length penalty (0 disables it).
+
+    Returns:
+        tuple: A tuple containing the score and the original score (without applying gamma penalty).
+    """
+
+    score = mean([d["is_supported"] for d in decision])
+    init_score = score
+
+    if gamma:
+        penalty = 1.0 if len(decision) >= gamma else math.exp(1 - gamma / len(decision))
+        score = penalty * score
+
+    return score, init_score
+
+
 class FactScore:
 
-    def __init__(self, gamma: int = 10):
-        self.atomic_fact_generator = AtomicFactGenerator()
-        self.fact_scorer = FactScorer()
-        self.facts_handler = StateHandler(configs.facts_db_path)
-        self.decisions_handler = StateHandler(configs.decisions_db_path)
+    def __init__(
+        self,
+        gamma: int = 10,
+        max_concurrency: int = None,
+        max_workers: int = None,
+        pack_token_budget: int = None,
+        max_tokens: int = None,
+        max_cost: float = None,
+        backend: LLMBackend = None,
+        metrics: Metrics = None,
+        pipeline: bool = None,
+        stream_extraction: bool = None,
+        facts_path: str = None,
+        decisions_path: str = None,
+    ):
+        # Prompt token budget of packed extraction requests (None disables packing)
+        self.pack_token_budget = pack_token_budget or configs.extraction_token_budget
+        # Running token and cost totals of the run, with its optional budget
+        self.usage = UsageStats(max_tokens, max_cost)
+        # Timings, in-flight calls, errors and cache hit rates of the run
+        self.metrics = metrics if metrics is not None else Metrics()
+        # The LLM of both stages (None uses the OpenAI agents)
+        self.backend = backend
+        self.atomic_fact_generator = AtomicFactGenerator(
+            max_concurrency,
+            pack_token_budget=self.pack_token_budget,
+            usage=self.usage,
+            backend=backend,
+            metrics=self.metrics,
+        )
+        self.fact_scorer = FactScorer(
+            max_concurrency, usage=self.usage, backend=backend, metrics=self.metrics
+        )
+        # State files of the run (e.g. of a shard, see FactScoreLite.sharding)
+        self.facts_handler = get_state_handler(facts_path or configs.facts_db_path)
+        self.decisions_handler = get_state_handler(
+            decisions_path or configs.decisions_db_path
+        )
         self.gamma = gamma
+        # Number of generations processed in parallel by the sync API
+        self.max_workers = max_workers or configs.max_workers
+        # Whether get_factscore and aget_factscore overlap the stages (see iter_factscore)
+        self.pipeline = configs.pipeline if pipeline is None else pipeline
+        # Workers of each stage of the pipeline and size of the queues between them
+        self.stage_workers = {
+            "splitting": configs.split_workers,
+            "extraction": configs.extraction_workers,
+            "verification": configs.verification_workers,
+        }
+        self.queue_size = configs.pipeline_queue_size
+        # Whether the async pipeline verifies the facts while they are streamed (see aextract_item)
+        self.stream_extraction = (
+            configs.stream_extraction
+            if stream_extraction is None
+            else stream_extraction
+        )
 
     def get_facts(self, generations: list) -> list:
         """
         Extract facts from a list of generations using AtomicFactGenerator.
-        Saves the results in a json file using the StateHandler.
+        Appends the results to the facts state file (JSONL by default).
+        The saved facts are keyed by a hash of the generation and the model config,
+        so only the generations without saved facts are sent, whatever their position.
+        With max_workers > 1 the generations are processed on a thread pool (saved in order).
+        With pack_token_budget set, the sentences of consecutive generations share packed requests.
 
         Args:
             generations (list): A list of generations to extract facts from.
@@ -28,22 +119,52 @@ class FactScore:
 
         print("Extracting facts from generations...")
 
-        generation_facts_pairs = self.facts_handler.load()
+        keys = [self.get_facts_key(generation) for generation in generations]
+        saved = self.load_state(
+            self.facts_handler,
+            lambda i, entry: self.get_facts_key(entry["generation"]),
+        )
+        missing = self.get_missing(keys, generations, saved)
+        cache_hits = self.atomic_fact_generator.get_cache_stats()["hits"]
 
-        for generation in tqdm(generations[len(generation_facts_pairs) :]):
-            atomic_facts_of_generation = self.atomic_fact_generator.run(generation)
-            atomic_facts_of_generation = [
-                fact
-                for sentence, atomic_facts in atomic_facts_of_generation
-                for fact in atomic_facts
-            ]
-            generation_facts_pairs.append(
-                {
-                    "generation": generation,
-                    "facts": atomic_facts_of_generation,
-                }
+        if self.pack_token_budget:
+            atomic_facts_of_generations = (
+                atomic_facts
+                for chunk_atomic_facts in ordered_map(
+                    lambda chunk: self.atomic_fact_generator.run_many(
+                        [generation for _, generation in chunk]
+                    ),
+                    self.get_generation_chunks(missing),
+                    self.max_workers,
+                )
+                for atomic_facts in chunk_atomic_facts
             )
-            self.facts_handler.save(generation_facts_pairs)
+        else:
+            atomic_facts_of_generations = ordered_map(
+                lambda item: self.run_generation(*item), missing, self.max_workers
+            )
+
+        try:
+            for (key, generation), atomic_facts_of_generation in tqdm(
+                zip(missing, atomic_facts_of_generations),
+                total=len(missing),
+            ):
+                saved[key] = self.get_facts_entry(
+                    key, generation, atomic_facts_of_generation
+                )
+                with self.metrics.time("checkpointing"):
+                    self.facts_handler.append(saved[key])
+
+        finally:
+            # Checkpoint what was extracted, also when the budget is spent
+            with self.metrics.time("checkpointing"):
+                self.facts_handler.flush()
+
+        self.report_cache_hits(
+            self.atomic_fact_generator, cache_hits, "Sentence", "extraction"
+        )
+
+        generation_facts_pairs = [saved[key] for key in keys]
 
         assert len(generation_facts_pairs) == len(
             generations
@@ -51,6 +172,244 @@ class FactScore:
 
         return generation_facts_pairs
 
+    async def aget_facts(self, generations: list) -> list:
+        """
+        Async version of get_facts. All generations without saved facts are decomposed concurrently
+        (bounded by max_concurrency) while the results are saved in the input order.
+
+        Args:
+            generations (list): A list of generations to extract facts from.
+
+        Returns:
+            list: A list of generation-facts pairs dictionaries.
+        """
+
+        print("Extracting facts from generations...")
+
+        keys = [self.get_facts_key(generation) for generation in generations]
+        saved = self.load_state(
+            self.facts_handler,
+            lambda i, entry: self.get_facts_key(entry["generation"]),
+        )
+        missing = self.get_missing(keys, generations, saved)
+        cache_hits = self.atomic_fact_generator.get_cache_stats()["hits"]
+
+        if self.pack_token_budget:
+            chunks = self.get_generation_chunks(missing)
+            tasks = [
+                asyncio.ensure_future(
+                    self.atomic_fact_generator.arun_many(
+                        [generation for _, generation in chunk]
+                    )
+                )
+                for chunk in chunks
+            ]
+        else:
+            chunks = [[item] for item in missing]
+            tasks = [
+                asyncio.ensure_future(asyncio.gather(self.arun_generation(*item)))
+                for item in missing
+            ]
+
+        try:
+            with tqdm(total=len(missing)) as progress_bar:
+                for chunk, task in zip(chunks, tasks):
+                    for (key, generation), atomic_facts_of_generation in zip(
+                        chunk, await task
+                    ):
+                        saved[key] = self.get_facts_entry(
+                            key, generation, atomic_facts_of_generation
+                        )
+                        with self.metrics.time("checkpointing"):
+                            self.facts_handler.append(saved[key])
+                        progress_bar.update()
+
+        finally:
+            # Do not leave requests running if a generation failed
+            for task in tasks:
+                task.cancel()
+
+            with self.metrics.time("checkpointing"):
+                self.facts_handler.flush()
+
+        self.report_cache_hits(
+            self.atomic_fact_generator, cache_hits, "Sentence", "extraction"
+        )
+
+        generation_facts_pairs = [saved[key] for key in keys]
+
+        assert len(generation_facts_pairs) == len(
+            generations
+        ), "Number of generations and generation-facts pairs must match."
+
+        return generation_facts_pairs
+
+    def run_generation(self, key: str, generation: str) -> list:
+        """
+        Extracts the atomic facts of a generation, attributing the usage to its key.
+
+        Args:
+            key (str): The facts key of the generation.
+            generation (str): The generation.
+
+        Returns:
+            list: The (sentence, atomic facts) pairs of the generation.
+        """
+        with track_generation(key):
+            return self.atomic_fact_generator.run(generation)
+
+    async def arun_generation(self, key: str, generation: str) -> list:
+        """
+        Async version of run_generation.
+        """
+        with track_generation(key):
+            return await self.atomic_fact_generator.arun(generation)
+
+    def get_facts_entry(
+        self, key: str, generation: str, atomic_facts_of_generation: list
+    ) -> dict:
+        """
+        Builds the saved facts entry of a generation.
+
+        Args:
+            key (str): The facts key of the generation.
+            generation (str): The generation.
+            atomic_facts_of_generation (list): The (sentence, atomic facts) pairs of the generation.
+
+        Returns:
+            dict: The generation-facts pair dictionary.
+        """
+        return {
+            "key": key,
+            "generation": generation,
+            "facts": [
+                fact
+                for sentence, atomic_facts in atomic_facts_of_generation
+                for fact in atomic_facts
+            ],
+        }
+
+    def get_config(self) -> dict:
+        """
+        Returns the model settings the saved results depend on.
+
+        Returns:
+            dict: The model name, temperature, max tokens, demons hashes and backend.
+        """
+        config = {
+            "model_name": configs.model_name,
+            "temp": configs.temp,
+            "max_tokens": configs.max_tokens,
+            # The content of the demons the prompts use, not their install path,
+            # so the saved results resume on every machine
+            "atomic_facts_demons": self.atomic_fact_generator.demons_hash,
+            "fact_scorer_demons": self.fact_scorer.demons_hash,
+        }
+
+        if self.backend is not None:
+            config["backend"] = get_backend_name(self.backend)
+
+        return config
+
+    def get_config_key(self) -> str:
+        """
+        Returns the hash of the model settings, saved with every decisions entry
+        so the decisions of different settings are not merged (see merge_shards).
+
+        Returns:
+            str: A hash of get_config.
+        """
+        return make_key(self.get_config())
+
+    def get_facts_key(self, generation: str) -> str:
+        """
+        Returns the key of the saved facts of a generation.
+
+        Args:
+            generation (str): The generation.
+
+        Returns:
+            str: A hash of the generation and the model config.
+        """
+        return make_key("facts", generation, self.get_config())
+
+    def get_decisions_key(
+        self, generation: str, knowledge_source: str, facts: list
+    ) -> str:
+        """
+        Returns the key of the saved decisions of a generation.
+        The facts are part of the key, so decisions are never reused for re-extracted facts.
+
+        Args:
+            generation (str): The generation.
+            knowledge_source (str): The knowledge source the facts are scored against.
+            facts (list): The atomic facts the decisions are about.
+
+        Returns:
+            str: A hash of the generation, the knowledge source, the facts and the model config.
+        """
+        return make_key(
+            "decisions", generation, knowledge_source, facts, self.get_config()
+        )
+
+    def load_state(self, handler, legacy_key) -> dict:
+        """
+        Loads the saved entries of a state handler by key.
+
+        Args:
+            handler: The state handler.
+            legacy_key (callable): Returns the key of an entry saved without one
+                (called with its position and the entry), or None to ignore it.
+
+        Returns:
+            dict: The saved entries by key.
+        """
+        saved = {}
+
+        for i, entry in enumerate(handler.load()):
+            key = entry.get("key") or legacy_key(i, entry)
+
+            if key is not None:
+                saved[key] = entry
+
+        return saved
+
+    def get_missing(self, keys: list, items: list, saved: dict) -> list:
+        """
+        Returns the items without a saved result, each distinct key only once.
+
+        Args:
+            keys (list): The key of each item.
+            items (list): The items.
+            saved (dict): The saved entries by key.
+
+        Returns:
+            list: A list of (key, item) pairs in input order.
+        """
+        missing = {}
+
+        for key, item in zip(keys, items):
+            if key not in saved and key not in missing:
+                missing[key] = item
+
+        return list(missing.items())
+
+    def get_generation_chunks(self, generations: list) -> list:
+        """
+        Groups consecutive generations whose sentences can share packed extraction requests.
+
+        Args:
+            generations (list): A list of (key, generation) pairs.
+
+        Returns:
+            list: A list of lists of (key, generation) pairs (in order).
+        """
+        return pack_by_budget(
+            generations,
+            self.pack_token_budget,
+            lambda item: estimate_tokens(item[1]),
+        )
+
     def calculate_score(self, decision: list) -> tuple:
         """
         Calculates the score of a generation based on whether its facts are supported by the knowledge source.
@@ -61,26 +420,17 @@ class FactScore:
         Returns:
             tuple: A tuple containing the score and the original score (without applying gamma penalty).
         """
-
-        score = np.mean([d["is_supported"] for d in decision])
-        init_score = score
-
-        if self.gamma:
-            penalty = (
-                1.0
-                if len(decision) >= self.gamma
-                else np.exp(1 - self.gamma / len(decision))
-            )
-            score = penalty * score
-
-        return score, init_score
+        return calculate_score(decision, self.gamma)
 
     def get_decisions(
         self, generation_facts_pairs: list, knowledge_sources: list
     ) -> list:
         """
         Scores the facts related to each generation based on the according knowledge source.
-        Uses FactScorer to score the facts and saves the results in a json file using the StateHandler.
+        Uses FactScorer to score the facts and appends the results to the decisions state file (JSONL by default).
+        The saved decisions are keyed by a hash of the generation, the knowledge source and the model config,
+        so only the generations without saved decisions are scored, whatever their position.
+        With max_workers > 1 the generations are scored on a thread pool (saved in order).
 
         Args:
             generation_facts_pairs (list): A list of generation-facts pairs dictionaries.
@@ -95,45 +445,286 @@ class FactScore:
 
         print("Generating decisions...")
 
-        decisions = self.decisions_handler.load()
-        scores = []
-        init_scores = []
+        assert len(generation_facts_pairs) == len(
+            knowledge_sources
+        ), "Number of generation-facts pairs and knowledge sources should be the same."
 
-        for entry in decisions:
-            score, init_score = self.calculate_score(entry["decision"])
-            init_scores.append(init_score)
-            scores.append(score)
+        keys, saved, missing = self.load_decisions(
+            generation_facts_pairs, knowledge_sources
+        )
+        cache_hits = self.fact_scorer.get_cache_stats()["hits"]
+
+        try:
+            for (key, (entry, knowledge_source)), decision in tqdm(
+                zip(
+                    missing,
+                    ordered_map(
+                        lambda item: self.score_generation(*item),
+                        [item for _, item in missing],
+                        self.max_workers,
+                    ),
+                ),
+                total=len(missing),
+            ):
+                saved[key] = self.get_decisions_entry(
+                    key, entry, decision, knowledge_source
+                )
+                with self.metrics.time("checkpointing"):
+                    self.decisions_handler.append(saved[key])
+
+        finally:
+            # Checkpoint what was scored, also when the budget is spent
+            with self.metrics.time("checkpointing"):
+                self.decisions_handler.flush()
+
+        self.report_cache_hits(self.fact_scorer, cache_hits, "Decision", "verification")
+
+        decisions = [saved[key] for key in keys]
+
+        assert len(decisions) == len(
+            generation_facts_pairs
+        ), "Number of decisions and generation-facts pairs should be the same."
+
+        return self.get_scores(decisions)
+
+    async def aget_decisions(
+        self, generation_facts_pairs: list, knowledge_sources: list
+    ) -> list:
+        """
+        Async version of get_decisions. All generations without saved decisions are scored concurrently
+        (bounded by max_concurrency) while the results are saved in the input order.
+
+        Args:
+            generation_facts_pairs (list): A list of generation-facts pairs dictionaries.
+            knowledge_sources (list): A list of knowledge sources to be used for scoring.
+
+        Returns:
+            list:
+                A list of scores (scores after applying gamma penalty),
+                and initial scores (original score without applying gamma penalty).
+        """
+
+        print("Generating decisions...")
 
         assert len(generation_facts_pairs) == len(
             knowledge_sources
         ), "Number of generation-facts pairs and knowledge sources should be the same."
 
-        current_index = len(decisions)
+        keys, saved, missing = self.load_decisions(
+            generation_facts_pairs, knowledge_sources
+        )
+        cache_hits = self.fact_scorer.get_cache_stats()["hits"]
 
-        for entry, knowledge_source in tqdm(
-            zip(
-                generation_facts_pairs[current_index:],
-                knowledge_sources[current_index:],
-            )
-        ):
-            generation, facts = entry["generation"], entry["facts"]
+        tasks = [
+            asyncio.ensure_future(self.ascore_generation(*item)) for _, item in missing
+        ]
 
-            decision = self.fact_scorer.get_score(facts, knowledge_source)
-            score, init_score = self.calculate_score(decision)
+        try:
+            for (key, (entry, knowledge_source)), task in tqdm(
+                zip(missing, tasks), total=len(tasks)
+            ):
+                saved[key] = self.get_decisions_entry(
+                    key, entry, await task, knowledge_source
+                )
+                with self.metrics.time("checkpointing"):
+                    self.decisions_handler.append(saved[key])
 
-            init_scores.append(init_score)
-            scores.append(score)
-            decisions.append({"generation": generation, "decision": decision})
-            self.decisions_handler.save(decisions)
+        finally:
+            # Do not leave requests running if a generation failed
+            for task in tasks:
+                task.cancel()
+
+            with self.metrics.time("checkpointing"):
+                self.decisions_handler.flush()
+        self.report_cache_hits(self.fact_scorer, cache_hits, "Decision", "verification")
 
-            assert len(facts) == len(
-                decision
-            ), "Number of facts and decisions for that generation should be the same."
+        decisions = [saved[key] for key in keys]
 
         assert len(decisions) == len(
             generation_facts_pairs
         ), "Number of decisions and generation-facts pairs should be the same."
 
+        return self.get_scores(decisions)
+
+    def score_generation(self, entry: dict, knowledge_source: str) -> list:
+        """
+        Scores the atomic facts of a generation, attributing the usage to its facts key.
+
+        Args:
+            entry (dict): The generation-facts pair of the generation.
+            knowledge_source (str): The knowledge source to score the facts against.
+
+        Returns:
+            list: The decision of each fact of the generation.
+        """
+        with track_generation(self.get_facts_key(entry["generation"])):
+            return self.fact_scorer.get_score(entry["facts"], knowledge_source)
+
+    async def ascore_generation(self, entry: dict, knowledge_source: str) -> list:
+        """
+        Async version of score_generation.
+        """
+        with track_generation(self.get_facts_key(entry["generation"])):
+            return await self.fact_scorer.aget_score(entry["facts"], knowledge_source)
+
+    def load_decisions(
+        self, generation_facts_pairs: list, knowledge_sources: list
+    ) -> tuple:
+        """
+        Loads the saved decisions and finds the generations that still have to be scored.
+        Decisions saved without a key are matched by position if their generation
+        and number of facts are the same.
+
+        Args:
+            generation_facts_pairs (list): A list of generation-facts pairs dictionaries.
+            knowledge_sources (list): A list of knowledge sources to be used for scoring.
+
+        Returns:
+            tuple: The decisions key of each generation, the saved decisions by key,
+                and the (key, (generation-facts pair, knowledge source)) items to score.
+        """
+        keys = [
+            self.get_decisions_key(
+                entry["generation"], knowledge_source, entry["facts"]
+            )
+            for entry, knowledge_source in zip(
+                generation_facts_pairs, knowledge_sources
+            )
+        ]
+
+        def legacy_key(i, entry):
+            if (
+                i < len(keys)
+                and entry["generation"] == generation_facts_pairs[i]["generation"]
+                and len(entry["decision"]) == len(generation_facts_pairs[i]["facts"])
+            ):
+                return keys[i]
+
+            return None
+
+        saved = self.load_state(self.decisions_handler, legacy_key)
+        missing = self.get_missing(
+            keys, list(zip(generation_facts_pairs, knowledge_sources)), saved
+        )
+
+        return keys, saved, missing
+
+    def report_cache_hits(self, component, cache_hits: int, cache: str, calls: str):
+        """
+        Prints how many LLM calls the cache of a component avoided since cache_hits was read.
+
+        Args:
+            component: The AtomicFactGenerator or FactScorer owning the cache.
+            cache_hits (int): The cache hits of the component before the run.
+            cache (str): The name of the cache in the message.
+            calls (str): The kind of calls in the message.
+        """
+        stats = component.get_cache_stats()
+        avoided = stats["hits"] - cache_hits
+        print(f"{cache} cache avoided {avoided} {calls} calls.")
+        self.metrics.record_cache(cache.lower(), stats)
+
+    def report_usage(self):
+        """
+        Prints the tokens and cost of the run so far, in total and by stage.
+        """
+        usage = self.usage.summary()
+
+        for name, totals in [("Total", usage), *usage["stages"].items()]:
+            print(
+                f"{name} usage: {totals['calls']} calls, {totals['prompt_tokens']} prompt tokens, "
+                f"{totals['completion_tokens']} completion tokens, ${totals['cost']:.4f}"
+            )
+
+    def dump_metrics(self, path=None):
+        """
+        Writes the metrics of the run (with the hit rates of the response caches) to a file,
+        as JSON if its name ends with .json and in the Prometheus text format otherwise.
+
+        Args:
+            path: The file to write (configs.metrics_path by default; nothing is written if both are None).
+        """
+        path = path or configs.metrics_path
+
+        for stage, component in [
+            ("extraction", self.atomic_fact_generator),
+            ("verification", self.fact_scorer),
+        ]:
+            cache = getattr(component.openai_agent, "cache", None)
+
+            if cache is not None:
+                self.metrics.record_cache(f"{stage}_response", cache.stats())
+
+        if path is not None:
+            self.metrics.dump(path)
+
+    def get_prompt_stats(self) -> dict:
+        """
+        Returns the estimated tokens of the static prompt prefixes (instructions and demonstrations)
+        of each stage. They are repeated by every request, so they are what prompt caching can save.
+
+        Returns:
+            dict: The prefix tokens by prefix name, for the extraction and verification stages.
+        """
+        return {
+            "extraction": self.atomic_fact_generator.get_prompt_stats(),
+            "verification": self.fact_scorer.get_prompt_stats(),
+        }
+
+    def report_prompt_stats(self):
+        """
+        Prints the estimated tokens of the static prompt prefixes of each stage.
+        """
+        for stage, prefixes in self.get_prompt_stats().items():
+            print(f"Static {stage} prompt prefixes (tokens): {prefixes}")
+
+    def get_decisions_entry(
+        self, key: str, entry: dict, decision: list, knowledge_source: str
+    ) -> dict:
+        """
+        Builds the saved decisions entry of a generation.
+        The entry also holds a hash of the (generation, knowledge source) pair and of the model
+        settings, so merge_shards can match it to the input records and to the settings of a run.
+
+        Args:
+            key (str): The decisions key of the generation.
+            entry (dict): The generation-facts pair of the generation.
+            decision (list): The decision of each fact of the generation.
+            knowledge_source (str): The knowledge source the facts were scored against.
+
+        Returns:
+            dict: The generation-decision dictionary.
+        """
+        assert len(entry["facts"]) == len(
+            decision
+        ), "Number of facts and decisions for that generation should be the same."
+
+        return {
+            "key": key,
+            "generation": entry["generation"],
+            "decision": decision,
+            "pair": make_key(entry["generation"], knowledge_source),
+            "config": self.get_config_key(),
+        }
+
+    def get_scores(self, decisions: list) -> tuple:
+        """
+        Calculates the scores of a list of generation decisions.
+
+        Args:
+            decisions (list): A list of generation-decision dictionaries.
+
+        Returns:
+            tuple: A tuple containing the scores and the initial scores.
+        """
+        scores = []
+        init_scores = []
+
+        for entry in decisions:
+            score, init_score = self.calculate_score(entry["decision"])
+            init_scores.append(init_score)
+            scores.append(score)
+
         return scores, init_scores
 
     def get_factscore(
@@ -144,20 +735,559 @@ class FactScore:
         """
         Extracts atomic facts from generations and scores them based on the knowledge sources.
         A penalty is applied to the score if the number of atomic facts is lower than gamma.
+        With pipeline set, the facts of a generation are verified while the next generations
+        are still being decomposed (see iter_factscore), and the states are saved in completion order.
+
+        Args:
+            generations (list): A list of generations to extract atomic facts from.
+            knowledge_sources (list): A list of knowledge sources to score the atomic facts.
+
+        Returns:
+            tuple: A tuple containing the average score, and average initial scores (before applying gamma penalty).
+
+        Raises:
+            BudgetExceeded: Once max_tokens or max_cost is spent. The results so far are saved,
+                so a later run resumes from them.
+        """
+
+        scores, init_scores = self.get_generation_scores(generations, knowledge_sources)
+        return mean(scores), mean(init_scores)
+
+    def get_generation_scores(
+        self,
+        generations: list,
+        knowledge_sources: list,
+    ) -> tuple:
+        """
+        Same as get_factscore, but returns the scores of each generation
+        (e.g. to combine the runs of several shards, see FactScoreLite.sharding).
+
+        Args:
+            generations (list): A list of generations to extract atomic facts from.
+            knowledge_sources (list): A list of knowledge sources to score the atomic facts.
+
+        Returns:
+            tuple: A tuple containing the scores and the initial scores, in input order.
+        """
+        assert len(generations) == len(
+            knowledge_sources
+        ), "`generations` and `knowledge_sources` should have the same length."
+
+        if self.pipeline:
+            print("Extracting and scoring facts...")
+            scores, init_scores = self.get_pipeline_scores(
+                tqdm(
+                    self.iter_factscore(zip(generations, knowledge_sources)),
+                    total=len(generations),
+                )
+            )
+        else:
+            facts = self.get_facts(generations)
+            scores, init_scores = self.get_decisions(facts, knowledge_sources)
+
+        self.report_prompt_stats()
+        self.report_usage()
+        self.dump_metrics()
+
+        return scores, init_scores
+
+    async def aget_factscore(
+        self,
+        generations: list,
+        knowledge_sources: list,
+    ) -> tuple:
+        """
+        Async version of get_factscore. Requests are sent concurrently,
+        with at most max_concurrency of them in flight per stage.
+
+        Args:
+            generations (list): A list of generations to extract atomic facts from.
+            knowledge_sources (list): A list of knowledge sources to score the atomic facts.
+
+        Returns:
+            tuple: A tuple containing the average score, and average initial scores (before applying gamma penalty).
+
+        Raises:
+            BudgetExceeded: Once max_tokens or max_cost is spent. The results so far are saved,
+                so a later run resumes from them.
+        """
+
+        assert len(generations) == len(
+            knowledge_sources
+        ), "`generations` and `knowledge_sources` should have the same length."
+
+        if self.pipeline:
+            print("Extracting and scoring facts...")
+            scores, init_scores = self.get_pipeline_scores(
+                [
+                    result
+                    async for result in self.aiter_factscore(
+                        zip(generations, knowledge_sources)
+                    )
+                ]
+            )
+        else:
+            facts = await self.aget_facts(generations)
+            scores, init_scores = await self.aget_decisions(facts, knowledge_sources)
+
+        self.report_prompt_stats()
+        self.report_usage()
+        self.dump_metrics()
+
+        return mean(scores), mean(init_scores)
+
+    def iter_factscore(self, items) -> dict:
+        """
+        Streaming version of get_factscore: scores (generation, knowledge source) pairs
+        and yields the result of each pair as soon as it is scored, with the running corpus aggregate.
+        The pairs go through the pipeline of get_pipeline_stages, so the facts of a generation
+        are verified while the next generations are still being split and decomposed.
+        The items are consumed lazily (any iterable, e.g. a generator reading a file) and
+        their facts and decisions are saved to the state as they finish, so saved pairs are not sent again.
+
+        Args:
+            items (iterable): (generation, knowledge source) pairs.
+
+        Yields:
+            dict: The index of the pair, its generation, facts, decision, score and initial score
+                (before applying gamma penalty), and the aggregate (count, mean score and mean initial score)
+                of the pairs yielded so far. The results come in completion order.
+
+        Raises:
+            BudgetExceeded: Once max_tokens or max_cost is spent. The results so far are saved,
+                so a later run resumes from them.
+        """
+        saved_facts, saved_decisions = self.load_saved()
+        aggregate = {"count": 0, "score": 0.0, "init_score": 0.0}
+
+        try:
+            for index, (facts, decisions) in staged_map(
+                self.get_pipeline_stages(saved_facts, saved_decisions),
+                items,
+                self.queue_size,
+            ):
+                yield self.get_result(index, facts, decisions, aggregate)
+
+        finally:
+            with self.metrics.time("checkpointing"):
+                self.facts_handler.flush()
+                self.decisions_handler.flush()
+
+            self.dump_metrics()
+
+    async def aiter_factscore(self, items):
+        """
+        Async version of iter_factscore. The stages run on tasks, with at most
+        max_concurrency requests in flight per stage.
+
+        Args:
+            items (iterable): (generation, knowledge source) pairs, as an iterable or an async iterable.
+
+        Yields:
+            dict: The result of a pair, as yielded by iter_factscore.
+
+        Raises:
+            BudgetExceeded: Once max_tokens or max_cost is spent. The results so far are saved,
+                so a later run resumes from them.
+        """
+        saved_facts, saved_decisions = self.load_saved()
+        aggregate = {"count": 0, "score": 0.0, "init_score": 0.0}
+
+        try:
+            async for index, (facts, decisions) in astaged_map(
+                self.get_pipeline_stages(saved_facts, saved_decisions, is_async=True),
+                items,
+                self.queue_size,
+            ):
+                yield self.get_result(index, facts, decisions, aggregate)
+
+        finally:
+            with self.metrics.time("checkpointing"):
+                self.facts_handler.flush()
+                self.decisions_handler.flush()
+
+            self.dump_metrics()
+
+    def get_pipeline_stages(
+        self, saved_facts: SavedEntries, saved_decisions: SavedEntries, is_async=False
+    ) -> list:
+        """
+        Builds the stages of the pipeline: sentence splitting, extraction and verification,
+        each with its number of workers (stage_workers). A generation with saved facts
+        skips the first two stages and one with saved decisions skips all of them.
+
+        Args:
+            saved_facts (SavedEntries): The saved facts (added to as generations are decomposed).
+            saved_decisions (SavedEntries): The saved decisions (added to as generations are scored).
+            is_async (bool): Whether to build async stages.
+
+        Returns:
+            list: The (func, workers) pair of each stage, for staged_map or astaged_map.
+        """
+        if is_async:
+            funcs = [
+                lambda item: asyncio.to_thread(self.split_item, item, saved_facts),
+                lambda state: self.aextract_item(state, saved_facts),
+                lambda state: self.averify_item(state, saved_decisions),
+            ]
+        else:
+            funcs = [
+                lambda item: self.split_item(item, saved_facts),
+                lambda state: self.extract_item(state, saved_facts),
+                lambda state: self.verify_item(state, saved_decisions),
+            ]
+
+        return [
+            (func, self.stage_workers[stage])
+            for func, stage in zip(funcs, ["splitting", "extraction", "verification"])
+        ]
+
+    def split_item(self, item: tuple, saved_facts: SavedEntries) -> dict:
+        """
+        Splits the generation of a pair into sentences, unless its facts are saved.
+
+        Args:
+            item (tuple): The (generation, knowledge source) pair.
+            saved_facts (SavedEntries): The saved facts.
+
+        Returns:
+            dict: The state of the pair through the pipeline.
+        """
+        generation, knowledge_source = item
+        key = self.get_facts_key(generation)
+        state = {
+            "key": key,
+            "generation": generation,
+            "knowledge_source": knowledge_source,
+            "facts": saved_facts.get(key),
+        }
+
+        if state["facts"] is None:
+            state["sentences"] = self.atomic_fact_generator.split_sentences(generation)
+
+        return state
+
+    def extract_item(self, state: dict, saved_facts: SavedEntries) -> dict:
+        """
+        Extracts and saves the atomic facts of the sentences of a pair, unless its facts are saved.
+
+        Args:
+            state (dict): The state of the pair, from split_item.
+            saved_facts (SavedEntries): The saved facts.
+
+        Returns:
+            dict: The state of the pair, with its generation-facts pair dictionary.
+        """
+        if state["facts"] is None:
+            with track_generation(state["key"]):
+                atoms = self.atomic_fact_generator.get_sentences_af(state["sentences"])
+
+            state["facts"] = self.checkpoint(
+                self.get_facts_entry(
+                    state["key"], state["generation"], zip(state["sentences"], atoms)
+                ),
+                saved_facts,
+            )
+
+        return state
+
+    async def aextract_item(self, state: dict, saved_facts: SavedEntries) -> dict:
+        """
+        Async version of extract_item. With stream_extraction, see astream_item.
+        """
+        if state["facts"] is None and self.stream_extraction:
+            await self.astream_item(state, saved_facts)
+        elif state["facts"] is None:
+            with track_generation(state["key"]):
+                atoms = await self.atomic_fact_generator.aget_sentences_af(
+                    state["sentences"]
+                )
+
+            state["facts"] = self.checkpoint(
+                self.get_facts_entry(
+                    state["key"], state["generation"], zip(state["sentences"], atoms)
+                ),
+                saved_facts,
+            )
+
+        return state
+
+    async def astream_item(self, state: dict, saved_facts: SavedEntries):
+        """
+        Extracts the atomic facts of a pair from the streamed extraction outputs and scores
+        each fact as soon as it is streamed, so the pair is scored about when its slowest
+        fact is, instead of after all its sentences and then all its facts.
+        The decisions are left in the state for averify_item.
+
+        Args:
+            state (dict): The state of the pair, from split_item.
+            saved_facts (SavedEntries): The saved facts.
+        """
+        decisions = {}
+
+        def on_fact(fact):
+            if fact not in decisions:
+                decisions[fact] = asyncio.ensure_future(
+                    self.fact_scorer.aget_score([fact], state["knowledge_source"])
+                )
+
+        with track_generation(state["key"]):
+            try:
+                atoms = await self.atomic_fact_generator.astream_sentences_af(
+                    state["sentences"], on_fact
+                )
+                state["facts"] = self.checkpoint(
+                    self.get_facts_entry(
+                        state["key"],
+                        state["generation"],
+                        zip(state["sentences"], atoms),
+                    ),
+                    saved_facts,
+                )
+
+                for fact in state["facts"]["facts"]:
+                    on_fact(fact)
+
+                state["decision"] = [
+                    (await decisions[fact])[0] for fact in state["facts"]["facts"]
+                ]
+
+            finally:
+                # Do not leave requests running if a fact failed
+                for task in decisions.values():
+                    task.cancel()
+
+    def verify_item(self, state: dict, saved_decisions: SavedEntries) -> tuple:
+        """
+        Scores and saves the facts of a pair, unless its decisions are saved.
+
+        Args:
+            state (dict): The state of the pair, from extract_item.
+            saved_decisions (SavedEntries): The saved decisions.
+
+        Returns:
+            tuple: The generation-facts pair and the generation-decision dictionaries.
+        """
+        key = self.get_decisions_key(
+            state["generation"], state["knowledge_source"], state["facts"]["facts"]
+        )
+        decisions = saved_decisions.get(key)
+
+        if decisions is None:
+            decision = self.score_generation(state["facts"], state["knowledge_source"])
+            decisions = self.checkpoint(
+                self.get_decisions_entry(
+                    key, state["facts"], decision, state["knowledge_source"]
+                ),
+                saved_decisions,
+            )
+
+        return state["facts"], decisions
+
+    async def averify_item(self, state: dict, saved_decisions: SavedEntries) -> tuple:
+        """
+        Async version of verify_item.
+        """
+        key = self.get_decisions_key(
+            state["generation"], state["knowledge_source"], state["facts"]["facts"]
+        )
+        decisions = saved_decisions.get(key)
+
+        if decisions is None:
+            # Facts streamed by astream_item are already scored
+            decision = state.get("decision")
+
+            if decision is None:
+                decision = await self.ascore_generation(
+                    state["facts"], state["knowledge_source"]
+                )
+
+            decisions = self.checkpoint(
+                self.get_decisions_entry(
+                    key, state["facts"], decision, state["knowledge_source"]
+                ),
+                saved_decisions,
+            )
+
+        return state["facts"], decisions
+
+    def checkpoint(self, entry: dict, saved: SavedEntries) -> dict:
+        """
+        Saves an entry of the pipeline, unless an entry with the same key
+        (e.g. a duplicated generation) was saved in the meantime.
+
+        Args:
+            entry (dict): The facts or decisions entry.
+            saved (SavedEntries): The saved entries of its state.
+
+        Returns:
+            dict: The saved entry of the key.
+        """
+        with self.metrics.time("checkpointing"):
+            return saved.add(entry)
+
+    def load_saved(self) -> tuple:
+        """
+        Loads the saved facts and decisions of the pipeline by key
+        (decisions saved without a key cannot be matched to a pair and are ignored).
+        SQLite states are looked up on demand instead of being loaded.
+
+        Returns:
+            tuple: The saved facts and the saved decisions (SavedEntries).
+        """
+        saved = []
+
+        for handler, legacy_key in [
+            (
+                self.facts_handler,
+                lambda i, entry: self.get_facts_key(entry["generation"]),
+            ),
+            (self.decisions_handler, lambda i, entry: None),
+        ]:
+            if hasattr(handler, "get_by_key"):
+                if len(handler) == 0:
+                    # Imports the JSON/JSONL state of the run, if any
+                    handler.load()
+
+                saved.append(SavedEntries(handler))
+            else:
+                saved.append(
+                    SavedEntries(handler, self.load_state(handler, legacy_key))
+                )
+
+        return tuple(saved)
+
+    def get_result(
+        self, index: int, facts: dict, decisions: dict, aggregate: dict
+    ) -> dict:
+        """
+        Builds the result of a scored pair and adds its scores to the running aggregate.
+
+        Args:
+            index (int): The position of the pair in the input.
+            facts (dict): The generation-facts pair dictionary.
+            decisions (dict): The generation-decision dictionary.
+            aggregate (dict): The running count and mean scores (updated).
+
+        Returns:
+            dict: The result of the pair.
+        """
+        score, init_score = self.calculate_score(decisions["decision"])
+        count = aggregate["count"] + 1
+        aggregate["score"] += (float(score) - aggregate["score"]) / count
+        aggregate["init_score"] += (float(init_score) - aggregate["init_score"]) / count
+        aggregate["count"] = count
+
+        return {
+            "index": index,
+            "generation": facts["generation"],
+            "facts": facts["facts"],
+            "decision": decisions["decision"],
+            "score": float(score),
+            "init_score": float(init_score),
+            "aggregate": dict(aggregate),
+        }
+
+    def get_pipeline_scores(self, results) -> tuple:
+        """
+        Collects the scores of the pipeline results in input order.
+
+        Args:
+            results (list): The results yielded by iter_factscore or aiter_factscore.
+
+        Returns:
+            tuple: A tuple containing the scores and the initial scores.
+        """
+        results = sorted(results, key=lambda result: result["index"])
+
+        return (
+            [result["score"] for result in results],
+            [result["init_score"] for result in results],
+        )
+
+    def get_factscore_batch(
+        self,
+        generations: list,
+        knowledge_sources: list,
+        batch_runner: BatchRunner = None,
+    ) -> tuple:
+        """
+        Batch API version of get_factscore, for large offline runs at the batch price.
+        All extraction requests are submitted as batches and, once they are ingested,
+        all verification requests; the results are saved to the usual facts and decisions state.
+        Both phases resume from the batches recorded in the batch directory.
+        Sentences are not packed since each batch request is billed on its own,
+        and requests that failed in a batch are sent one by one.
 
         Args:
             generations (list): A list of generations to extract atomic facts from.
             knowledge_sources (list): A list of knowledge sources to score the atomic facts.
+            batch_runner (BatchRunner): The runner submitting the batches (configs.batch_dir by default).
 
         Returns:
             tuple: A tuple containing the average score, and average initial scores (before applying gamma penalty).
+
+        Raises:
+            BudgetExceeded: Once max_tokens or max_cost is spent. The results so far are saved,
+                so a later run resumes from them.
+            ValueError: If the FactScore has a backend.
         """
 
         assert len(generations) == len(
             knowledge_sources
         ), "`generations` and `knowledge_sources` should have the same length."
 
-        facts = self.get_facts(generations)
-        scores, init_scores = self.get_decisions(facts, knowledge_sources)
+        if self.backend is not None:
+            raise ValueError("The Batch API mode only works with the OpenAI agents.")
+
+        batch_runner = batch_runner if batch_runner is not None else BatchRunner()
+
+        keys = [self.get_facts_key(generation) for generation in generations]
+        saved = self.load_state(
+            self.facts_handler,
+            lambda i, entry: self.get_facts_key(entry["generation"]),
+        )
+        missing = self.get_missing(keys, generations, saved)
+        # Packed prompts would not match the single sentence requests of the batches
+        generator = self.atomic_fact_generator
+        pack_token_budget, self.pack_token_budget = self.pack_token_budget, None
+        generator_budget, generator.pack_token_budget = (
+            generator.pack_token_budget,
+            None,
+        )
+        agent = generator.openai_agent
+
+        # The agents read the ingested responses, then get their own caches back
+        try:
+            with batch_runner.attach(agent):
+                batch_runner.run(
+                    "extraction",
+                    generator.get_requests([generation for _, generation in missing]),
+                    agent,
+                )
+                facts = self.get_facts(generations)
+        finally:
+            self.pack_token_budget = pack_token_budget
+            generator.pack_token_budget = generator_budget
+
+        _, _, missing = self.load_decisions(facts, knowledge_sources)
+        agent = self.fact_scorer.openai_agent
+
+        with batch_runner.attach(agent):
+            batch_runner.run(
+                "verification",
+                [
+                    request
+                    for _, (entry, knowledge_source) in missing
+                    for request in self.fact_scorer.get_requests(
+                        entry["facts"], knowledge_source
+                    )
+                ],
+                agent,
+            )
+            scores, init_scores = self.get_decisions(facts, knowledge_sources)
+        self.report_prompt_stats()
+        self.report_usage()
+        self.dump_metrics()
 
-        return np.mean(scores), np.mean(init_scores)
+        return mean(scores), mean(init_scores)
@@ -0,0 +1,299 @@
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from . import configs
+
+# Prefix of the exported metric names
+PREFIX = "factscore_"
+
+# Help text of the metrics recorded by the pipeline
+DESCRIPTIONS = {
+    "stage_seconds": "Wall time spent in each stage (LLM calls include retries and cache hits).",
+    "in_flight": "LLM calls in flight.",
+    "retries_total": "Retried LLM requests.",
+    "rate_limited_total": "LLM requests rejected with a 429 (rate limit) error.",
+    "errors_total": "Failed LLM requests by error type.",
+    "cache_hits": "Hits of each cache.",
+    "cache_misses": "Misses of each cache.",
+    "cache_hit_rate": "Hit rate of each cache.",
+}
+
+
+def get_labels_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(labels: tuple, extra: dict = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+
+    if not items:
+        return ""
+
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+
+    return repr(float(value))
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms of a run, by name and labels.
+    Every observation is also passed to the callbacks as (kind, name, value, labels),
+    and the current values can be exported as JSON or in the Prometheus text format.
+    """
+
+    def __init__(self, callbacks: list = None, buckets: list = None):
+        self.callbacks = list(callbacks or [])
+        # Upper bounds (seconds) of the histogram buckets
+        self.buckets = sorted(buckets or configs.metrics_buckets)
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """
+        Registers a function called with (kind, name, value, labels) on every observation.
+
+        Args:
+            callback (callable): The function.
+        """
+        self.callbacks.append(callback)
+
+    def notify(self, kind: str, name: str, value: float, labels: dict):
+        for callback in self.callbacks:
+            callback(kind, name, value, labels)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """
+        Adds to a counter.
+
+        Args:
+            name (str): The name of the counter.
+            value (float): The amount to add.
+            **labels: The labels of the counter.
+        """
+        key = (name, get_labels_key(labels))
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+        self.notify("counter", name, value, labels)
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """
+        Sets a gauge.
+
+        Args:
+            name (str): The name of the gauge.
+            value (float): Its new value.
+            **labels: The labels of the gauge.
+        """
+        with self.lock:
+            self.gauges[(name, get_labels_key(labels))] = value
+
+        self.notify("gauge", name, value, labels)
+
+    def add_gauge(self, name: str, value: float, **labels):
+        """
+        Adds to a gauge (e.g. +1 when a call starts and -1 when it ends).
+
+        Args:
+            name (str): The name of the gauge.
+            value (float): The amount to add.
+            **labels: The labels of the gauge.
+        """
+        key = (name, get_labels_key(labels))
+
+        with self.lock:
+            self.gauges[key] = current = self.gauges.get(key, 0) + value
+
+        self.notify("gauge", name, current, labels)
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        Adds an observation to a histogram.
+
+        Args:
+            name (str): The name of the histogram.
+            value (float): The observed value.
+            **labels: The labels of the histogram.
+        """
+        key = (name, get_labels_key(labels))
+
+        with self.lock:
+            histogram = self.histograms.get(key)
+
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    "buckets": [0] * len(self.buckets),
+                    "count": 0,
+                    "sum": 0.0,
+                }
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+                    break
+
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+        self.notify("histogram", name, value, labels)
+
+    @contextlib.contextmanager
+    def time(self, stage: str):
+        """
+        Observes the wall time of the block in the stage_seconds histogram.
+
+        Args:
+            stage (str): The stage of the block.
+        """
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage)
+
+    @contextlib.contextmanager
+    def track_call(self, stage: str):
+        """
+        Times an LLM call of a stage and counts it in the in_flight gauge while it runs.
+
+        Args:
+            stage (str): The stage of the call.
+        """
+        self.add_gauge("in_flight", 1, stage=stage)
+
+        try:
+            with self.time(stage):
+                yield
+        finally:
+            self.add_gauge("in_flight", -1, stage=stage)
+
+    def record_cache(self, cache: str, stats: dict):
+        """
+        Sets the gauges of a cache from its counters.
+
+        Args:
+            cache (str): The name of the cache.
+            stats (dict): Its hits, misses and hit rate.
+        """
+        self.set_gauge("cache_hits", stats["hits"], cache=cache)
+        self.set_gauge("cache_misses", stats["misses"], cache=cache)
+        self.set_gauge("cache_hit_rate", stats["hit_rate"], cache=cache)
+
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of the current values.
+
+        Returns:
+            dict: The counters, gauges and histograms, each a list of
+                {"name", "labels", ...} entries with their values.
+        """
+        with self.lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.counters.items()
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self.gauges.items()
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": dict(zip(self.buckets, histogram["buckets"])),
+                        "count": histogram["count"],
+                        "sum": histogram["sum"],
+                    }
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=4)
+
+    def to_prometheus(self) -> str:
+        """
+        Formats the current values in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, with cumulative histogram buckets.
+        """
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {DESCRIPTIONS.get(name, name)}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                header(name, "counter")
+                lines.append(
+                    f"{PREFIX}{name}{format_labels(labels)} {format_value(value)}"
+                )
+
+            for (name, labels), value in sorted(self.gauges.items()):
+                header(name, "gauge")
+                lines.append(
+                    f"{PREFIX}{name}{format_labels(labels)} {format_value(value)}"
+                )
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                header(name, "histogram")
+                cumulative = 0
+
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    cumulative += count
+                    le = {"le": format_value(bound)}
+                    lines.append(
+                        f"{PREFIX}{name}_bucket{format_labels(labels, le)} {cumulative}"
+                    )
+
+                if self.buckets[-1] != math.inf:
+                    le = {"le": "+Inf"}
+                    lines.append(
+                        f"{PREFIX}{name}_bucket{format_labels(labels, le)} {histogram['count']}"
+                    )
+
+                lines.append(
+                    f"{PREFIX}{name}_sum{format_labels(labels)} {format_value(histogram['sum'])}"
+                )
+                lines.append(
+                    f"{PREFIX}{name}_count{format_labels(labels)} {histogram['count']}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """
+        Writes the metrics to a file, as JSON if its name ends with .json and in the
+        Prometheus text format otherwise (e.g. for the node exporter's textfile collector).
+        The file is replaced atomically, so a scraper never reads a partial dump.
+
+        Args:
+            path: The file to write.
+        """
+        path = Path(path)
+        text = self.to_json() if path.suffix == ".json" else self.to_prometheus()
+        tmp_path = path.with_name(path.name + ".tmp")
+
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+        os.replace(tmp_path, path)
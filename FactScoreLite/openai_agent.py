@@ -1,85 +1,447 @@
-from openai import OpenAI
-from openai import (
-    RateLimitError,
-)
-import time
-import logging
-import random
+import asyncio
+import threading
 from . import configs
+from .cache import DiskCache, make_key, get_response_cache
+from .usage import UsageStats
+from .rate_limit import RateLimiter, get_rate_limiter
+from .retry import RetryPolicy, get_retry_policy
+from .metrics import Metrics
 
+# Sync clients shared by the agents of the process, by factory
+CLIENTS = {}
+CLIENTS_LOCK = threading.Lock()
 
-# define a retry decorator
-def retry_with_exponential_backoff(
-    func,
-    initial_delay: float = 1,
-    exponential_base: float = 2,
-    jitter: bool = True,
-    max_retries: int = 10,
-    errors: tuple = (RateLimitError,),
-):
-    """Retry a function with exponential backoff."""
-
-    def wrapper(*args, **kwargs):
-        # Initialize variables
-        num_retries = 0
-        delay = initial_delay
-
-        # Loop until a successful response or max_retries is hit or an exception is raised
-        while True:
-            try:
-                logging.info(f"Attempting to call {func.__name__}")
-                return func(*args, **kwargs)
 
-            # Retry on specific errors
-            except errors as e:
-                # Increment retries
-                num_retries += 1
+def OpenAI(**kwargs):
+    """
+    Builds an openai.OpenAI client. openai takes most of the import time of the package,
+    so it is only imported when the first client is built.
+    """
+    import openai
 
-                if num_retries > max_retries:
-                    logging.error(
-                        f"Maximum number of retries ({max_retries}) exceeded for {func.__name__}."
-                    )
-                    raise Exception(
-                        f"Maximum number of retries ({max_retries}) exceeded."
-                    )
+    return openai.OpenAI(**kwargs)
 
-                logging.warning(
-                    f"Retry #{num_retries} for {func.__name__} after encountering {e}. Waiting {delay} seconds before retrying..."
-                )
-                # Increment the delay
-                delay *= exponential_base * (1 + jitter * random.random())
 
-                # Sleep for the delay
-                time.sleep(delay)
+def AsyncOpenAI(**kwargs):
+    """
+    Builds an openai.AsyncOpenAI client, importing openai on first use (see OpenAI).
+    """
+    import openai
 
-            # Raise exceptions for any errors not specified
-            except Exception as e:
-                logging.exception(f"Unexpected exception during {func.__name__}: {e}")
-                raise e
+    return openai.AsyncOpenAI(**kwargs)
+
+
+def get_client():
+    """
+    Returns the sync OpenAI client of the process, built on first use.
+    The client is thread-safe and pools its connections, so every agent shares it.
+
+    Returns:
+        openai.OpenAI: The client.
+    """
+    with CLIENTS_LOCK:
+        if OpenAI not in CLIENTS:
+            CLIENTS[OpenAI] = OpenAI()
+
+        return CLIENTS[OpenAI]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheaply estimates the number of tokens of a text (about 4 characters per token).
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return len(text) // 4 + 1
+
+
+def get_messages(prompt: str, system: str = None) -> list:
+    """
+    Builds the chat messages of a prompt.
+
+    Args:
+        prompt (str): The user message.
+        system (str): The static prefix of the prompt, sent as the system message.
+
+    Returns:
+        list: The chat messages.
+    """
+    messages = [{"role": "user", "content": prompt}]
+
+    if system is not None:
+        messages.insert(0, {"role": "system", "content": system})
+
+    return messages
+
+
+def record_usage(usage: UsageStats, stage: str, model_name: str, response):
+    """
+    Records the token usage reported in a chat completion response.
+
+    Args:
+        usage (UsageStats): The usage stats to record into (None skips recording).
+        stage (str): The stage that sent the request.
+        model_name (str): The model the request was sent to.
+        response: The chat completion response.
+    """
+    if usage is None or getattr(response, "usage", None) is None:
+        return
+
+    usage.record(
+        stage,
+        model_name,
+        int(response.usage.prompt_tokens or 0),
+        int(response.usage.completion_tokens or 0),
+    )
 
-    return wrapper
 
+def record_error(metrics: Metrics, stage: str, error: Exception):
+    """
+    Counts a failed request in the error and rate limit counters.
 
-class OpenAIAgent:
+    Args:
+        metrics (Metrics): The metrics to record into (None skips recording).
+        stage (str): The stage that sent the request.
+        error (Exception): The error of the request.
+    """
+    if metrics is None:
+        return
 
-    def __init__(self):
-        self.client = OpenAI()
+    metrics.increment("errors_total", stage=stage, type=type(error).__name__)
+
+    # Covers openai's RateLimitError without importing openai
+    if getattr(error, "status_code", None) == 429:
+        metrics.increment("rate_limited_total", stage=stage)
+
+
+class BaseOpenAIAgent:
+    """
+    The settings, response cache, budget, rate limiting and retries shared by OpenAIAgent
+    and AsyncOpenAIAgent, so both send the same requests and share their cached responses.
+    """
+
+    def __init__(
+        self,
+        cache: DiskCache = None,
+        usage: UsageStats = None,
+        stage: str = None,
+        rate_limiter: RateLimiter = None,
+        retry_policy: RetryPolicy = None,
+        metrics: Metrics = None,
+    ):
+        # Built by the first request (see create_client), so openai is only imported then
+        self._client = None
         self.max_tokens = configs.max_tokens
         self.temp = configs.temp
         self.model_name = configs.model_name
+        # Opt-in response cache (configs.cache_path)
+        self.cache = cache if cache is not None else get_response_cache()
+        # Token accounting and budget of the run (None disables them)
+        self.usage = usage
+        self.stage = stage
+        # Client-side RPM/TPM limiter shared by the process (configs.requests_per_minute,
+        # configs.tokens_per_minute)
+        self.rate_limiter = (
+            rate_limiter
+            if rate_limiter is not None
+            else get_rate_limiter(self.model_name)
+        )
+        # Errors, retries and rate limits of the requests (None disables them)
+        self.metrics = metrics
+        # Retries of transient errors, paused together by the process circuit breaker
+        self.retry_policy = (
+            retry_policy
+            if retry_policy is not None
+            else get_retry_policy(self.record_retry if metrics is not None else None)
+        )
+
+    def create_client(self):
+        raise NotImplementedError
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.create_client()
+
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def record_retry(self, name: str, error: Exception, retries: int, delay: float):
+        self.metrics.increment("retries_total", stage=self.stage)
+
+    def check_budget(self):
+        """
+        Raises BudgetExceeded if the budget of the run is spent, so no new request is sent.
+        """
+        if self.usage is not None:
+            self.usage.check_budget()
 
-    @retry_with_exponential_backoff
-    def generate(self, prompt):
-        response = self.client.chat.completions.create(
+    def get_cache_key(self, prompt: str, system: str = None) -> str:
+        """
+        Builds the response cache key of a prompt for the current model settings.
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Returns:
+            str: The cache key.
+        """
+        if system is None:
+            return make_key(self.model_name, self.temp, self.max_tokens, prompt)
+
+        return make_key(self.model_name, self.temp, self.max_tokens, system, prompt)
+
+    def estimate_request_tokens(self, prompt: str, system: str = None) -> int:
+        """
+        Estimates the tokens a request counts against the tokens/min quota
+        (its prompt and max_tokens for the completion).
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Returns:
+            int: The estimated tokens.
+        """
+        return estimate_tokens(prompt) + estimate_tokens(system or "") + self.max_tokens
+
+    def get_request_kwargs(self, prompt: str, system: str = None) -> dict:
+        """
+        Builds the chat completion arguments of a prompt.
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Returns:
+            dict: The arguments.
+        """
+        return dict(
             model=self.model_name,
-            messages=[{"role": "user", "content": prompt}],
+            messages=get_messages(prompt, system),
             max_tokens=self.max_tokens,
             temperature=self.temp,
+            timeout=configs.request_timeout,
         )
+
+
+class OpenAIAgent(BaseOpenAIAgent):
+
+    def create_client(self):
+        # The sync client is shared by the agents of the process
+        return get_client()
+
+    def generate(self, prompt, system=None):
+        # A cache hit skips both the network and the retries
+        if self.cache is None:
+            self.check_budget()
+            return self.retry_policy.call(self.request, prompt, system)
+
+        key = self.get_cache_key(prompt, system)
+        output = self.cache.get(key)
+
+        if output is None:
+            self.check_budget()
+            output = self.retry_policy.call(self.request, prompt, system)
+
+            if output is not None:
+                self.cache.set(key, output)
+
+        return output
+
+    def request(self, prompt, system=None):
+        kwargs = self.get_request_kwargs(prompt, system)
+
+        try:
+            if self.rate_limiter is None:
+                response = self.client.chat.completions.create(**kwargs)
+            else:
+                # Wait for our share of the quota, then correct it with the server's view
+                self.rate_limiter.acquire(self.estimate_request_tokens(prompt, system))
+                raw_response = self.client.chat.completions.with_raw_response.create(
+                    **kwargs
+                )
+                self.rate_limiter.update(raw_response.headers)
+                response = raw_response.parse()
+        except Exception as e:
+            record_error(self.metrics, self.stage, e)
+            raise
+
+        record_usage(self.usage, self.stage, self.model_name, response)
+        return response.choices[0].message.content
+
+
+class AsyncOpenAIAgent(BaseOpenAIAgent):
+
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        cache: DiskCache = None,
+        usage: UsageStats = None,
+        stage: str = None,
+        rate_limiter: RateLimiter = None,
+        retry_policy: RetryPolicy = None,
+        metrics: Metrics = None,
+    ):
+        super().__init__(cache, usage, stage, rate_limiter, retry_policy, metrics)
+        # Maximum number of requests in flight at the same time
+        self.max_concurrency = max_concurrency or configs.max_concurrency
+        self.semaphore = None
+        self.semaphore_loop = None
+
+    def get_semaphore(self) -> asyncio.Semaphore:
+        """
+        Returns the semaphore bounding the requests in flight.
+        A new one is created for every event loop since semaphores cannot be shared between loops.
+
+        Returns:
+            asyncio.Semaphore: The semaphore of the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        if self.semaphore is None or self.semaphore_loop is not loop:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.semaphore_loop = loop
+
+        return self.semaphore
+
+    def create_client(self):
+        # Async clients are not shared: their connections belong to an event loop
+        return AsyncOpenAI()
+
+    async def generate(self, prompt, system=None):
+        # A cache hit skips the semaphore, the network and the retries
+        if self.cache is None:
+            self.check_budget()
+            return await self.retry_policy.acall(self.request, prompt, system)
+
+        key = self.get_cache_key(prompt, system)
+        output = self.cache.get(key)
+
+        if output is None:
+            self.check_budget()
+            output = await self.retry_policy.acall(self.request, prompt, system)
+
+            if output is not None:
+                self.cache.set(key, output)
+
+        return output
+
+    async def request(self, prompt, system=None):
+        kwargs = self.get_request_kwargs(prompt, system)
+
+        if self.rate_limiter is not None:
+            # Wait for our share of the quota before taking a slot
+            await self.rate_limiter.aacquire(
+                self.estimate_request_tokens(prompt, system)
+            )
+
+        # The slot is only held during the request, not while backing off
+        async with self.get_semaphore():
+            try:
+                if self.rate_limiter is None:
+                    response = await self.client.chat.completions.create(**kwargs)
+                else:
+                    raw_response = (
+                        await self.client.chat.completions.with_raw_response.create(
+                            **kwargs
+                        )
+                    )
+                    self.rate_limiter.update(raw_response.headers)
+                    response = raw_response.parse()
+            except Exception as e:
+                record_error(self.metrics, self.stage, e)
+                raise
+
+        record_usage(self.usage, self.stage, self.model_name, response)
         return response.choices[0].message.content
 
+    async def stream(self, prompt, system=None):
+        """
+        Streams the output of a prompt as it is generated. Only opening the stream is retried,
+        so no text is yielded twice; an error in the middle of the stream is raised.
+        A cached output is yielded at once, and the full output is cached at the end.
+        Like request, the stream only holds a slot of the semaphore from its successful opening
+        to its end, not while backing off; consume it under contextlib.aclosing so the slot
+        is released if the consumer stops early.
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Yields:
+            str: The chunks of the output.
+        """
+        key = self.get_cache_key(prompt, system) if self.cache is not None else None
+        output = self.cache.get(key) if key is not None else None
+
+        if output is not None:
+            yield output
+            return
+
+        self.check_budget()
+        chunks = []
+        response, semaphore = await self.retry_policy.acall(
+            self.open_stream, prompt, system
+        )
+
+        try:
+            async for chunk in response:
+                # The last chunk only carries the usage of the request
+                record_usage(self.usage, self.stage, self.model_name, chunk)
+
+                if chunk.choices and chunk.choices[0].delta.content:
+                    chunks.append(chunk.choices[0].delta.content)
+                    yield chunks[-1]
+        except Exception as e:
+            record_error(self.metrics, self.stage, e)
+            raise
+        finally:
+            semaphore.release()
+
+        if key is not None:
+            self.cache.set(key, "".join(chunks))
+
+    async def open_stream(self, prompt, system=None) -> tuple:
+        """
+        Sends a streamed request: waits for the rate limiter, then takes a slot of the semaphore,
+        which is released if the request fails and otherwise handed to stream.
+
+        Args:
+            prompt (str): The prompt.
+            system (str): The system message of the prompt.
+
+        Returns:
+            tuple: The stream of chat completion chunks and the semaphore holding its slot.
+        """
+        if self.rate_limiter is not None:
+            await self.rate_limiter.aacquire(
+                self.estimate_request_tokens(prompt, system)
+            )
+
+        semaphore = self.get_semaphore()
+        await semaphore.acquire()
+
+        try:
+            response = await self.client.chat.completions.create(
+                **self.get_request_kwargs(prompt, system),
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        except BaseException as e:
+            semaphore.release()
+
+            if isinstance(e, Exception):
+                record_error(self.metrics, self.stage, e)
+
+            raise
 
-# Ensure proper logging configuration
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
-)
+        return response, semaphore
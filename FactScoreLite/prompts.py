@@ -0,0 +1,97 @@
+import threading
+from .cache import make_key
+from .openai_agent import estimate_tokens
+
+# Demonstrations loaded by the components of the process, by path
+DEMONS = {}
+DEMONS_LOCK = threading.Lock()
+
+# Prompt prefixes built by the components of the process, by (inputs key, prefix name)
+PREFIXES = {}
+PREFIXES_LOCK = threading.Lock()
+
+
+def get_demons(path, load) -> list:
+    """
+    Returns the demonstrations of a file, loading them once per process.
+
+    Args:
+        path: The demonstrations file (the cache key).
+        load (callable): Loads the demonstrations on the first call.
+
+    Returns:
+        list: A copy of the demonstrations, so a component can change its own.
+    """
+    with DEMONS_LOCK:
+        if path not in DEMONS:
+            DEMONS[path] = load()
+
+        return list(DEMONS[path])
+
+
+def select_demon(key: str, num_demons: int, seed: int = 0) -> int:
+    """
+    Deterministically picks a demonstration for an item, so the same item always gets the same prompt.
+
+    Args:
+        key (str): The text identifying the item (e.g. the atomic fact).
+        num_demons (int): The number of demonstrations to pick from.
+        seed (int): The seed mixed into the hash.
+
+    Returns:
+        int: The index of the picked demonstration.
+    """
+    return int(make_key(seed, key), 16) % num_demons
+
+
+class PromptPrefixes:
+    """
+    The static prefixes (instructions and demonstrations) of the prompts of a component.
+    Each prefix is built once per process for the inputs identified by key (e.g. the component
+    and its demons) and sent as the system message, so every component with the same inputs
+    sends the very same prefix, for the response cache and the provider's prompt caching.
+    """
+
+    def __init__(self, key: str = None):
+        self.key = key
+        # The prefixes used by the component, for stats
+        self.prefixes = {}
+
+    def get(self, name: str, build) -> str:
+        """
+        Returns a prefix, building it on its first use in the process.
+
+        Args:
+            name (str): The name of the prefix.
+            build: A function returning the prefix.
+
+        Returns:
+            str: The prefix.
+        """
+        prefix = self.prefixes.get(name)
+
+        if prefix is not None:
+            return prefix
+
+        with PREFIXES_LOCK:
+            prefix = PREFIXES.get((self.key, name))
+
+        if prefix is None:
+            # Built outside the lock since build may get other prefixes;
+            # concurrent first uses build the same string and share the first one stored
+            prefix = build()
+
+            with PREFIXES_LOCK:
+                prefix = PREFIXES.setdefault((self.key, name), prefix)
+
+        self.prefixes[name] = prefix
+        return prefix
+
+    def stats(self) -> dict:
+        """
+        Returns the estimated number of tokens of each prefix used so far.
+
+        Returns:
+            dict: The prefix tokens by prefix name.
+        """
+        return {name: estimate_tokens(prefix) for name, prefix in self.prefixes.items()}
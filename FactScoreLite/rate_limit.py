@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+from . import configs
+
+
+class TokenBucket:
+    """
+    A bucket of limit units per minute, refilled continuously.
+    Reservations may take the level below zero; the caller then waits until
+    the bucket refills to zero, so callers are served in reservation order.
+    """
+
+    def __init__(self, limit: float = None):
+        self.limit = limit
+        self.level = limit
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.limit is not None:
+            self.level = min(
+                self.limit, self.level + (now - self.updated) * self.limit / 60
+            )
+
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes amount units out of the bucket (refill must be called first).
+
+        Args:
+            amount (float): The number of units.
+
+        Returns:
+            float: The seconds to wait before the units are available.
+        """
+        if self.limit is None:
+            return 0.0
+
+        # A request larger than the whole bucket waits for a full bucket
+        self.level -= min(amount, self.limit)
+
+        return max(0.0, -self.level * 60 / self.limit)
+
+    def update(self, limit: float = None, remaining: float = None):
+        """
+        Reconciles the bucket with the limits reported by the server.
+
+        Args:
+            limit (float): The limit per minute reported by the server.
+            remaining (float): The units the server says are left.
+        """
+        if limit is not None and (self.limit is None or limit < self.limit):
+            if self.limit is None:
+                self.level = limit
+
+            self.limit = limit
+
+        if remaining is not None and self.limit is not None:
+            # Responses arrive out of order, so only ever lower the local estimate
+            self.level = min(self.level, remaining)
+
+
+class RateLimiter:
+    """
+    A client-side limiter keeping requests under requests/min and tokens/min quotas.
+    Every request reserves one request and its estimated tokens before it is sent
+    and waits until both are available, so concurrent workers are spread over the minute
+    instead of all hitting the quota and backing off together.
+    """
+
+    def __init__(self, requests_per_minute: int = None, tokens_per_minute: int = None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserves a request of the given number of tokens.
+
+        Args:
+            tokens (int): The estimated tokens of the request.
+
+        Returns:
+            float: The seconds to wait before sending the request.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+
+            return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens: int):
+        """
+        Blocks the calling thread until a request of the given number of tokens can be sent.
+
+        Args:
+            tokens (int): The estimated tokens of the request.
+        """
+        wait = self.reserve(tokens)
+
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int):
+        """
+        Async version of acquire; only the calling coroutine waits.
+        """
+        wait = self.reserve(tokens)
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def update(self, headers):
+        """
+        Reconciles the limiter with the x-ratelimit-* headers of a response.
+
+        Args:
+            headers: The response headers.
+        """
+
+        def number(name):
+            value = headers.get(name)
+
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        with self.lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            self.requests.update(
+                number("x-ratelimit-limit-requests"),
+                number("x-ratelimit-remaining-requests"),
+            )
+            self.tokens.update(
+                number("x-ratelimit-limit-tokens"),
+                number("x-ratelimit-remaining-tokens"),
+            )
+
+
+# Limiters shared by every agent of the process, by model and limits
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name: str):
+    """
+    Returns the rate limiter of a model configured in configs, shared by the whole process.
+
+    Args:
+        model_name (str): The model the requests are sent to (quotas are per model).
+
+    Returns:
+        RateLimiter: The shared limiter, or None if no limit is configured.
+    """
+    rpm = configs.requests_per_minute
+    tpm = configs.tokens_per_minute
+
+    if rpm is None and tpm is None:
+        return None
+
+    with rate_limiters_lock:
+        key = (model_name, rpm, tpm)
+
+        if key not in rate_limiters:
+            rate_limiters[key] = RateLimiter(rpm, tpm)
+
+        return rate_limiters[key]
@@ -0,0 +1,196 @@
+import math
+import re
+from collections import Counter
+from .cache import MemoCache, make_key
+from . import configs
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits a text into lowercased word tokens for lexical matching.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        list: The word tokens of the text.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def chunk_text(text: str, chunk_size: int, overlap: int = 0) -> list:
+    """
+    Splits a text into passages of chunk_size words, consecutive passages sharing overlap words.
+    Line breaks inside a passage are kept.
+
+    Args:
+        text (str): The text to split.
+        chunk_size (int): The number of words per passage.
+        overlap (int): The number of words shared by consecutive passages.
+
+    Returns:
+        list: The passages in the order of the text.
+    """
+    assert chunk_size > overlap >= 0, "chunk_size must be larger than overlap."
+
+    # Words with their trailing whitespace so that passages keep the original layout
+    words = re.findall(r"\S+\s*", text)
+    step = chunk_size - overlap
+    passages = []
+
+    for start in range(0, len(words), step):
+        passages.append("".join(words[start : start + chunk_size]).strip())
+
+        if start + chunk_size >= len(words):
+            break
+
+    return passages
+
+
+class BM25Index:
+    """
+    An in-memory Okapi BM25 index over the passages of a knowledge source.
+    """
+
+    def __init__(self, passages: list, k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.term_frequencies = [Counter(tokenize(passage)) for passage in passages]
+        self.lengths = [sum(tf.values()) for tf in self.term_frequencies]
+        self.average_length = sum(self.lengths) / len(passages) if passages else 0.0
+
+        document_frequencies = Counter(
+            term for tf in self.term_frequencies for term in tf
+        )
+        self.idf = {
+            term: math.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+            for term, df in document_frequencies.items()
+        }
+
+    def score(self, query: str) -> list:
+        """
+        Scores every passage against a query.
+
+        Args:
+            query (str): The query (e.g. an atomic fact).
+
+        Returns:
+            list: The BM25 score of each passage.
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+
+        for tf, length in zip(self.term_frequencies, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+            scores.append(
+                sum(
+                    self.idf[term] * tf[term] * (self.k1 + 1) / (tf[term] + norm)
+                    for term in terms
+                    if term in tf
+                )
+            )
+
+        return scores
+
+    def search(self, query: str, k: int) -> list:
+        """
+        Finds the k passages most relevant to a query.
+
+        Args:
+            query (str): The query (e.g. an atomic fact).
+            k (int): The number of passages to return.
+
+        Returns:
+            list: The indices of the top-k passages, best first.
+        """
+        scores = self.score(query)
+        ranked = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+
+        return ranked[:k]
+
+
+class Retriever:
+    """
+    Narrows a knowledge source down to the passages relevant to some facts.
+    Every knowledge source is chunked and indexed once; the indexes are kept in an LRU
+    keyed by the hash of the source so that all facts of a source reuse them.
+    """
+
+    def __init__(
+        self,
+        top_k: int = None,
+        chunk_size: int = None,
+        chunk_overlap: int = None,
+        index_factory=BM25Index,
+        index_cache_size: int = None,
+    ):
+        self.top_k = top_k or configs.retrieval_top_k
+        self.chunk_size = chunk_size or configs.retrieval_chunk_size
+        self.chunk_overlap = (
+            chunk_overlap
+            if chunk_overlap is not None
+            else configs.retrieval_chunk_overlap
+        )
+        # Builds an index (with passages and search(query, k)) from a list of passages
+        self.index_factory = index_factory
+        self.indexes = MemoCache(index_cache_size or configs.retrieval_index_cache_size)
+
+    def get_index(self, knowledge_source: str):
+        """
+        Returns the index of a knowledge source, building it on first use.
+
+        Args:
+            knowledge_source (str): The knowledge source.
+
+        Returns:
+            The index over the passages of the knowledge source.
+        """
+        key = make_key(knowledge_source)
+        index = self.indexes.get(key)
+
+        if index is None:
+            passages = chunk_text(knowledge_source, self.chunk_size, self.chunk_overlap)
+            index = self.index_factory(passages)
+            self.indexes.set(key, index)
+
+        return index
+
+    def retrieve(self, facts: list, knowledge_source: str) -> str:
+        """
+        Builds the context of a prompt from the top-k passages of each fact.
+        The selected passages are joined in the order of the knowledge source.
+
+        Args:
+            facts (list): The facts the context has to verify.
+            knowledge_source (str): The knowledge source.
+
+        Returns:
+            str: The relevant passages, or the knowledge source itself if it fits in top_k passages.
+        """
+        index = self.get_index(knowledge_source)
+
+        if len(index.passages) <= self.top_k:
+            return knowledge_source
+
+        selected = set()
+        for atom in facts:
+            selected.update(index.search(atom, self.top_k))
+
+        return "\n...\n".join(index.passages[i] for i in sorted(selected))
+
+    def get_config(self) -> dict:
+        """
+        Returns the retrieval settings the prompts depend on.
+
+        Returns:
+            dict: The top k, the chunk size and overlap and the index type.
+        """
+        return {
+            "top_k": self.top_k,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "index": getattr(self.index_factory, "__name__", repr(self.index_factory)),
+        }
@@ -0,0 +1,377 @@
+import asyncio
+import functools
+import inspect
+import logging
+import random
+import sys
+import threading
+import time
+from . import configs
+
+# Status codes worth retrying besides 5xx responses
+TRANSIENT_STATUS_CODES = (408, 409, 429)
+
+
+def get_transient_errors() -> tuple:
+    """
+    Returns the errors worth retrying: rate limits, timeouts and connection errors
+    (APITimeoutError is an APIConnectionError); 5xx responses are APIStatusErrors
+    checked by status code. openai is imported here rather than with the module.
+
+    Returns:
+        tuple: The error types.
+    """
+    from openai import APIConnectionError, RateLimitError
+
+    return (RateLimitError, APIConnectionError)
+
+
+class RetryError(Exception):
+    """
+    Raised when a call still fails after all the retries (or its deadline).
+    The last error is chained as the cause.
+    """
+
+
+def get_retry_after(error: Exception) -> float:
+    """
+    Reads the delay the server asked for in the Retry-After headers of an error response.
+
+    Args:
+        error (Exception): The error raised by the client.
+
+    Returns:
+        float: The delay in seconds, or None if the server did not ask for one.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+
+    if headers is None:
+        return None
+
+    for name, scale in [("retry-after-ms", 0.001), ("retry-after", 1)]:
+        value = headers.get(name)
+
+        if isinstance(value, (str, int, float)):
+            try:
+                return float(value) * scale
+            except ValueError:
+                # HTTP dates are rare for this API; fall back to our own backoff
+                continue
+
+    return None
+
+
+class CircuitBreaker:
+    """
+    Pauses every caller together while the endpoint is unhealthy.
+    After threshold consecutive transient failures (or when the server asks for a
+    Retry-After) the circuit opens and all callers wait until it closes again,
+    instead of each one hammering the endpoint with its own backoff.
+    One more failure right after the pause opens it again.
+    """
+
+    def __init__(self, threshold: int = None, timeout: float = None):
+        self.threshold = threshold or configs.circuit_breaker_threshold
+        self.timeout = (
+            timeout if timeout is not None else configs.circuit_breaker_timeout
+        )
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    def get_wait(self) -> float:
+        """
+        Returns the seconds left until the circuit closes.
+        """
+        with self.lock:
+            return max(0.0, self.open_until - time.monotonic())
+
+    def wait(self):
+        """
+        Blocks the calling thread while the circuit is open.
+        """
+        wait = self.get_wait()
+
+        if wait > 0:
+            logging.warning(f"Circuit open, pausing requests for {wait:.1f} seconds.")
+            time.sleep(wait)
+
+    async def await_closed(self):
+        """
+        Async version of wait; only the calling coroutine waits.
+        """
+        wait = self.get_wait()
+
+        if wait > 0:
+            logging.warning(f"Circuit open, pausing requests for {wait:.1f} seconds.")
+            await asyncio.sleep(wait)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self, retry_after: float = None):
+        """
+        Counts a transient failure and opens the circuit if needed.
+
+        Args:
+            retry_after (float): The delay the server asked for, if any.
+        """
+        with self.lock:
+            self.failures += 1
+            pause = 0.0
+
+            if self.failures >= self.threshold:
+                pause = self.timeout
+
+            if retry_after is not None:
+                pause = max(pause, retry_after)
+
+            self.open_until = max(self.open_until, time.monotonic() + pause)
+
+
+class RetryPolicy:
+    """
+    Retries transient errors (rate limits, timeouts, connection errors and 5xx responses)
+    with capped, decorrelated jitter backoff, honoring the server's Retry-After.
+    A call gives up after max_retries retries or once its deadline (in seconds, retries included)
+    would be exceeded. With a circuit breaker the backoff is shared by every caller.
+    on_retry is called with (name, error, retries, delay) before every retry.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = None,
+        base_delay: float = None,
+        max_delay: float = None,
+        deadline: float = None,
+        circuit_breaker: CircuitBreaker = None,
+        errors: tuple = None,
+        on_retry=None,
+    ):
+        self.max_retries = (
+            max_retries if max_retries is not None else configs.max_retries
+        )
+        self.base_delay = (
+            base_delay if base_delay is not None else configs.retry_base_delay
+        )
+        self.max_delay = max_delay if max_delay is not None else configs.retry_max_delay
+        self.deadline = deadline if deadline is not None else configs.retry_deadline
+        self.circuit_breaker = circuit_breaker
+        # The retried error types (get_transient_errors by default, resolved on first use)
+        self._errors = errors
+        self.on_retry = on_retry
+
+    @property
+    def errors(self) -> tuple:
+        if self._errors is None:
+            self._errors = get_transient_errors()
+
+        return self._errors
+
+    @errors.setter
+    def errors(self, errors: tuple):
+        self._errors = errors
+
+    def is_retryable(self, error: Exception) -> bool:
+        """
+        Checks whether an error is transient.
+
+        Args:
+            error (Exception): The error raised by the call.
+
+        Returns:
+            bool: True for the retried error types and retryable status codes.
+        """
+        # openai errors can only have been raised if openai was imported
+        openai = sys.modules.get("openai")
+
+        if self._errors is None and openai is None:
+            return False
+
+        if isinstance(error, self.errors):
+            return True
+
+        if openai is not None and isinstance(error, openai.APIStatusError):
+            status_code = error.status_code
+            return status_code >= 500 or status_code in TRANSIENT_STATUS_CODES
+
+        return False
+
+    def get_delay(self, previous_delay: float, error: Exception) -> float:
+        """
+        Returns the delay before the next attempt: decorrelated jitter
+        (uniform between the base delay and three times the previous delay) capped at max_delay,
+        or the Retry-After of the server if it asked for longer.
+
+        Args:
+            previous_delay (float): The previous delay (the base delay before the first retry).
+            error (Exception): The error of the last attempt.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        delay = min(self.max_delay, random.uniform(self.base_delay, previous_delay * 3))
+        retry_after = get_retry_after(error)
+
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        return delay
+
+    def on_error(
+        self, name: str, error: Exception, retries: int, delay: float, start: float
+    ):
+        """
+        Decides what to do after a failed attempt.
+
+        Args:
+            name (str): The name of the call (for the logs).
+            error (Exception): The error of the attempt.
+            retries (int): The number of retries so far.
+            delay (float): The previous delay.
+            start (float): The monotonic time the call started.
+
+        Returns:
+            float: The delay before the next attempt.
+
+        Raises:
+            The error itself if it is not transient, RetryError if the call has to give up.
+        """
+        if not self.is_retryable(error):
+            logging.exception(f"Unexpected exception during {name}: {error}")
+            raise error
+
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_failure(get_retry_after(error))
+
+        if retries >= self.max_retries:
+            logging.error(
+                f"Maximum number of retries ({self.max_retries}) exceeded for {name}."
+            )
+            raise RetryError(
+                f"Maximum number of retries ({self.max_retries}) exceeded."
+            ) from error
+
+        delay = self.get_delay(delay, error)
+
+        if (
+            self.deadline is not None
+            and time.monotonic() - start + delay > self.deadline
+        ):
+            logging.error(f"Deadline of {self.deadline} seconds exceeded for {name}.")
+            raise RetryError(
+                f"Deadline of {self.deadline} seconds exceeded after {retries + 1} attempts."
+            ) from error
+
+        logging.warning(
+            f"Retry #{retries + 1} for {name} after encountering {error}. Waiting {delay:.1f} seconds before retrying..."
+        )
+
+        if self.on_retry is not None:
+            self.on_retry(name, error, retries, delay)
+
+        return delay
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls func, retrying transient errors.
+
+        Args:
+            func (callable): The function to call.
+            *args: Its positional arguments.
+            **kwargs: Its keyword arguments.
+
+        Returns:
+            The result of func.
+        """
+        name = getattr(func, "__name__", repr(func))
+        start = time.monotonic()
+        delay = self.base_delay
+
+        for retries in range(self.max_retries + 1):
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.wait()
+
+            try:
+                logging.info(f"Attempting to call {name}")
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self.on_error(name, e, retries, delay, start)
+                time.sleep(delay)
+                continue
+
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+
+            return result
+
+    async def acall(self, func, *args, **kwargs):
+        """
+        Async version of call; backoff and pauses only suspend the calling coroutine.
+        """
+        name = getattr(func, "__name__", repr(func))
+        start = time.monotonic()
+        delay = self.base_delay
+
+        for retries in range(self.max_retries + 1):
+            if self.circuit_breaker is not None:
+                await self.circuit_breaker.await_closed()
+
+            try:
+                logging.info(f"Attempting to call {name}")
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self.on_error(name, e, retries, delay, start)
+                await asyncio.sleep(delay)
+                continue
+
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_success()
+
+            return result
+
+    def __call__(self, func):
+        """
+        Decorates a function (or coroutine function) so that it is called with this policy.
+        """
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self.acall(func, *args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
+
+
+# Circuit breaker shared by every agent of the process
+circuit_breaker = None
+circuit_breaker_lock = threading.Lock()
+
+
+def get_retry_policy(on_retry=None) -> RetryPolicy:
+    """
+    Returns a retry policy configured in configs, whose circuit breaker is shared by the whole process.
+
+    Args:
+        on_retry (callable): Called with (name, error, retries, delay) before every retry.
+
+    Returns:
+        RetryPolicy: The retry policy.
+    """
+    global circuit_breaker
+
+    if configs.circuit_breaker_threshold is None:
+        return RetryPolicy(on_retry=on_retry)
+
+    with circuit_breaker_lock:
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker()
+
+    return RetryPolicy(circuit_breaker=circuit_breaker, on_retry=on_retry)
@@ -0,0 +1,332 @@
+import concurrent.futures
+import os
+import pickle
+import types
+from collections import Counter
+from pathlib import Path
+from .cache import make_key
+from .state_handler import read_state
+from . import configs
+
+
+def get_shard(generation: str, knowledge_source: str, num_shards: int) -> int:
+    """
+    Returns the shard of a (generation, knowledge source) pair.
+    The partition is a hash of the pair, so it is the same in every process and on every machine,
+    and does not depend on the position of the pair or on the model config
+    (a pair stays in the shard holding its saved facts and decisions).
+
+    Args:
+        generation (str): The generation.
+        knowledge_source (str): The knowledge source its facts are scored against.
+        num_shards (int): The number of shards.
+
+    Returns:
+        int: The shard, between 0 and num_shards - 1.
+    """
+    return int(make_key("shard", generation, knowledge_source)[:16], 16) % num_shards
+
+
+def get_shard_path(path, shard: int, num_shards: int) -> str:
+    """
+    Returns the state file of a shard, e.g. facts-00002-of-00008.jsonl for facts.jsonl.
+
+    Args:
+        path: The state file of an unsharded run.
+        shard (int): The shard.
+        num_shards (int): The number of shards.
+
+    Returns:
+        str: The state file of the shard, next to path.
+    """
+    path = Path(path)
+    return str(
+        path.with_name(f"{path.stem}-{shard:05d}-of-{num_shards:05d}{path.suffix}")
+    )
+
+
+def get_shard_paths(path, num_shards: int) -> list:
+    """
+    Returns the state files of all the shards.
+
+    Args:
+        path: The state file of an unsharded run.
+        num_shards (int): The number of shards.
+
+    Returns:
+        list: The state file of each shard.
+    """
+    return [get_shard_path(path, shard, num_shards) for shard in range(num_shards)]
+
+
+def partition(generations: list, knowledge_sources: list, num_shards: int) -> list:
+    """
+    Splits the input into shards.
+
+    Args:
+        generations (list): The generations.
+        knowledge_sources (list): The knowledge source of each generation.
+        num_shards (int): The number of shards.
+
+    Returns:
+        list: The (indices, generations, knowledge sources) lists of each shard, in input order.
+    """
+    shards = [([], [], []) for _ in range(num_shards)]
+
+    for i, (generation, knowledge_source) in enumerate(
+        zip(generations, knowledge_sources)
+    ):
+        indices, shard_generations, shard_knowledge_sources = shards[
+            get_shard(generation, knowledge_source, num_shards)
+        ]
+        indices.append(i)
+        shard_generations.append(generation)
+        shard_knowledge_sources.append(knowledge_source)
+
+    return shards
+
+
+def get_configs() -> dict:
+    """
+    Returns the settings of configs (its public module-level values), to send to worker processes.
+
+    Returns:
+        dict: The configs by name.
+    """
+    return {
+        name: value
+        for name, value in vars(configs).items()
+        if not name.startswith("_")
+        and not isinstance(value, types.ModuleType)
+        and not callable(value)
+    }
+
+
+def create_factscore(**kwargs):
+    # Imported here so the sharding helpers do not import the whole pipeline
+    from .factscore import FactScore
+
+    return FactScore(**kwargs)
+
+
+def score_shard(
+    generations: list,
+    knowledge_sources: list,
+    facts_path: str,
+    decisions_path: str,
+    factory,
+    kwargs: dict,
+    settings: dict,
+) -> tuple:
+    """
+    Scores a shard with its own state files (runs in a worker process of run_shards),
+    with the configs of the parent process (settings, from get_configs).
+
+    Returns:
+        tuple: The scores and the initial scores of the shard, in shard order.
+    """
+    vars(configs).update(settings)
+    fact_score = factory(facts_path=facts_path, decisions_path=decisions_path, **kwargs)
+    return fact_score.get_generation_scores(generations, knowledge_sources)
+
+
+def run_shards(
+    generations: list,
+    knowledge_sources: list,
+    num_shards: int,
+    processes: int = None,
+    facts_path: str = None,
+    decisions_path: str = None,
+    factory=create_factscore,
+    mp_context=None,
+    **kwargs,
+) -> tuple:
+    """
+    Scores the input on a process pool, one FactScore per shard.
+    Each shard saves to its own state files (see get_shard_path), so an interrupted run resumes
+    every shard, and the shards of one input can also be run on different machines
+    (e.g. with `factscorelite --shard I --num-shards K`) and combined with merge_shards.
+    The configs of this process are sent to the workers, so they are the same whether
+    the workers are forked (the Linux default) or spawned (macOS and Windows).
+
+    Args:
+        generations (list): The generations.
+        knowledge_sources (list): The knowledge source of each generation.
+        num_shards (int): The number of shards.
+        processes (int): The number of worker processes (the number of CPUs by default, at most num_shards).
+        facts_path (str): The facts state file to shard (configs.facts_db_path by default).
+        decisions_path (str): The decisions state file to shard (configs.decisions_db_path by default).
+        factory (callable): Builds the FactScore of a shard from its state paths and kwargs
+            (a module-level function, sent to the workers). Objects holding locks, like a backend
+            or Metrics, cannot be sent to the workers, so the factory builds them.
+        mp_context: The multiprocessing context starting the workers (the platform default by default).
+        **kwargs: The other arguments of FactScore, sent to the workers.
+
+    Returns:
+        tuple: A tuple containing the average score, and average initial scores (like get_factscore).
+
+    Raises:
+        TypeError: If factory, kwargs or the configs cannot be sent to the worker processes.
+    """
+    # Imported here since factscore imports the whole pipeline
+    from .factscore import mean
+
+    settings = get_configs()
+
+    try:
+        pickle.dumps((factory, kwargs, settings))
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        raise TypeError(
+            "run_shards sends factory, kwargs and the configs to worker processes, so they must be "
+            "picklable; build the backend, metrics or other objects holding locks in factory "
+            f"instead ({e})"
+        ) from e
+
+    facts_path = facts_path or configs.facts_db_path
+    decisions_path = decisions_path or configs.decisions_db_path
+    shards = partition(generations, knowledge_sources, num_shards)
+    scores = []
+    init_scores = []
+    processes = processes or min(num_shards, os.cpu_count() or 1)
+
+    with concurrent.futures.ProcessPoolExecutor(processes, mp_context) as executor:
+        futures = [
+            executor.submit(
+                score_shard,
+                shard_generations,
+                shard_knowledge_sources,
+                get_shard_path(facts_path, shard, num_shards),
+                get_shard_path(decisions_path, shard, num_shards),
+                factory,
+                kwargs,
+                settings,
+            )
+            for shard, (
+                indices,
+                shard_generations,
+                shard_knowledge_sources,
+            ) in enumerate(shards)
+            if indices
+        ]
+
+        for future in concurrent.futures.as_completed(futures):
+            shard_scores, shard_init_scores = future.result()
+            scores.extend(shard_scores)
+            init_scores.extend(shard_init_scores)
+
+    return mean(scores), mean(init_scores)
+
+
+def merge_shards(
+    decisions_paths: list,
+    gamma: int = 10,
+    backend: str = None,
+    config: str = None,
+    generations: list = None,
+    knowledge_sources: list = None,
+) -> dict:
+    """
+    Combines the decisions saved by the shards of a run into corpus scores.
+    The files are only read (see read_state), so shards still running can be merged.
+    Every decisions entry holds the hash of the model settings it was scored with
+    (FactScore.get_config_key): entries of other settings than config are skipped, and without
+    config, files holding the decisions of several settings (e.g. left by earlier runs) are refused.
+    With the input of the run, every input record is counted like in get_factscore and run_shards,
+    repeated pairs included; without it, each scored (generation, knowledge source) pair is counted once.
+
+    Args:
+        decisions_paths (list): The decisions state files of the shards (see get_shard_paths).
+        gamma (int): The length penalty of the scores.
+        backend (str): The state backend of the files (configs.state_backend by default).
+        config (str): The hash of the model settings of the run, whose decisions are merged.
+        generations (list): The generations of the input of the run.
+        knowledge_sources (list): The knowledge source of each generation.
+
+    Returns:
+        dict: The number of scored records or pairs (count), their mean score (score) and
+            mean initial score (init_score), the number of decisions of each shard (shards),
+            of decisions of other settings (skipped) and, with the input, of records
+            without decisions (missing).
+
+    Raises:
+        ValueError: If the files hold decisions of several settings and config is not given.
+    """
+    # Imported here since factscore imports the whole pipeline (merging needs none of it)
+    from .factscore import calculate_score, mean
+
+    entries = {}
+    counts = []
+    skipped = 0
+
+    for path in decisions_paths:
+        count = 0
+
+        for entry in read_state(path, backend):
+            if config is not None and entry.get("config") != config:
+                skipped += 1
+                continue
+
+            key = entry.get("key") or make_key(entry["generation"], entry["decision"])
+
+            # Entries can be saved twice (e.g. by a resumed run)
+            if key in entries:
+                continue
+
+            entries[key] = entry
+            count += 1
+
+        counts.append(count)
+
+    settings = Counter(entry.get("config") for entry in entries.values())
+
+    if len(settings) > 1:
+        raise ValueError(
+            "The decisions files hold decisions scored with different model settings "
+            f"(number of decisions by settings hash: {dict(settings)}); "
+            "pass the settings hash of the run to only merge its decisions."
+        )
+
+    missing = None
+
+    if generations is None:
+        decisions = [entry["decision"] for entry in entries.values()]
+    else:
+        # Entries saved without their pair are only matched by generation
+        pairs = {
+            entry.get("pair") or entry["generation"]: entry["decision"]
+            for entry in entries.values()
+        }
+        decisions = []
+        missing = 0
+
+        for generation, knowledge_source in zip(generations, knowledge_sources):
+            decision = pairs.get(make_key(generation, knowledge_source))
+
+            if decision is None:
+                decision = pairs.get(generation)
+
+            if decision is None:
+                missing += 1
+            else:
+                decisions.append(decision)
+
+    scores = []
+    init_scores = []
+
+    for decision in decisions:
+        score, init_score = calculate_score(decision, gamma)
+        scores.append(float(score))
+        init_scores.append(float(init_score))
+
+    merged = {
+        "count": len(scores),
+        "score": mean(scores),
+        "init_score": mean(init_scores),
+        "shards": counts,
+        "skipped": skipped,
+    }
+
+    if missing is not None:
+        merged["missing"] = missing
+
+    return merged
@@ -1,4 +1,52 @@
 import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from .cache import MemoCache
+from . import configs
+
+
+def parse_jsonl(content: bytes) -> tuple:
+    """
+    Parses the items of a JSONL state, without a torn last line (left by a crash or
+    by a write still in progress). A complete last item without its newline
+    (e.g. written by another tool) is kept.
+
+    Args:
+        content (bytes): The content of the file.
+
+    Returns:
+        tuple: The items and the length of the content they were parsed from.
+
+    Raises:
+        ValueError: For a corrupted line before the last one.
+    """
+    data = []
+    valid_end = 0
+    lines = content.split(b"\n")
+
+    for i, line in enumerate(lines):
+        is_last = i == len(lines) - 1
+
+        if not line.strip():
+            if not is_last:
+                valid_end += len(line) + 1
+            continue
+
+        try:
+            item = json.loads(line)
+        except ValueError:
+            # Only the last line can be torn, anything else is real corruption
+            if is_last or all(not rest.strip() for rest in lines[i + 1 :]):
+                break
+            raise
+
+        data.append(item)
+        valid_end += len(line) + (0 if is_last else 1)
+
+    return data, valid_end
 
 
 class StateHandler:
@@ -18,3 +66,520 @@ class StateHandler:
 
         except FileNotFoundError:
             return []
+
+    def append(self, item):
+        """
+        Appends an item to the saved list (rewrites the whole file).
+
+        Args:
+            item: A JSON serializable item.
+        """
+        data = self.load()
+        data.append(item)
+        self.save(data)
+
+    def flush(self):
+        """
+        Nothing to flush, every save is written at once.
+        """
+        pass
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+
+class JSONLStateHandler:
+    """
+    Append-only state store with one JSON item per line.
+    Appending an item only writes that item, and the file is fsynced every fsync_every appends.
+    A line torn by a crash in the middle of a write is dropped by load, while a complete
+    last item saved without its newline is kept.
+    """
+
+    def __init__(self, path, fsync_every: int = None, legacy_path=None):
+        self.db_path = path
+        self.fsync_every = fsync_every or configs.state_fsync_every
+        # A JSON list dumped by StateHandler, imported if db_path does not exist yet
+        self.legacy_path = legacy_path
+        self.file = None
+        self.unsynced = 0
+
+    def save(self, data):
+        """
+        Replaces the saved items atomically.
+
+        Args:
+            data (list): A list of JSON serializable items.
+        """
+        self.close()
+        tmp_path = f"{self.db_path}.tmp"
+
+        with open(tmp_path, "w") as f:
+            for item in data:
+                f.write(json.dumps(item) + "\n")
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.db_path)
+
+    def load(self):
+        """
+        Loads the saved items, importing a legacy JSON list if needed.
+        A torn last line (left by a crash during a write) is truncated from the file.
+
+        Returns:
+            list: The saved items.
+        """
+        self.close()
+
+        if not os.path.exists(self.db_path):
+            if self.legacy_path and os.path.exists(self.legacy_path):
+                data = StateHandler(self.legacy_path).load()
+                self.save(data)
+                return data
+
+            return []
+
+        with open(self.db_path, "rb") as f:
+            content = f.read()
+
+        # A JSON list (the StateHandler format) stored under the same path
+        if content.lstrip()[:1] == b"[":
+            data = json.loads(content)
+            self.save(data)
+            return data
+
+        data, valid_end = parse_jsonl(content)
+
+        if valid_end < len(content):
+            logging.warning(
+                f"Dropping a torn write at the end of {self.db_path} ({len(content) - valid_end} bytes)."
+            )
+            with open(self.db_path, "r+b") as f:
+                f.truncate(valid_end)
+        elif data and not content.endswith(b"\n"):
+            # The next append starts on its own line
+            with open(self.db_path, "ab") as f:
+                f.write(b"\n")
+
+        return data
+
+    def append(self, item):
+        """
+        Appends an item to the end of the file.
+
+        Args:
+            item: A JSON serializable item.
+        """
+        if self.file is None:
+            self.file = open(self.db_path, "a")
+
+        self.file.write(json.dumps(item) + "\n")
+        self.file.flush()
+        self.unsynced += 1
+
+        if self.unsynced >= self.fsync_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Makes the appended items durable.
+        """
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def close(self):
+        """
+        Flushes and closes the append handle.
+        """
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+
+class SQLiteStateHandler:
+    """
+    State store keeping every item as a row of a SQLite database, keyed by its generation id
+    (the position of the generation in the run). Rows can be counted, looked up and loaded
+    partially without reading the whole state, and appends are committed in batches of
+    commit_every items.
+    """
+
+    def __init__(self, path, commit_every: int = None, legacy_path=None):
+        self.db_path = path
+        self.commit_every = commit_every or configs.state_fsync_every
+        # A JSON/JSONL state file, imported if the database is empty
+        self.legacy_path = legacy_path
+        self.uncommitted = 0
+
+        # Used by one writer at a time, which may not be the thread that created it
+        self.conn = sqlite3.connect(str(path), timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "id INTEGER PRIMARY KEY, key TEXT, generation TEXT, data TEXT NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS items_generation ON items (generation)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS items_key ON items (key)")
+
+    def save(self, data):
+        """
+        Replaces the saved items in a single transaction.
+
+        Args:
+            data (list): A list of JSON serializable items.
+        """
+        self.flush()
+
+        with self.conn:
+            self.conn.execute("DELETE FROM items")
+            self.conn.executemany(
+                "INSERT INTO items (id, key, generation, data) VALUES (?, ?, ?, ?)",
+                [self.to_row(i, item) for i, item in enumerate(data)],
+            )
+
+    def load(self):
+        """
+        Loads every saved item, importing the legacy state file if the database is empty.
+
+        Returns:
+            list: The saved items.
+        """
+        self.flush()
+
+        if self.legacy_path and os.path.exists(self.legacy_path) and len(self) == 0:
+            if str(self.legacy_path).endswith(".json"):
+                data = StateHandler(self.legacy_path).load()
+            else:
+                data = JSONLStateHandler(self.legacy_path).load()
+
+            self.save(data)
+            return data
+
+        return self.load_range()
+
+    def load_range(self, start: int = 0, stop: int = None) -> list:
+        """
+        Loads the items with a generation id in [start, stop).
+
+        Args:
+            start (int): The first generation id.
+            stop (int): The generation id to stop at (None loads until the end).
+
+        Returns:
+            list: The items, ordered by generation id.
+        """
+        self.flush()
+
+        rows = self.conn.execute(
+            "SELECT data FROM items WHERE id >= ? AND id < ? ORDER BY id",
+            (start, stop if stop is not None else 2**63 - 1),
+        )
+
+        return [json.loads(data) for (data,) in rows]
+
+    def get(self, generation_id: int):
+        """
+        Looks up the item of a generation id.
+
+        Args:
+            generation_id (int): The generation id.
+
+        Returns:
+            The item, or None if it is not saved.
+        """
+        self.flush()
+
+        row = self.conn.execute(
+            "SELECT data FROM items WHERE id = ?", (generation_id,)
+        ).fetchone()
+
+        return None if row is None else json.loads(row[0])
+
+    def get_by_key(self, key: str):
+        """
+        Looks up the item saved under a content hash key (see FactScore.get_facts_key).
+
+        Args:
+            key (str): The key of the item.
+
+        Returns:
+            The last item saved under the key, or None.
+        """
+        # Uncommitted rows are visible to this connection, so the pending batch is not committed
+        row = self.conn.execute(
+            "SELECT data FROM items WHERE key = ? ORDER BY id DESC LIMIT 1", (key,)
+        ).fetchone()
+
+        return None if row is None else json.loads(row[0])
+
+    def find(self, generation: str) -> list:
+        """
+        Looks up the items of a generation text (indexed).
+
+        Args:
+            generation (str): The generation.
+
+        Returns:
+            list: The items saved for the generation.
+        """
+        self.flush()
+
+        rows = self.conn.execute(
+            "SELECT data FROM items WHERE generation = ? ORDER BY id", (generation,)
+        )
+
+        return [json.loads(data) for (data,) in rows]
+
+    def unsupported_facts(self) -> list:
+        """
+        Queries the facts labeled as not supported in a decisions state.
+
+        Returns:
+            list: A list of (generation id, generation, decision dictionary) tuples.
+        """
+        self.flush()
+
+        rows = self.conn.execute(
+            "SELECT items.id, items.generation, decision.value "
+            "FROM items, json_each(items.data, '$.decision') AS decision "
+            "WHERE json_extract(decision.value, '$.is_supported') = 0 "
+            "ORDER BY items.id"
+        )
+
+        return [
+            (generation_id, generation, json.loads(value))
+            for generation_id, generation, value in rows
+        ]
+
+    def append(self, item):
+        """
+        Appends an item with the next generation id. It is committed with the current batch.
+
+        Args:
+            item: A JSON serializable item.
+        """
+        self.extend([item])
+
+    def extend(self, items: list):
+        """
+        Appends several items with consecutive generation ids.
+
+        Args:
+            items (list): JSON serializable items.
+        """
+        next_id = self.conn.execute(
+            "SELECT COALESCE(MAX(id) + 1, 0) FROM items"
+        ).fetchone()[0]
+
+        self.conn.executemany(
+            "INSERT INTO items (id, key, generation, data) VALUES (?, ?, ?, ?)",
+            [self.to_row(next_id + i, item) for i, item in enumerate(items)],
+        )
+        self.uncommitted += len(items)
+
+        if self.uncommitted >= self.commit_every:
+            self.flush()
+
+    def flush(self):
+        """
+        Commits the pending appends.
+        """
+        if self.uncommitted:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        """
+        Commits the pending appends and closes the database.
+        """
+        self.flush()
+        self.conn.close()
+
+    def to_row(self, generation_id: int, item) -> tuple:
+        """
+        Converts an item to a database row.
+
+        Args:
+            generation_id (int): The generation id of the item.
+            item: A JSON serializable item.
+
+        Returns:
+            tuple: The (id, key, generation, data) row.
+        """
+        if not isinstance(item, dict):
+            return (generation_id, None, None, json.dumps(item))
+
+        return (
+            generation_id,
+            item.get("key"),
+            item.get("generation"),
+            json.dumps(item),
+        )
+
+    def __len__(self) -> int:
+        # Uncommitted rows are visible to this connection
+        return self.conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+
+class SavedEntries:
+    """
+    The saved entries of a state by key, as the FactScore pipeline looks them up.
+    Handlers with keyed lookups (SQLiteStateHandler.get_by_key) are queried on demand and the
+    others are loaded once; the entries added during the run are only kept in a bounded LRU,
+    so a long run does not accumulate them in memory (a duplicate seen after its entry was evicted
+    is computed again from the sentence and decision caches, and saved again).
+    """
+
+    def __init__(self, handler, loaded: dict = None, max_size: int = None):
+        self.handler = handler
+        self.loaded = loaded if loaded is not None else {}
+        self.recent = MemoCache(max_size or configs.pipeline_recent_entries)
+        self.lock = threading.RLock()
+
+    def get(self, key: str):
+        """
+        Looks up the entry saved under a key.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            The entry, or None.
+        """
+        with self.lock:
+            entry = self.recent.get(key) or self.loaded.get(key)
+
+            if entry is None and hasattr(self.handler, "get_by_key"):
+                entry = self.handler.get_by_key(key)
+
+            return entry
+
+    def add(self, entry: dict) -> dict:
+        """
+        Saves an entry, unless an entry with the same key was saved in the meantime.
+
+        Args:
+            entry (dict): The entry, with its key.
+
+        Returns:
+            dict: The entry saved under the key.
+        """
+        with self.lock:
+            saved = self.get(entry["key"])
+
+            if saved is not None:
+                return saved
+
+            self.recent.set(entry["key"], entry)
+            self.handler.append(entry)
+            return entry
+
+
+def get_state_path(path, backend: str = None) -> str:
+    """
+    Returns the state file of a backend for a path. A .json or .jsonl path (like the defaults
+    configs.facts_db_path and configs.decisions_db_path) becomes a .sqlite file for the sqlite
+    backend, so a JSON or JSONL state is never opened as a database.
+
+    Args:
+        path (str): The path of the state file.
+        backend (str): "jsonl", "json" or "sqlite" (configs.state_backend by default).
+
+    Returns:
+        str: The path of the state file of the backend.
+    """
+    backend = backend or configs.state_backend
+    stem, suffix = os.path.splitext(str(path))
+
+    if backend == "sqlite" and suffix in (".json", ".jsonl"):
+        return f"{stem}.sqlite"
+
+    return str(path)
+
+
+def read_state(path, backend: str = None) -> list:
+    """
+    Reads the items of a state file strictly read-only, e.g. while its run is still writing it:
+    unlike the handlers' load, a torn last line is skipped rather than truncated,
+    and legacy files are not imported.
+
+    Args:
+        path (str): The path of the state file.
+        backend (str): "jsonl" (default), "json" or "sqlite" (configs.state_backend by default).
+
+    Returns:
+        list: The saved items (none if the file does not exist).
+    """
+    backend = backend or configs.state_backend
+    path = get_state_path(path, backend)
+
+    if not os.path.exists(path):
+        return []
+
+    if backend == "sqlite":
+        conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+
+        try:
+            rows = conn.execute("SELECT data FROM items ORDER BY id").fetchall()
+        finally:
+            conn.close()
+
+        return [json.loads(data) for (data,) in rows]
+
+    with open(path, "rb") as f:
+        content = f.read()
+
+    # A JSON list (the StateHandler format)
+    if backend == "json" or content.lstrip()[:1] == b"[":
+        return json.loads(content)
+
+    return parse_jsonl(content)[0]
+
+
+def get_state_handler(path, backend: str = None):
+    """
+    Creates the state handler of the configured backend.
+    The sqlite backend keeps a .json or .jsonl path in a .sqlite file next to it (see get_state_path).
+
+    Args:
+        path (str): The path of the state file.
+        backend (str): "jsonl" (append-only, default), "json" (StateHandler) or "sqlite".
+
+    Returns:
+        The state handler.
+    """
+    backend = backend or configs.state_backend
+
+    if backend == "json":
+        return StateHandler(path)
+
+    if backend == "jsonl":
+        # Runs started before the JSONL backend dumped facts.json/decisions.json
+        legacy_path = os.path.splitext(str(path))[0] + ".json"
+        legacy_path = None if legacy_path == str(path) else legacy_path
+
+        return JSONLStateHandler(path, legacy_path=legacy_path)
+
+    if backend == "sqlite":
+        # A JSON/JSONL path gets its own database, which imports the JSONL (or JSON) state
+        # of the same run, if any
+        path = get_state_path(path, backend)
+        stem = os.path.splitext(path)[0]
+        legacy_paths = [f"{stem}.jsonl", f"{stem}.json"]
+        legacy_paths = [p for p in legacy_paths if p != str(path) and os.path.exists(p)]
+
+        return SQLiteStateHandler(
+            path, legacy_path=legacy_paths[0] if legacy_paths else None
+        )
+
+    raise ValueError(f"Unknown state backend: {backend}")
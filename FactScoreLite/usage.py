@@ -0,0 +1,163 @@
+import contextlib
+import contextvars
+import threading
+from collections import defaultdict
+from . import configs
+
+# The generation the requests of the current thread or task are made for
+current_generation = contextvars.ContextVar("current_generation", default=None)
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised before a request once the token or cost budget of the run is spent.
+    """
+
+
+@contextlib.contextmanager
+def track_generation(key: str):
+    """
+    Attributes the usage of the requests made inside the block to a generation.
+
+    Args:
+        key (str): The key of the generation.
+    """
+    token = current_generation.set(key)
+
+    try:
+        yield
+    finally:
+        current_generation.reset(token)
+
+
+def new_totals() -> dict:
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0}
+
+
+class UsageStats:
+    """
+    Running totals of the tokens and cost of the LLM requests of a run,
+    per stage (extraction, verification) and per generation.
+    Optionally enforces a budget: once max_tokens or max_cost is reached,
+    check_budget raises BudgetExceeded so no new request is sent.
+    """
+
+    def __init__(
+        self, max_tokens: int = None, max_cost: float = None, prices: dict = None
+    ):
+        self.max_tokens = (
+            max_tokens if max_tokens is not None else configs.max_run_tokens
+        )
+        self.max_cost = max_cost if max_cost is not None else configs.max_run_cost
+        # USD per million (prompt, completion) tokens by model name
+        self.prices = prices if prices is not None else configs.token_prices
+        self.totals = new_totals()
+        self.stages = defaultdict(new_totals)
+        self.generations = defaultdict(new_totals)
+        self.lock = threading.Lock()
+
+    def get_cost(
+        self,
+        model_name: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        price_factor: float = 1.0,
+    ):
+        """
+        Calculates the cost of a request from the price table.
+
+        Args:
+            model_name (str): The model the request was sent to.
+            prompt_tokens (int): The prompt tokens of the request.
+            completion_tokens (int): The completion tokens of the request.
+            price_factor (float): The discount applied to the prices (e.g. for the Batch API).
+
+        Returns:
+            float: The cost in USD (0 for models missing from the price table).
+        """
+        prompt_price, completion_price = self.prices.get(model_name, (0.0, 0.0))
+
+        return (
+            (prompt_tokens * prompt_price + completion_tokens * completion_price)
+            * price_factor
+            / 1_000_000
+        )
+
+    def record(
+        self,
+        stage: str,
+        model_name: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        price_factor: float = 1.0,
+    ):
+        """
+        Adds the usage of a request to the totals of its stage and of the current generation.
+
+        Args:
+            stage (str): The stage that sent the request.
+            model_name (str): The model the request was sent to.
+            prompt_tokens (int): The prompt tokens of the request.
+            completion_tokens (int): The completion tokens of the request.
+            price_factor (float): The discount applied to the prices (e.g. for the Batch API).
+        """
+        cost = self.get_cost(model_name, prompt_tokens, completion_tokens, price_factor)
+        generation = current_generation.get()
+
+        with self.lock:
+            counters = [self.totals, self.stages[stage]]
+
+            if generation is not None:
+                counters.append(self.generations[generation])
+
+            for totals in counters:
+                totals["calls"] += 1
+                totals["prompt_tokens"] += prompt_tokens
+                totals["completion_tokens"] += completion_tokens
+                totals["cost"] += cost
+
+    def check_budget(self):
+        """
+        Raises BudgetExceeded if the token or cost budget is spent.
+        """
+        with self.lock:
+            tokens = self.totals["prompt_tokens"] + self.totals["completion_tokens"]
+            cost = self.totals["cost"]
+
+        if self.max_tokens is not None and tokens >= self.max_tokens:
+            raise BudgetExceeded(
+                f"Token budget of {self.max_tokens} reached ({tokens} tokens used)."
+            )
+
+        if self.max_cost is not None and cost >= self.max_cost:
+            raise BudgetExceeded(
+                f"Cost budget of ${self.max_cost:.2f} reached (${cost:.4f} spent)."
+            )
+
+    def summary(self) -> dict:
+        """
+        Returns a copy of the running totals.
+
+        Returns:
+            dict: The totals of the run, by stage and by generation key.
+        """
+        with self.lock:
+            return {
+                **self.totals,
+                "stages": {stage: dict(t) for stage, t in self.stages.items()},
+                "generations": {key: dict(t) for key, t in self.generations.items()},
+            }
+
+    def pop_generation(self, key: str) -> dict:
+        """
+        Returns the usage of a generation and stops keeping it, e.g. once it is reported,
+        so a long streamed run does not accumulate the usage of every generation.
+
+        Args:
+            key (str): The key of the generation.
+
+        Returns:
+            dict: The totals of the generation (zero if it made no request).
+        """
+        with self.lock:
+            return self.generations.pop(key, None) or new_totals()
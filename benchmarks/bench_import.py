@@ -0,0 +1,23 @@
+import subprocess
+import sys
+from .harness import benchmark
+
+# Cold start targets, interpreter startup included (seconds): importing the package must stay
+# cheap for short-lived workers and the CLI, and the pipeline must not import openai or nltk
+IMPORT_PACKAGE_TARGET = 0.05
+IMPORT_FACTSCORE_TARGET = 0.3
+
+
+def make_import(statement: str):
+    command = [sys.executable, "-c", statement]
+    return lambda: subprocess.run(command, check=True)
+
+
+@benchmark("import FactScoreLite", [1], target=IMPORT_PACKAGE_TARGET)
+def import_package(scale: int):
+    return make_import("import FactScoreLite")
+
+
+@benchmark("from FactScoreLite import FactScore", [1], target=IMPORT_FACTSCORE_TARGET)
+def import_factscore(scale: int):
+    return make_import("from FactScoreLite import FactScore")
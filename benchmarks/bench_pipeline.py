@@ -0,0 +1,169 @@
+import random
+import re
+from FactScoreLite import FactScore, FakeBackend
+from FactScoreLite.atomic_facts import AtomicFactGenerator
+from FactScoreLite.fact_scorer import FactScorer
+from FactScoreLite.state_handler import (
+    StateHandler,
+    JSONLStateHandler,
+    SQLiteStateHandler,
+)
+from .harness import benchmark
+
+WORDS = (
+    "the of and to in was is for on as with by he at from his an were are which "
+    "this be also has or had first one their its new after who they have her she "
+    "two been other when there all during into school time may years more most only "
+    "over city some world would where later up such used many can state about national"
+).split()
+
+
+def make_sentence(rng: random.Random, words: int = 15) -> str:
+    sentence = " ".join(rng.choice(WORDS) for _ in range(words))
+    return sentence[0].upper() + sentence[1:] + "."
+
+
+def make_initials(rng: random.Random) -> str:
+    first, second = rng.sample("ABCDEFGHIJKLMNOPRSTW", 2)
+    return f"{first}. {second}."
+
+
+def make_text(num_sentences: int, initials_every: int = 4, seed: int = 0) -> str:
+    """
+    Builds a long biography-like text, with a name with initials every few sentences.
+    """
+    rng = random.Random(seed)
+    sentences = []
+
+    for i in range(num_sentences):
+        sentence = make_sentence(rng)
+
+        if i % initials_every == 0:
+            sentence = f"{make_initials(rng)} Tolkien wrote that {sentence[0].lower()}{sentence[1:]}"
+
+        sentences.append(sentence)
+
+    return " ".join(sentences)
+
+
+def naive_split(text: str) -> list:
+    # Splits after every period like a sentence tokenizer that does not know the initials
+    return re.split(r"(?<=\.)\s+", text)
+
+
+def make_entry(i: int, num_facts: int = 20) -> dict:
+    rng = random.Random(i)
+    return {
+        "key": f"{i:064x}",
+        "generation": make_text(5, seed=i),
+        "decision": [
+            {
+                "fact": make_sentence(rng, 8),
+                "is_supported": rng.random() < 0.7,
+                "output": "True",
+            }
+            for _ in range(num_facts)
+        ],
+    }
+
+
+def make_scorer(batch_size: int = 1) -> FactScorer:
+    scorer = FactScorer(batch_size=batch_size, backend=FakeBackend())
+    # Score every fact on every run instead of reading the decisions of the previous one
+    scorer.decision_cache = None
+    return scorer
+
+
+def make_state_setup(handler_class, suffix: str):
+    def setup(scale: int, work_dir):
+        entries = [make_entry(i) for i in range(scale)]
+        handler = handler_class(str(work_dir / f"state-{scale}{suffix}"))
+        return lambda: handler.save(entries)
+
+    return setup
+
+
+for handler_class, suffix in [
+    (StateHandler, ".json"),
+    (JSONLStateHandler, ".jsonl"),
+    (SQLiteStateHandler, ".sqlite"),
+]:
+    benchmark(
+        f"{handler_class.__name__}.save",
+        [1_000, 10_000, 100_000],
+        [1_000],
+        work_dir=True,
+    )(make_state_setup(handler_class, suffix))
+
+
+@benchmark("AtomicFactGenerator.detect_initials", [1_000, 10_000, 100_000], [1_000])
+def detect_initials(scale: int):
+    generator = AtomicFactGenerator(backend=FakeBackend())
+    text = make_text(scale)
+    return lambda: generator.detect_initials(text)
+
+
+@benchmark("AtomicFactGenerator.fix_sentence_splitter", [100, 1_000, 3_000], [100])
+def fix_sentence_splitter(scale: int):
+    generator = AtomicFactGenerator(backend=FakeBackend())
+    text = make_text(scale)
+    sentences = naive_split(text)
+    initials = generator.detect_initials(text)
+    return lambda: generator.fix_sentence_splitter(sentences, initials)
+
+
+@benchmark("AtomicFactGenerator.build_instructions", [1_000], [100])
+def build_extraction_instructions(scale: int):
+    generator = AtomicFactGenerator(backend=FakeBackend())
+
+    def run():
+        for _ in range(scale):
+            generator.build_instructions()
+
+    return run
+
+
+@benchmark("FactScorer.get_instructions", [1_000, 10_000], [1_000])
+def get_verification_instructions(scale: int):
+    scorer = make_scorer()
+    rng = random.Random(0)
+    facts = [make_sentence(rng, 8) for _ in range(scale)]
+
+    def run():
+        # A new prefix cache per run measures the hashing and the building of the prefixes
+        scorer.demons = scorer.demons
+        for fact in facts:
+            scorer.get_instructions(fact)
+
+    return run
+
+
+@benchmark("FactScorer.get_score", [1_000, 10_000], [1_000])
+def get_score(scale: int):
+    scorer = make_scorer()
+    rng = random.Random(0)
+    facts = [make_sentence(rng, 8) for _ in range(scale)]
+    knowledge_source = make_text(20)
+    return lambda: scorer.get_score(facts, knowledge_source)
+
+
+@benchmark("FactScorer.get_score batched", [1_000, 10_000], [1_000])
+def get_score_batched(scale: int):
+    scorer = make_scorer(batch_size=8)
+    rng = random.Random(0)
+    facts = [make_sentence(rng, 8) for _ in range(scale)]
+    knowledge_source = make_text(20)
+    return lambda: scorer.get_score(facts, knowledge_source)
+
+
+@benchmark(
+    "FactScore.calculate_score", [1_000, 10_000, 100_000], [1_000], work_dir=True
+)
+def calculate_score(scale: int, work_dir):
+    fact_score = FactScore(
+        backend=FakeBackend(),
+        facts_path=str(work_dir / "facts.jsonl"),
+        decisions_path=str(work_dir / "decisions.jsonl"),
+    )
+    decisions = [make_entry(i) for i in range(scale)]
+    return lambda: fact_score.get_scores(decisions)
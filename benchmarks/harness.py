@@ -0,0 +1,243 @@
+import gc
+import json
+import platform
+import tempfile
+import time
+from pathlib import Path
+import tracemalloc
+
+# Registered benchmarks by name, in registration order
+BENCHMARKS = {}
+
+
+class Benchmark:
+    """
+    A hot path measured at several scales.
+    setup(scale) prepares the inputs outside of the measurement and returns the
+    function to time (one call is one operation at that scale).
+    With work_dir set, setup(scale, work_dir) also gets a scratch directory for the files it writes,
+    removed at the end of the run.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        setup,
+        scales: list,
+        quick_scales: list = None,
+        target: float = None,
+        work_dir: bool = False,
+    ):
+        self.name = name
+        self.setup = setup
+        self.scales = scales
+        self.quick_scales = quick_scales or scales[:1]
+        # Maximum mean seconds per operation, checked whatever the baseline (None disables it)
+        self.target = target
+        self.work_dir = work_dir
+
+    def get_scales(self, quick: bool = False) -> list:
+        return self.quick_scales if quick else self.scales
+
+
+def benchmark(
+    name: str,
+    scales: list,
+    quick_scales: list = None,
+    target: float = None,
+    work_dir: bool = False,
+):
+    """
+    Registers a benchmark setup function.
+
+    Args:
+        name (str): The name of the benchmark.
+        scales (list): The input sizes it is measured at.
+        quick_scales (list): The input sizes of a quick run (the first scale by default).
+        target (float): The maximum mean seconds per operation.
+        work_dir (bool): Whether setup takes a scratch directory as its second argument.
+
+    Returns:
+        callable: The decorator.
+    """
+
+    def decorator(setup):
+        BENCHMARKS[name] = Benchmark(
+            name, setup, scales, quick_scales, target, work_dir
+        )
+        return setup
+
+    return decorator
+
+
+def measure(func, min_time: float = 0.5, max_runs: int = 1000) -> dict:
+    """
+    Measures the throughput and the peak memory of a function.
+    The function is called repeatedly until min_time seconds have passed (at least once);
+    the peak memory is traced in a separate call so tracing does not slow the timed ones.
+
+    Args:
+        func (callable): The function to measure.
+        min_time (float): The minimum measured time in seconds.
+        max_runs (int): The maximum number of timed calls.
+
+    Returns:
+        dict: The operations per second, the mean seconds per operation,
+            the number of timed calls and the peak memory in MiB.
+    """
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    runs = 0
+    elapsed = 0.0
+
+    while runs < max_runs and (runs == 0 or elapsed < min_time):
+        start = time.perf_counter()
+        func()
+        elapsed += time.perf_counter() - start
+        runs += 1
+
+    return {
+        "ops_per_sec": runs / elapsed if elapsed > 0 else float("inf"),
+        "mean_seconds": elapsed / runs,
+        "runs": runs,
+        "peak_memory_mb": peak / 2**20,
+    }
+
+
+def run_benchmarks(
+    names: list = None, quick: bool = False, min_time: float = 0.5, report=print
+) -> dict:
+    """
+    Runs the registered benchmarks.
+
+    Args:
+        names (list): Substrings selecting the benchmarks to run (all of them by default).
+        quick (bool): Only run the quick scales.
+        min_time (float): The minimum measured time of each benchmark and scale.
+        report (callable): Called with a line of output after each measurement.
+
+    Returns:
+        dict: The results by "name[scale]" key.
+    """
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix="factscorelite-bench-") as work_dir:
+        for name, bench in BENCHMARKS.items():
+            if names and not any(selected in name for selected in names):
+                continue
+
+            for scale in bench.get_scales(quick):
+                key = f"{name}[{scale}]"
+                args = (scale, Path(work_dir)) if bench.work_dir else (scale,)
+                results[key] = measure(bench.setup(*args), min_time)
+
+                if bench.target is not None:
+                    results[key]["target_seconds"] = bench.target
+
+                report(format_result(key, results[key]))
+
+    return results
+
+
+def format_result(key: str, result: dict, baseline: dict = None) -> str:
+    line = (
+        f"{key:<45} {result['ops_per_sec']:>12.2f} ops/s "
+        f"{result['mean_seconds'] * 1000:>10.3f} ms/op "
+        f"{result['peak_memory_mb']:>9.2f} MiB"
+    )
+
+    if baseline is not None:
+        line += (
+            f"  ({result['ops_per_sec'] / baseline['ops_per_sec'] - 1:+.0%} ops/s, "
+            f"{result['peak_memory_mb'] - baseline['peak_memory_mb']:+.2f} MiB)"
+        )
+
+    return line
+
+
+def get_machine() -> dict:
+    """
+    Describes the machine results were measured on (baselines only compare on the same one).
+    """
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def save_baseline(path, results: dict):
+    """
+    Saves results as the baseline, along with the machine they were measured on.
+
+    Args:
+        path: The baseline JSON file.
+        results (dict): The results of run_benchmarks.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"machine": get_machine(), "results": results}, f, indent=4)
+
+
+def load_baseline(path) -> dict:
+    """
+    Loads a baseline saved by save_baseline.
+
+    Args:
+        path: The baseline JSON file.
+
+    Returns:
+        dict: The machine and the results of the baseline.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.2) -> list:
+    """
+    Finds the regressions of results against a baseline, and the results slower than their target.
+
+    Args:
+        results (dict): The results of run_benchmarks.
+        baseline (dict): The baseline results by key.
+        threshold (float): The tolerated relative loss of throughput and growth of peak memory.
+
+    Returns:
+        list: A message per regression.
+    """
+    regressions = []
+
+    for key, result in results.items():
+        if result.get("target_seconds") is not None and (
+            result["mean_seconds"] > result["target_seconds"]
+        ):
+            regressions.append(
+                f"{key}: {result['mean_seconds'] * 1000:.1f} ms/op "
+                f"(target {result['target_seconds'] * 1000:.1f} ms/op)"
+            )
+
+        if key not in baseline:
+            continue
+
+        base = baseline[key]
+
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{key}: {result['ops_per_sec']:.2f} ops/s "
+                f"(baseline {base['ops_per_sec']:.2f} ops/s)"
+            )
+
+        # Small allocations are noisy, only flag growths above 1 MiB
+        if result["peak_memory_mb"] > base["peak_memory_mb"] * (1 + threshold) + 1:
+            regressions.append(
+                f"{key}: {result['peak_memory_mb']:.2f} MiB peak "
+                f"(baseline {base['peak_memory_mb']:.2f} MiB)"
+            )
+
+    return regressions
@@ -0,0 +1,97 @@
+"""
+Runs the micro-benchmarks of the pipeline's CPU and I/O hot paths.
+
+    python -m benchmarks.run                    # all scales, compared with the baseline
+    python -m benchmarks.run --quick            # smallest scales only
+    python -m benchmarks.run -k get_score       # benchmarks whose name contains get_score
+    python -m benchmarks.run --save-baseline    # store the results as the new baseline
+    python -m benchmarks.run --check            # exit with status 1 on regressions or missed targets
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from . import bench_import, bench_pipeline  # noqa: F401 (registers the benchmarks)
+from .harness import (
+    compare,
+    format_result,
+    get_machine,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "-k", dest="names", action="append", help="run the matching benchmarks"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="only run the smallest scales"
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.5,
+        help="minimum measured seconds per benchmark and scale",
+    )
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="save the results as the baseline"
+    )
+    parser.add_argument("--output", type=Path, help="write the results to a JSON file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="tolerated relative loss of ops/s and growth of peak memory",
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="exit with status 1 on regressions"
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.names, args.quick, args.min_time)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"machine": get_machine(), "results": results}, f, indent=4)
+
+    if args.save_baseline:
+        if args.baseline.exists():
+            # Keep the baselines of the benchmarks and scales that were not run
+            baseline = load_baseline(args.baseline)["results"]
+            results = {**baseline, **results}
+
+        save_baseline(args.baseline, results)
+        print(f"Saved the baseline to {args.baseline}.")
+        return 0
+
+    # Without a baseline only the targets are checked
+    baseline = {"machine": get_machine(), "results": {}}
+
+    if args.baseline.exists():
+        baseline = load_baseline(args.baseline)
+
+        if baseline["machine"] != get_machine():
+            print(f"Warning: the baseline was measured on {baseline['machine']}.")
+
+        print("\nCompared with the baseline:")
+        for key, result in results.items():
+            if key in baseline["results"]:
+                print(format_result(key, result, baseline["results"][key]))
+
+    regressions = compare(results, baseline["results"], args.threshold)
+
+    for regression in regressions:
+        print(f"Regression: {regression}")
+
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
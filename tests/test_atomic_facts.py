@@ -1,8 +1,12 @@
+import asyncio
+import threading
+import time
 from unittest.mock import mock_open, patch
 import json
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock
 from FactScoreLite.atomic_facts import AtomicFactGenerator
+from FactScoreLite.cache import MemoCache
 from FactScoreLite import configs
 
 
@@ -12,7 +16,8 @@ def generator(monkeypatch):
         m.setattr("FactScoreLite.atomic_facts.OpenAIAgent", MagicMock())
 
         # Create an instance of AtomicFactGenerator for testing
-        generator = AtomicFactGenerator()
+        # (with a fresh sentence cache so that facts do not leak between tests)
+        generator = AtomicFactGenerator(sentence_cache=MemoCache())
 
         # Create a MagicMock object for the generate method
         mock_generate = MagicMock(return_value="Generated output.")
@@ -204,3 +209,278 @@ def test_fix_sentence_splitter_single_word_sentences(generator):
     initials = []
     expected = ["Wow. That was amazing."]
     assert generator.fix_sentence_splitter(sentences, initials) == expected
+
+
+def test_arun_keeps_sentence_order(generator, monkeypatch):
+    # Later sentences finish first, the output must still follow the text
+    async def aget_sentence_af(sent):
+        await asyncio.sleep(0.01 if sent.startswith("First") else 0)
+        return [f"{sent[:-1]} fact."]
+
+    monkeypatch.setattr(generator, "aget_sentence_af", aget_sentence_af)
+    monkeypatch.setattr(
+        generator,
+        "split_sentences",
+        lambda text: ["First sentence.", "Second sentence."],
+    )
+
+    result = asyncio.run(generator.arun("First sentence. Second sentence."))
+
+    assert result == [
+        ("First sentence.", ["First sentence fact."]),
+        ("Second sentence.", ["Second sentence fact."]),
+    ]
+
+
+def test_aget_sentence_af_uses_async_agent(generator):
+    generator.demons = []
+    generator._async_openai_agent = MagicMock(
+        generate=AsyncMock(return_value="- Fact 1.\n- Fact 2.")
+    )
+
+    result = asyncio.run(generator.aget_sentence_af("Sentence."))
+
+    assert result == ["Fact 1.", "Fact 2."]
+    generator._async_openai_agent.generate.assert_awaited_once_with(
+        generator.get_prompt("Sentence."), system=generator.get_instructions()
+    )
+
+
+# Packed extraction
+def test_pack_output_to_sentences(generator):
+    text = (
+        '{"sentence": 1, "facts": ["Fact 1", "Fact 2."]}\n'
+        "not json\n"
+        '{"sentence": 3, "facts": []}\n'
+        '{"sentence": 7, "facts": ["Out of range"]}\n'
+        '{"sentence": 2, "facts": "not a list"}'
+    )
+    assert generator.pack_output_to_sentences(text, 3) == [
+        ["Fact 1.", "Fact 2."],
+        None,
+        [],
+    ]
+
+
+def test_pack_output_to_sentences_truncated_output(generator):
+    text = '{"sentence": 1, "facts": ["Fact 1."]}\n{"sentence": 2, "facts": ["Fa'
+    assert generator.pack_output_to_sentences(text, 2) == [["Fact 1."], None]
+
+
+def test_get_pack_prompt_lists_numbered_sentences(generator):
+    generator.demons = []
+    prompt = generator.get_pack_prompt(["Sentence 1.", "Sentence 2."])
+
+    assert prompt.startswith("Sentences:\n")
+    assert generator.get_pack_instructions().startswith(generator.get_instructions())
+    assert "Sentences:\n1. Sentence 1.\n2. Sentence 2.\n" in prompt
+    assert prompt.endswith("Independent Facts:\n")
+
+
+def test_get_sentences_af_packed_uses_one_request(generator):
+    generator.demons = []
+    generator.pack_token_budget = 10_000
+    generator.openai_agent.generate.side_effect = [
+        '{"sentence": 1, "facts": ["Fact 1."]}\n{"sentence": 2, "facts": ["Fact 2."]}'
+    ]
+
+    atoms = generator.get_sentences_af(["Sentence 1.", "Sentence 2."])
+
+    assert atoms == [["Fact 1."], ["Fact 2."]]
+    assert generator.openai_agent.generate.call_count == 1
+
+
+def test_get_sentences_af_packed_retries_unparsed_sentences(generator):
+    generator.demons = []
+    generator.pack_token_budget = 10_000
+    generator.openai_agent.generate.side_effect = [
+        '{"sentence": 2, "facts": ["Fact 2."]}',
+        "- Fact 1.",
+    ]
+
+    atoms = generator.get_sentences_af(["Sentence 1.", "Sentence 2."])
+
+    assert atoms == [["Fact 1."], ["Fact 2."]]
+    retry_prompt = generator.openai_agent.generate.call_args_list[1][0][0]
+    assert retry_prompt == generator.get_prompt("Sentence 1.")
+
+
+def test_get_packs_respects_token_budget(generator):
+    generator.demons = []
+    prefix = generator.get_pack_instructions() + generator.get_pack_prompt([])
+    prefix_tokens = len(prefix) // 4 + 1
+    sentence = "x" * 40  # 11 tokens + 2 for numbering
+    generator.pack_token_budget = prefix_tokens + 30
+
+    packs = generator.get_packs([sentence] * 5)
+
+    assert packs == [[sentence] * 2, [sentence] * 2, [sentence]]
+
+
+def test_run_many_shares_packs_across_texts(generator, monkeypatch):
+    generator.demons = []
+    generator.pack_token_budget = 10_000
+    monkeypatch.setattr(
+        generator,
+        "split_sentences",
+        lambda text: {"Text 1": ["S1.", "S2."], "Text 2": ["S3."]}[text],
+    )
+    generator.openai_agent.generate.side_effect = [
+        "\n".join(f'{{"sentence": {i}, "facts": ["Fact {i}."]}}' for i in range(1, 4))
+    ]
+
+    result = generator.run_many(["Text 1", "Text 2"])
+
+    assert result == [
+        [("S1.", ["Fact 1."]), ("S2.", ["Fact 2."])],
+        [("S3.", ["Fact 3."])],
+    ]
+    assert generator.openai_agent.generate.call_count == 1
+
+
+def test_aget_sentences_af_packed_retries_unparsed_sentences(generator):
+    generator.demons = []
+    generator.pack_token_budget = 10_000
+    generator._async_openai_agent = MagicMock(
+        generate=AsyncMock(
+            side_effect=['{"sentence": 1, "facts": ["Fact 1."]}', "- Fact 2."]
+        )
+    )
+
+    atoms = asyncio.run(generator.aget_sentences_af(["Sentence 1.", "Sentence 2."]))
+
+    assert atoms == [["Fact 1."], ["Fact 2."]]
+
+
+def test_get_sentences_af_extracts_repeated_sentences_once(generator):
+    generator.demons = []
+    generator.openai_agent.generate.side_effect = lambda prompt, system=None: "- Fact."
+
+    atoms = generator.get_sentences_af(["Same.", "Other.", " Same. "])
+
+    assert atoms == [["Fact."], ["Fact."], ["Fact."]]
+    assert generator.openai_agent.generate.call_count == 2
+
+
+def test_get_sentences_af_reuses_cached_sentences(generator):
+    generator.demons = []
+    generator.openai_agent.generate.side_effect = lambda prompt, system=None: "- Fact."
+
+    generator.get_sentences_af(["Sentence 1."])
+    generator.get_sentences_af(["Sentence 1.", "Sentence 2."])
+
+    assert generator.openai_agent.generate.call_count == 2
+    assert generator.get_cache_stats()["hits"] == 1
+
+
+def test_get_sentences_af_waits_for_sentences_in_flight(generator):
+    generator.demons = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def generate(prompt, system=None):
+        started.set()
+        release.wait(5)
+        return "- Fact."
+
+    generator.openai_agent.generate.side_effect = generate
+    results = []
+    first = threading.Thread(
+        target=lambda: results.append(generator.get_sentences_af(["Sentence."]))
+    )
+    first.start()
+    started.wait(5)
+    second = threading.Thread(
+        target=lambda: results.append(generator.get_sentences_af(["Sentence."]))
+    )
+    second.start()
+    time.sleep(0.05)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert results == [[["Fact."]], [["Fact."]]]
+    assert generator.openai_agent.generate.call_count == 1
+    assert not generator.in_flight
+
+
+def test_get_sentences_af_failure_is_not_cached(generator):
+    generator.demons = []
+    generator.openai_agent.generate.side_effect = [RuntimeError("boom"), "- Fact."]
+
+    with pytest.raises(RuntimeError):
+        generator.get_sentences_af(["Sentence."])
+
+    assert generator.get_sentences_af(["Sentence."]) == [["Fact."]]
+    assert not generator.in_flight
+
+
+def test_aget_sentences_af_dedupes_concurrent_sentences(generator):
+    generator.demons = []
+    generator._async_openai_agent = MagicMock(
+        generate=AsyncMock(return_value="- Fact.")
+    )
+
+    async def run():
+        return await asyncio.gather(
+            generator.aget_sentences_af(["Sentence."]),
+            generator.aget_sentences_af(["Sentence.", "Other."]),
+        )
+
+    assert asyncio.run(run()) == [[["Fact."]], [["Fact."], ["Fact."]]]
+    assert generator.async_openai_agent.generate.await_count == 2
+    assert not generator.async_in_flight
+
+
+def test_instructions_are_built_once(generator, monkeypatch):
+    generator.demons = mock_demons_data
+    build_instructions = MagicMock(wraps=generator.build_instructions)
+    monkeypatch.setattr(generator, "build_instructions", build_instructions)
+
+    assert generator.get_instructions() is generator.get_instructions()
+    assert build_instructions.call_count == 1
+
+    generator.demons = []
+    assert generator.get_instructions() == (
+        "Please breakdown the following sentence into independent facts:\n\n"
+    )
+    assert generator.get_prompt_stats() == {"extraction": 17}
+
+
+def test_instructions_are_shared_by_generators(generator):
+    other = AtomicFactGenerator(sentence_cache=MemoCache())
+    other.demons = generator.demons = [dict(demon) for demon in mock_demons_data]
+
+    assert other.get_instructions() is generator.get_instructions()
+
+    other.demons = mock_demons_data[:1]
+    assert other.get_instructions() != generator.get_instructions()
+
+
+def test_astream_sentences_af_reports_facts_as_they_are_parsed(generator):
+    output = "- Fact one.\n- Fact - two\n- Fact three"
+    chunks = [output[i : i + 3] for i in range(0, len(output), 3)]
+    reported = []
+
+    class StreamingAgent:
+        async def stream(self, prompt, system=None):
+            for chunk in chunks:
+                # Only the facts completed by the chunks so far are reported
+                reported.append(len(facts))
+                yield chunk
+
+    facts = []
+    generator._async_openai_agent = StreamingAgent()
+    generator.sentence_cache.set(generator.get_sentence_key("Cached."), ["Cached."])
+
+    atoms = asyncio.run(
+        generator.astream_sentences_af(["Sentence.", "Cached."], facts.append)
+    )
+
+    assert atoms == [generator.gpt_output_to_sentences(output), ["Cached."]]
+    assert facts == ["Cached.", "Fact one.", "Fact.", "two.", "Fact three."]
+    # The first fact was reported before the output ended
+    assert reported[-1] > 1
+    assert generator.sentence_cache.get(generator.get_sentence_key("Sentence.")) == (
+        atoms[0]
+    )
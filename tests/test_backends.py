@@ -0,0 +1,236 @@
+import asyncio
+import time
+import pytest
+from FactScoreLite import FactScore, LLMBackend, FakeBackend, configs
+from FactScoreLite.atomic_facts import AtomicFactGenerator
+from FactScoreLite.backends import FakeBackendError
+from FactScoreLite.cache import MemoCache
+from FactScoreLite.fact_scorer import FactScorer
+from FactScoreLite.retry import RetryPolicy
+
+
+def split_sentences(text):
+    return [sent.strip() + "." for sent in text.split(".") if sent.strip()]
+
+
+def test_fake_backend_implements_protocol():
+    assert isinstance(FakeBackend(), LLMBackend)
+
+
+def test_fake_backend_is_deterministic():
+    requests = [(f"Statement:\nfact {i} True or False?\n", None) for i in range(20)]
+    first = FakeBackend(latency=0.001, latency_sigma=1.0, error_rate=0.3)
+    second = FakeBackend(latency=0.001, latency_sigma=1.0, error_rate=0.3)
+
+    draws = [first.draw(*request) for request in requests]
+
+    assert draws == [second.draw(*request) for request in requests]
+    assert {fails for _, fails in draws} == {True, False}
+    assert len({latency for latency, _ in draws}) == len(draws)
+    # A retry is a new attempt with its own draw
+    assert [first.draw(*request) for request in requests] != draws
+
+
+def test_fake_backend_errors_and_retries():
+    with pytest.raises(FakeBackendError):
+        FakeBackend(error_rate=1.0).generate("prompt")
+
+    retry_policy = RetryPolicy(
+        max_retries=20, base_delay=0, max_delay=0, errors=(FakeBackendError,)
+    )
+    backend = FakeBackend(error_rate=0.5, retry_policy=retry_policy)
+
+    outputs = backend.generate_batch([(f"prompt {i}", None) for i in range(20)])
+
+    assert outputs == [""] * 20
+    assert backend.stats()["errors"] > 0
+    assert backend.stats()["calls"] == 20 + backend.stats()["errors"]
+
+
+def test_fake_backend_latency_overlaps_in_async():
+    backend = FakeBackend(latency=0.05, max_concurrency=20)
+
+    start = time.monotonic()
+    outputs = asyncio.run(
+        backend.agenerate_batch([(f"prompt {i}", None) for i in range(20)])
+    )
+
+    assert len(outputs) == 20
+    assert time.monotonic() - start < 0.5
+
+
+def test_components_use_backend():
+    backend = FakeBackend(support_rate=0.5)
+    generator = AtomicFactGenerator(sentence_cache=MemoCache(), backend=backend)
+    generator.split_sentences = split_sentences
+    scorer = FactScorer(decision_cache=MemoCache(), backend=backend)
+
+    [(sentence, facts)] = generator.run("The sky is blue.")
+
+    assert facts == ["The sky is blue (1).", "The sky is blue (2)."]
+    assert generator.get_config()["backend"] == "fake"
+
+    facts = [f"Fact number {i}." for i in range(20)]
+    decisions = scorer.get_score(facts, "Context.")
+    scorer.batch_size = 4
+    scorer.decision_cache = MemoCache()
+
+    assert [d["is_supported"] for d in scorer.get_score(facts, "Context.")] == [
+        d["is_supported"] for d in decisions
+    ]
+    assert {d["is_supported"] for d in decisions} == {True, False}
+
+
+def test_packed_extraction_with_backend():
+    generator = AtomicFactGenerator(
+        pack_token_budget=10_000, sentence_cache=MemoCache(), backend=FakeBackend()
+    )
+    generator.split_sentences = split_sentences
+
+    results = asyncio.run(generator.arun_many(["A is B. C is D.", "E is F."]))
+
+    assert results[1] == [("E is F.", ["E is F (1).", "E is F (2)."])]
+    assert generator.get_cache_stats()["misses"] == 3
+
+
+def test_factscore_with_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(configs, "facts_db_path", str(tmp_path / "facts.jsonl"))
+    monkeypatch.setattr(configs, "decisions_db_path", str(tmp_path / "decisions.jsonl"))
+
+    backend = FakeBackend(support_rate=1.0)
+    fs = FactScore(gamma=0, backend=backend)
+    fs.atomic_fact_generator.sentence_cache = MemoCache()
+    fs.atomic_fact_generator.split_sentences = split_sentences
+    fs.fact_scorer.decision_cache = MemoCache()
+
+    assert fs.get_factscore(["A is B. C is D."], ["A is B."]) == (1.0, 1.0)
+    assert asyncio.run(fs.aget_factscore(["E is F."], ["E is F."])) == (1.0, 1.0)
+    assert backend.stats()["calls"] == 3 + 6
+    assert fs.get_config()["backend"] == "fake"
+
+    with pytest.raises(ValueError):
+        fs.get_factscore_batch(["A is B."], ["A is B."])
+
+
+def make_streaming_factscore(tmp_path, monkeypatch, backend):
+    monkeypatch.setattr(configs, "facts_db_path", str(tmp_path / "facts.jsonl"))
+    monkeypatch.setattr(configs, "decisions_db_path", str(tmp_path / "decisions.jsonl"))
+
+    fs = FactScore(gamma=0, backend=backend)
+    fs.atomic_fact_generator.sentence_cache = MemoCache()
+    fs.atomic_fact_generator.split_sentences = split_sentences
+    fs.fact_scorer.decision_cache = MemoCache()
+    return fs
+
+
+def test_iter_factscore_yields_running_aggregate(tmp_path, monkeypatch):
+    fs = make_streaming_factscore(tmp_path, monkeypatch, FakeBackend(support_rate=1.0))
+    items = iter([("A is B. C is D.", "A is B."), ("E is F.", "E is F.")])
+
+    results = list(fs.iter_factscore(items))
+
+    results.sort(key=lambda result: result["index"])
+    assert [len(result["facts"]) for result in results] == [4, 2]
+    assert results[0]["decision"][0]["is_supported"]
+    assert max(result["aggregate"]["count"] for result in results) == 2
+    assert (
+        results[1]["aggregate"]["score"] == results[1]["aggregate"]["init_score"] == 1.0
+    )
+    assert len(fs.facts_handler.load()) == len(fs.decisions_handler.load()) == 2
+
+
+def test_iter_factscore_resumes_from_saved_items(tmp_path, monkeypatch):
+    items = [("A is B.", "A is B."), ("C is D.", "C is D.")]
+    fs = make_streaming_factscore(tmp_path, monkeypatch, FakeBackend())
+
+    (result,) = fs.iter_factscore(items[:1])
+
+    backend = FakeBackend()
+    fs = make_streaming_factscore(tmp_path, monkeypatch, backend)
+    results = sorted(fs.iter_factscore(items), key=lambda result: result["index"])
+
+    assert results[0]["facts"] == result["facts"]
+    # Only the second item is extracted (1 call) and verified (2 calls)
+    assert backend.stats()["calls"] == 3
+
+
+def test_aiter_factscore_yields_as_items_finish(tmp_path, monkeypatch):
+    fs = make_streaming_factscore(tmp_path, monkeypatch, FakeBackend(support_rate=1.0))
+
+    async def items():
+        yield "A is B. C is D. E is F.", "A is B."
+        yield "G is H.", "G is H."
+
+    async def collect():
+        return [result async for result in fs.aiter_factscore(items())]
+
+    results = asyncio.run(collect())
+
+    assert sorted(result["index"] for result in results) == [0, 1]
+    assert results[-1]["aggregate"]["count"] == 2
+    assert results[-1]["aggregate"]["score"] == 1.0
+
+
+def test_pipeline_overlaps_extraction_and_verification(tmp_path, monkeypatch):
+    backend = FakeBackend(support_rate=0.5, latency=0.01)
+    fs = make_streaming_factscore(tmp_path, monkeypatch, backend)
+    fs.pipeline = True
+    calls = []
+    respond = backend.respond
+    backend.respond = lambda prompt, system: calls.append(system) or respond(
+        prompt, system
+    )
+    generations = [f"A{i} is B. C{i} is D." for i in range(6)]
+
+    scores = fs.get_factscore(generations, ["A is B."] * 6)
+
+    extraction = fs.atomic_fact_generator.get_instructions()
+    first_verification = next(
+        i for i, system in enumerate(calls) if system != extraction
+    )
+    last_extraction = max(i for i, system in enumerate(calls) if system == extraction)
+    assert first_verification < last_extraction
+
+    # Same scores as the two-phase run and the async pipeline
+    for name, pipeline in [("two-phase", False), ("async", True)]:
+        (tmp_path / name).mkdir()
+        fs = make_streaming_factscore(
+            tmp_path / name, monkeypatch, FakeBackend(support_rate=0.5)
+        )
+        fs.pipeline = pipeline
+        assert asyncio.run(fs.aget_factscore(generations, ["A is B."] * 6)) == scores
+
+
+def test_stream_extraction_verifies_facts_while_extracting(tmp_path, monkeypatch):
+    backend = FakeBackend(support_rate=0.5, facts_per_sentence=4, latency=0.01)
+    fs = make_streaming_factscore(tmp_path, monkeypatch, backend)
+    fs.pipeline = fs.stream_extraction = True
+    events = []
+    astream = backend.astream
+    aget_score = fs.fact_scorer.aget_score
+
+    async def traced_stream(prompt, system=None):
+        async for line in astream(prompt, system):
+            yield line
+        events.append("extracted")
+
+    async def traced_score(facts, knowledge_source):
+        events.append("verify")
+        return await aget_score(facts, knowledge_source)
+
+    backend.astream = traced_stream
+    fs.fact_scorer.aget_score = traced_score
+    generations = ["A is B.", "C is D. E is F."]
+
+    scores = asyncio.run(fs.aget_factscore(generations, ["A is B."] * 2))
+
+    assert events.index("verify") < events.index("extracted")
+    assert events.count("verify") == 12
+
+    (tmp_path / "batched").mkdir()
+    fs = make_streaming_factscore(
+        tmp_path / "batched",
+        monkeypatch,
+        FakeBackend(support_rate=0.5, facts_per_sentence=4),
+    )
+    assert asyncio.run(fs.aget_factscore(generations, ["A is B."] * 2)) == scores
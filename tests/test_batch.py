@@ -0,0 +1,302 @@
+import json
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from FactScoreLite import FactScore, configs
+from FactScoreLite.batch import BatchRunner
+from FactScoreLite.cache import MemoCache
+from FactScoreLite.usage import UsageStats
+
+
+class LocalBatchAPI:
+    """
+    A local stand-in for the files and batches endpoints of the OpenAI client.
+    Batches complete on the first retrieve (or stay in progress while hold is set),
+    answering every request with respond(body).
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.hold = False
+        self.files_store = {}
+        self.batches_store = {}
+        self.requests = []
+        self.files = SimpleNamespace(create=self.create_file, content=self.get_content)
+        self.batches = SimpleNamespace(
+            create=self.create_batch, retrieve=self.retrieve_batch
+        )
+
+    def create_file(self, file, purpose):
+        assert purpose == "batch"
+        file_id = f"file-{len(self.files_store)}"
+        self.files_store[file_id] = file.read().decode("utf-8")
+        return SimpleNamespace(id=file_id)
+
+    def get_content(self, file_id):
+        return SimpleNamespace(text=self.files_store[file_id])
+
+    def create_batch(self, input_file_id, endpoint, completion_window):
+        assert endpoint == "/v1/chat/completions"
+        batch_id = f"batch-{len(self.batches_store)}"
+        self.batches_store[batch_id] = SimpleNamespace(
+            id=batch_id,
+            status="in_progress",
+            input_file_id=input_file_id,
+            output_file_id=None,
+        )
+        return self.batches_store[batch_id]
+
+    def retrieve_batch(self, batch_id):
+        batch = self.batches_store[batch_id]
+
+        if batch.status == "in_progress" and not self.hold:
+            lines = []
+
+            for line in self.files_store[batch.input_file_id].splitlines():
+                request = json.loads(line)
+                self.requests.append(request)
+                lines.append(
+                    json.dumps(
+                        {
+                            "custom_id": request["custom_id"],
+                            "response": self.respond(request["body"]),
+                        }
+                    )
+                )
+
+            batch.output_file_id = f"file-{len(self.files_store)}"
+            self.files_store[batch.output_file_id] = "\n".join(lines)
+            batch.status = "completed"
+
+        return batch
+
+
+def completion(content, prompt_tokens=10, completion_tokens=5):
+    return {
+        "status_code": 200,
+        "body": {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+            },
+        },
+    }
+
+
+def respond(body):
+    prompt = body["messages"][-1]["content"]
+
+    if prompt.startswith("Sentence:"):
+        return completion("- The sky is blue.\n- Grass is green.")
+
+    return completion("True")
+
+
+@pytest.fixture
+def agent():
+    agent = MagicMock(
+        model_name="gpt-test",
+        max_tokens=16,
+        temp=0.0,
+        stage="extraction",
+        cache=MemoCache(),
+        usage=UsageStats(prices={"gpt-test": (1.0, 2.0)}),
+    )
+    agent.get_cache_key.side_effect = lambda prompt, system=None: f"{system}|{prompt}"
+    agent.check_budget.side_effect = agent.usage.check_budget
+    return agent
+
+
+def test_run_ingests_responses_into_cache(tmp_path, agent):
+    api = LocalBatchAPI(respond)
+    runner = BatchRunner(api, tmp_path, poll_interval=0)
+
+    requests = [
+        ("Sentence:\na", "sys"),
+        ("Sentence:\nb", "sys"),
+        ("Sentence:\na", "sys"),
+    ]
+
+    assert runner.run("extraction", requests, agent) == 2
+    assert len(api.requests) == 2
+    assert api.requests[0]["body"]["model"] == "gpt-test"
+    assert api.requests[0]["body"]["messages"][0] == {
+        "role": "system",
+        "content": "sys",
+    }
+    assert agent.cache.get("sys|Sentence:\na").startswith("- The sky is blue.")
+
+    # Batch requests are billed at half price
+    usage = agent.usage.summary()
+    assert usage["stages"]["extraction"]["calls"] == 2
+    assert usage["cost"] == pytest.approx(2 * (10 + 5 * 2) / 1e6 * 0.5)
+
+    # Cached requests are not submitted again
+    assert runner.run("extraction", requests, agent) == 0
+    assert len(api.requests) == 2
+
+
+def test_run_splits_requests_into_batches(tmp_path, agent):
+    api = LocalBatchAPI(respond)
+    runner = BatchRunner(api, tmp_path, poll_interval=0, max_requests=2)
+
+    runner.run("extraction", [(f"p{i}", None) for i in range(5)], agent)
+
+    assert len(api.batches_store) == 3
+    assert all(
+        entry["ingested"] for entry in runner.load_state("extraction")["batches"]
+    )
+
+
+def test_run_resumes_submitted_batches(tmp_path, agent, monkeypatch):
+    api = LocalBatchAPI(respond)
+    runner = BatchRunner(api, tmp_path, poll_interval=0)
+    api.hold = True
+
+    def interrupt(seconds):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr("FactScoreLite.batch.time.sleep", interrupt)
+
+    with pytest.raises(KeyboardInterrupt):
+        runner.run("extraction", [("p0", None), ("p1", None)], agent)
+
+    assert runner.load_state("extraction") == {
+        "batches": [{"id": "batch-0", "ingested": False}]
+    }
+
+    # A new run polls the recorded batch instead of submitting the requests again
+    api.hold = False
+    resumed = BatchRunner(api, tmp_path, poll_interval=0)
+
+    assert resumed.run("extraction", [("p0", None), ("p1", None)], agent) == 2
+    assert len(api.batches_store) == 1
+
+
+def test_run_skips_failed_requests(tmp_path, agent):
+    def respond_with_errors(body):
+        if body["messages"][-1]["content"] == "bad":
+            return {"status_code": 500, "body": {"error": {"message": "Server error"}}}
+
+        return completion("ok")
+
+    api = LocalBatchAPI(respond_with_errors)
+    runner = BatchRunner(api, tmp_path, poll_interval=0)
+
+    assert runner.run("verification", [("good", None), ("bad", None)], agent) == 1
+    assert agent.cache.get("None|good") == "ok"
+    assert agent.cache.get("None|bad") is None
+
+
+def test_run_uses_own_cache_for_agents_without_one(tmp_path, agent):
+    agent.cache = None
+    runner = BatchRunner(LocalBatchAPI(respond), tmp_path, poll_interval=0)
+
+    runner.run("extraction", [("p0", None)], agent)
+
+    assert agent.cache is None
+    assert (tmp_path / "responses.sqlite").exists()
+
+    with runner.attach(agent) as cache:
+        assert agent.cache is cache is runner.get_cache()
+        assert cache.get("None|p0") is not None
+
+    assert agent.cache is None
+
+
+def test_attach_restores_the_cache_on_error(tmp_path, agent):
+    cache = agent.cache
+    agent.cache = None
+    runner = BatchRunner(LocalBatchAPI(respond), tmp_path, poll_interval=0)
+
+    with pytest.raises(RuntimeError):
+        with runner.attach(agent):
+            raise RuntimeError
+
+    assert agent.cache is None
+
+    agent.cache = cache
+
+    with runner.attach(agent):
+        assert agent.cache is cache
+
+    assert agent.cache is cache
+
+
+def test_get_factscore_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(configs, "facts_db_path", str(tmp_path / "facts.jsonl"))
+    monkeypatch.setattr(configs, "decisions_db_path", str(tmp_path / "decisions.jsonl"))
+
+    # Every response must come from the batches, not from a direct call
+    client = MagicMock()
+    client.chat.completions.create.side_effect = AssertionError("Unexpected call")
+    monkeypatch.setattr("FactScoreLite.openai_agent.OpenAI", lambda: client)
+
+    fs = FactScore(gamma=0)
+    fs.atomic_fact_generator.sentence_cache = MemoCache()
+    fs.fact_scorer.decision_cache = MemoCache()
+    monkeypatch.setattr(
+        fs.atomic_fact_generator,
+        "split_sentences",
+        lambda text: [sent.strip() + "." for sent in text.split(".") if sent.strip()],
+    )
+    api = LocalBatchAPI(respond)
+    runner = BatchRunner(api, tmp_path / "batches", poll_interval=0)
+
+    generations = ["The sky is blue. Grass is green.", "The sky is blue."]
+    score, init_score = fs.get_factscore_batch(
+        generations, ["Blue sky, green grass."] * 2, runner
+    )
+
+    assert (score, init_score) == (1.0, 1.0)
+    # The agents get their own (disabled) response caches back
+    assert fs.atomic_fact_generator.openai_agent.cache is None
+    assert fs.fact_scorer.openai_agent.cache is None
+    phases = [
+        request["body"]["messages"][-1]["content"].split(":")[0]
+        for request in api.requests
+    ]
+    assert phases.count("Sentence") == 2
+    assert (
+        fs.facts_handler.load()[0]["facts"]
+        == [
+            "The sky is blue.",
+            "Grass is green.",
+        ]
+        * 2
+    )
+    assert len(fs.decisions_handler.load()) == 2
+    assert fs.usage.summary()["stages"]["verification"]["calls"] > 0
+    assert fs.pack_token_budget == configs.extraction_token_budget
+
+
+def test_get_factscore_batch_does_not_pack_sentences(tmp_path, monkeypatch):
+    monkeypatch.setattr(configs, "facts_db_path", str(tmp_path / "facts.jsonl"))
+    monkeypatch.setattr(configs, "decisions_db_path", str(tmp_path / "decisions.jsonl"))
+
+    # Packed prompts would miss the batch responses and be sent directly
+    client = MagicMock()
+    client.chat.completions.create.side_effect = AssertionError("Unexpected call")
+    client.chat.completions.with_raw_response.create.side_effect = AssertionError(
+        "Unexpected call"
+    )
+    monkeypatch.setattr("FactScoreLite.openai_agent.OpenAI", lambda: client)
+
+    fs = FactScore(gamma=0, pack_token_budget=5000)
+    fs.atomic_fact_generator.sentence_cache = MemoCache()
+    fs.fact_scorer.decision_cache = MemoCache()
+    monkeypatch.setattr(
+        fs.atomic_fact_generator,
+        "split_sentences",
+        lambda text: [sent.strip() + "." for sent in text.split(".") if sent.strip()],
+    )
+    runner = BatchRunner(LocalBatchAPI(respond), tmp_path / "batches", poll_interval=0)
+
+    score, _ = fs.get_factscore_batch(
+        ["The sky is blue. Grass is green."], ["Blue sky, green grass."], runner
+    )
+
+    assert score == 1.0
+    assert fs.pack_token_budget == 5000
+    assert fs.atomic_fact_generator.pack_token_budget == 5000
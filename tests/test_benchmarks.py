@@ -0,0 +1,68 @@
+from benchmarks import run
+from benchmarks.harness import (
+    BENCHMARKS,
+    benchmark,
+    compare,
+    load_baseline,
+    measure,
+    run_benchmarks,
+)
+
+
+def test_measure_reports_throughput_and_memory():
+    result = measure(lambda: bytearray(2**20), min_time=0.01)
+
+    assert result["runs"] >= 1
+    assert result["ops_per_sec"] > 0
+    assert result["peak_memory_mb"] >= 1
+
+
+def test_compare_flags_regressions():
+    baseline = {
+        "a[1]": {"ops_per_sec": 100.0, "peak_memory_mb": 10.0},
+        "b[1]": {"ops_per_sec": 100.0, "peak_memory_mb": 10.0},
+    }
+    results = {
+        "a[1]": {"ops_per_sec": 90.0, "peak_memory_mb": 11.0},
+        "b[1]": {"ops_per_sec": 50.0, "peak_memory_mb": 20.0},
+        "c[1]": {"ops_per_sec": 1.0, "peak_memory_mb": 100.0},
+    }
+
+    regressions = compare(results, baseline, threshold=0.2)
+
+    assert len(regressions) == 2
+    assert all(regression.startswith("b[1]") for regression in regressions)
+
+
+def test_run_saves_and_checks_baseline(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    args = ["-k", "detect_initials", "--quick", "--min-time", "0"]
+
+    assert run.main(args + ["--baseline", str(baseline), "--save-baseline"]) == 0
+    assert list(load_baseline(baseline)["results"]) == [
+        "AtomicFactGenerator.detect_initials[1000]"
+    ]
+    assert run.main(args + ["--baseline", str(baseline), "--threshold", "10"]) == 0
+
+
+def test_compare_flags_missed_targets():
+    results = {"a[1]": {"ops_per_sec": 5.0, "mean_seconds": 0.2, "target_seconds": 0.1}}
+
+    assert compare(results, {}) == ["a[1]: 200.0 ms/op (target 100.0 ms/op)"]
+
+
+def test_work_dir_is_removed_after_the_run():
+    work_dirs = []
+
+    @benchmark("test work dir", [1], work_dir=True)
+    def setup(scale, work_dir):
+        work_dirs.append(work_dir)
+        return lambda: (work_dir / "state.jsonl").write_text("{}\n")
+
+    try:
+        run_benchmarks(["test work dir"], min_time=0, report=lambda line: None)
+    finally:
+        del BENCHMARKS["test work dir"]
+
+    assert len(work_dirs) == 1
+    assert not work_dirs[0].exists()
@@ -0,0 +1,149 @@
+import threading
+import time
+from FactScoreLite import configs
+from FactScoreLite.cache import (
+    DiskCache,
+    MemoCache,
+    make_key,
+    get_response_cache,
+    get_decision_cache,
+    get_sentence_cache,
+    get_memo_cache,
+)
+
+
+def test_make_key_is_stable_and_content_addressed():
+    assert make_key("model", 0.7, 1024, "prompt") == make_key(
+        "model", 0.7, 1024, "prompt"
+    )
+    assert make_key("model", 0.7, 1024, "prompt") != make_key(
+        "model", 0.0, 1024, "prompt"
+    )
+
+
+def test_get_set_and_counters(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite")
+
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert len(cache) == 1
+
+
+def test_values_persist_across_instances(tmp_path):
+    DiskCache(tmp_path / "cache.sqlite").set("key", ["a", "b"])
+
+    assert DiskCache(tmp_path / "cache.sqlite").get("key") == ["a", "b"]
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite", max_age=0.01)
+    cache.set("key", "value")
+    time.sleep(0.02)
+
+    assert cache.get("key") is None
+    cache.evict()
+    assert len(cache) == 0
+
+
+def test_evicts_oldest_entries_beyond_max_entries(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite", max_entries=2)
+
+    for i in range(4):
+        cache.set(f"key{i}", i)
+        time.sleep(0.001)
+
+    cache.evict()
+
+    assert len(cache) == 2
+    assert cache.get("key0") is None
+    assert cache.get("key3") == 3
+
+
+def test_concurrent_writers(tmp_path):
+    # Two instances on the same file stand in for two processes
+    caches = [DiskCache(tmp_path / "cache.sqlite") for _ in range(2)]
+
+    def write(worker):
+        for i in range(50):
+            caches[worker % 2].set(f"key{worker}-{i}", i)
+
+    threads = [threading.Thread(target=write, args=(w,)) for w in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(caches[0]) == 200
+
+
+def test_get_response_cache_is_opt_in_and_shared(tmp_path, monkeypatch):
+    monkeypatch.setattr(configs, "cache_path", None)
+    assert get_response_cache() is None
+
+    monkeypatch.setattr(configs, "cache_path", tmp_path / "responses.sqlite")
+    assert get_response_cache() is get_response_cache()
+
+
+def test_memo_cache_evicts_least_recently_used():
+    cache = MemoCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_memo_cache_falls_back_to_disk(tmp_path):
+    disk = DiskCache(tmp_path / "memo.sqlite")
+    MemoCache(max_size=1, disk=disk).set("a", {"is_supported": True})
+
+    cache = MemoCache(max_size=1, disk=disk)
+
+    assert cache.get("a") == {"is_supported": True}
+    assert cache.stats()["hits"] == 1
+    assert len(cache) == 1
+
+
+def test_get_decision_cache_is_shared(monkeypatch):
+    monkeypatch.setattr(configs, "decision_cache_size", 0)
+    assert get_decision_cache() is None
+
+    monkeypatch.setattr(configs, "decision_cache_size", 10)
+    assert get_decision_cache() is get_decision_cache()
+
+
+def test_get_memo_cache_follows_the_latest_size():
+    cache = get_memo_cache("resized", 3)
+    for key in "abc":
+        cache.set(key, key)
+
+    assert get_memo_cache("resized", 1) is cache
+    assert cache.max_size == 1
+    assert len(cache) == 1
+    assert cache.get("c") == "c"
+
+
+def test_get_memo_cache_bounds_its_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(configs, "memo_cache_max_entries", 2)
+    monkeypatch.setattr(configs, "cache_eviction_interval", 1)
+    cache = get_memo_cache("bounded", 10, tmp_path / "memo.sqlite")
+    for key in "abc":
+        cache.set(key, key)
+
+    assert len(cache.disk) == 2
+
+
+def test_get_sentence_cache_persists_to_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(configs, "sentence_cache_size", 10)
+    monkeypatch.setattr(configs, "sentence_cache_path", str(tmp_path / "s.sqlite"))
+    get_sentence_cache().set("key", ["Fact."])
+
+    assert get_sentence_cache() is get_sentence_cache()
+    assert DiskCache(tmp_path / "s.sqlite").get("key") == ["Fact."]
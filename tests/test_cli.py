@@ -0,0 +1,245 @@
+import io
+import json
+from unittest.mock import patch
+import pytest
+from FactScoreLite import BudgetExceeded, FactScore, FakeBackend, cli, configs
+from FactScoreLite.state_handler import read_state
+
+# The configs set by the command-line options
+OPTION_CONFIGS = [
+    "model_name",
+    "max_workers",
+    "split_workers",
+    "extraction_workers",
+    "verification_workers",
+    "pipeline_queue_size",
+    "verification_batch_size",
+    "cache_path",
+    "sentence_cache_path",
+    "decision_cache_path",
+    "sentence_cache_size",
+    "decision_cache_size",
+    "pipeline_recent_entries",
+    "state_backend",
+    "metrics_path",
+]
+
+
+@pytest.fixture(autouse=True)
+def restore_configs(monkeypatch):
+    for name in OPTION_CONFIGS:
+        monkeypatch.setattr(configs, name, getattr(configs, name))
+
+    with patch(
+        "FactScoreLite.atomic_facts.sent_tokenize", lambda text: text.split(". ")
+    ):
+        yield
+
+
+def run(tmp_path, records, *args):
+    path = tmp_path / "input.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    output = tmp_path / "output.jsonl"
+    status = cli.main(
+        [
+            str(path),
+            "-o",
+            str(output),
+            "--fake-backend",
+            "--facts-path",
+            str(tmp_path / "facts.jsonl"),
+            "--decisions-path",
+            str(tmp_path / "decisions.jsonl"),
+            *args,
+        ]
+    )
+    lines = output.read_text().splitlines() if output.exists() else []
+    return status, sorted(map(json.loads, lines), key=lambda line: line["index"])
+
+
+def test_scores_records(tmp_path, capsys):
+    records = [
+        {"id": "a", "generation": "A is B. C is D.", "knowledge_source": "A is B."},
+        {"generation": "E is F.", "knowledge_source": "E is F."},
+    ]
+
+    status, results = run(tmp_path, records, "--gamma", "0")
+
+    assert status == 0
+    assert [result.get("id") for result in results] == ["a", None]
+    assert [len(result["facts"]) for result in results] == [4, 2]
+    assert results[0]["usage"]["calls"] == 0
+    assert "Scored 2 generations" in capsys.readouterr().err
+    assert len((tmp_path / "decisions.jsonl").read_text().splitlines()) == 2
+
+
+def test_async_sqlite_and_custom_fields(tmp_path):
+    records = [{"text": "A is B.", "source": "A is B."}]
+
+    status, results = run(
+        tmp_path,
+        records,
+        "--async",
+        "--stream-extraction",
+        "--state-backend",
+        "sqlite",
+        "--generation-field",
+        "text",
+        "--knowledge-source-field",
+        "source",
+    )
+
+    assert status == 0
+    assert len(results[0]["decision"]) == 2
+
+
+def test_reads_stdin(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(
+        "sys.stdin",
+        io.StringIO('{"generation": "A is B.", "knowledge_source": "A is B."}\n\n'),
+    )
+    monkeypatch.chdir(tmp_path)
+
+    assert cli.main(["--fake-backend"]) == 0
+    assert json.loads(capsys.readouterr().out)["index"] == 0
+
+
+def test_sqlite_backend_with_the_default_paths(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "input.jsonl").write_text(
+        '{"generation": "A is B.", "knowledge_source": "A is B."}\n'
+    )
+    args = ["input.jsonl", "-o", "output.jsonl", "--fake-backend"]
+
+    # A JSONL run, then runs of the same input on the sqlite backend
+    assert cli.main(args) == 0
+    jsonl = (tmp_path / "decisions.jsonl").read_bytes()
+    assert cli.main([*args, "--state-backend", "sqlite"]) == 0
+
+    for shard in ["0", "1"]:
+        sharded = ["--state-backend", "sqlite", "--num-shards", "2", "--shard", shard]
+        assert cli.main([*args, *sharded]) == 0
+
+    assert (tmp_path / "decisions.jsonl").read_bytes() == jsonl
+    assert len(read_state(tmp_path / "decisions.sqlite", "sqlite")) == 1
+    assert len(list(tmp_path.glob("decisions-0000?-of-00002.sqlite"))) == 2
+    capsys.readouterr()
+
+    assert cli.main(["merge", "--num-shards", "2", "--state-backend", "sqlite"]) == 0
+    assert json.loads(capsys.readouterr().out)["count"] == 1
+
+
+def test_invalid_record(tmp_path, capsys):
+    records = [{"generation": "A is B."}]
+
+    status, results = run(tmp_path, records)
+
+    assert status == 1
+    assert "line 1" in capsys.readouterr().err
+
+
+def test_budget_exceeded(tmp_path, capsys):
+    records = [{"generation": "Budget is spent.", "knowledge_source": "A is B."}]
+
+    def respond(prompt, system=None):
+        raise BudgetExceeded("Token budget of 1 exceeded.")
+
+    with patch(
+        "FactScoreLite.backends.FakeBackend", lambda: FakeBackend(respond=respond)
+    ):
+        status, results = run(tmp_path, records, "--max-tokens", "1")
+
+    assert status == cli.BUDGET_EXCEEDED_STATUS
+    assert results == []
+    assert "results so far are saved" in capsys.readouterr().err
+
+
+def test_shards_and_merge(tmp_path, capsys):
+    records = [
+        {"id": i, "generation": f"A{i} is B. C{i} is D.", "knowledge_source": "A is B."}
+        for i in range(8)
+    ]
+    results = []
+
+    for shard in range(3):
+        status, shard_results = run(
+            tmp_path, records, "--shard", str(shard), "--num-shards", "3"
+        )
+        assert status == 0
+        assert all(records[r["index"]]["id"] == r["id"] for r in shard_results)
+        results += shard_results
+
+    assert sorted(result["index"] for result in results) == list(range(8))
+    assert (tmp_path / "decisions-00002-of-00003.jsonl").exists()
+    assert not (tmp_path / "decisions.jsonl").exists()
+    capsys.readouterr()
+
+    decisions_path = str(tmp_path / "decisions.jsonl")
+    assert (
+        cli.main(["merge", "--decisions-path", decisions_path, "--num-shards", "3"])
+        == 0
+    )
+
+    merged = json.loads(capsys.readouterr().out)
+    assert merged["count"] == 8
+    assert merged["score"] == pytest.approx(
+        sum(result["score"] for result in results) / 8
+    )
+
+
+def test_merge_counts_the_records_of_the_input(tmp_path, capsys):
+    records = [
+        {"generation": "A is B.", "knowledge_source": "A is B."},
+        {"generation": "A is B.", "knowledge_source": "A is B."},
+        {"generation": "C is D. E is F.", "knowledge_source": "A is B."},
+    ]
+
+    for shard in range(2):
+        assert (
+            run(tmp_path, records, "--shard", str(shard), "--num-shards", "2")[0] == 0
+        )
+
+    merge = ["merge", "--decisions-path", str(tmp_path / "decisions.jsonl")]
+    capsys.readouterr()
+    assert cli.main([*merge, "--num-shards", "2"]) == 0
+    assert json.loads(capsys.readouterr().out)["count"] == 2
+
+    input_path = str(tmp_path / "input.jsonl")
+    assert cli.main([*merge, "--num-shards", "2", "--input", input_path]) == 0
+    merged = json.loads(capsys.readouterr().out)
+    assert (merged["count"], merged["missing"]) == (3, 0)
+
+    # A run of another model in the same shard files
+    assert (
+        run(tmp_path, records, "--shard", "0", "--num-shards", "2", "--model", "other")[
+            0
+        ]
+        == 0
+    )
+    capsys.readouterr()
+    assert cli.main([*merge, "--num-shards", "2"]) == 1
+    assert "different model settings" in capsys.readouterr().err
+
+
+def test_shard_requires_num_shards(tmp_path):
+    with pytest.raises(SystemExit):
+        cli.main(["--shard", "1"])
+
+    with pytest.raises(SystemExit):
+        cli.main(["--shard", "3", "--num-shards", "3"])
+
+
+def test_max_workers_reaches_the_components(tmp_path):
+    records = [{"generation": "Workers are set.", "knowledge_source": "A is B."}]
+    instances = []
+
+    def create(**kwargs):
+        instances.append(FactScore(**kwargs))
+        return instances[-1]
+
+    with patch("FactScoreLite.factscore.FactScore", create):
+        status, _ = run(tmp_path, records, "--max-workers", "3")
+
+    assert status == 0
+    assert instances[0].atomic_fact_generator.max_workers == 3
+    assert instances[0].fact_scorer.max_workers == 3
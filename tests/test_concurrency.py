@@ -0,0 +1,176 @@
+import asyncio
+import contextvars
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+from openai import RateLimitError
+from FactScoreLite.concurrency import (
+    astaged_map,
+    ordered_map,
+    pack_by_budget,
+    staged_map,
+)
+from FactScoreLite.retry import RetryPolicy
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_ordered_map_keeps_order(max_workers):
+    def slow_square(x):
+        # Earlier items finish last
+        time.sleep(0.001 * (10 - x))
+        return x * x
+
+    assert list(ordered_map(slow_square, range(10), max_workers)) == [
+        x * x for x in range(10)
+    ]
+
+
+def test_ordered_map_runs_in_parallel():
+    barrier = threading.Barrier(3, timeout=5)
+
+    def wait(x):
+        # Only passes if three calls are running at the same time
+        barrier.wait()
+        return x
+
+    assert list(ordered_map(wait, [1, 2, 3], max_workers=3)) == [1, 2, 3]
+
+
+def test_ordered_map_propagates_errors():
+    def fail_on_two(x):
+        if x == 2:
+            raise ValueError("boom")
+        return x
+
+    with pytest.raises(ValueError):
+        list(ordered_map(fail_on_two, range(5), max_workers=2))
+
+
+def test_retrying_worker_does_not_stall_other_workers():
+    attempts = []
+    finished = []
+
+    def call(x):
+        if x == 0 and not attempts:
+            attempts.append(x)
+            raise RateLimitError(
+                "Simulated retryable error", response=MagicMock(), body=None
+            )
+        finished.append(x)
+        return x
+
+    call = RetryPolicy(base_delay=0.05, max_delay=0.05)(call)
+    results = list(ordered_map(call, range(6), max_workers=3))
+
+    assert results == list(range(6))
+    # The other items complete while the first one is backing off
+    assert finished[-1] == 0
+
+
+def test_ordered_map_propagates_context_variables():
+    variable = contextvars.ContextVar("variable", default=None)
+    variable.set("caller")
+
+    assert list(ordered_map(lambda _: variable.get(), range(3), 2)) == ["caller"] * 3
+
+
+@pytest.mark.parametrize(
+    "items, budget, expected",
+    [
+        ([1, 2, 3, 4], 5, [[1, 2], [3], [4]]),
+        ([6, 1, 1], 5, [[6], [1, 1]]),
+        ([], 5, []),
+    ],
+)
+def test_pack_by_budget(items, budget, expected):
+    assert pack_by_budget(items, budget, lambda x: x) == expected
+
+
+def test_staged_map_overlaps_stages_and_bounds_queues():
+    events = []
+    lock = threading.Lock()
+    started = 0
+
+    def items():
+        nonlocal started
+        for i in range(20):
+            started += 1
+            yield i
+
+    def first(x):
+        with lock:
+            events.append(("first", x))
+        time.sleep(0.002)
+        return x
+
+    def second(x):
+        with lock:
+            events.append(("second", x))
+        return x * 10
+
+    results = staged_map([(first, 2), (second, 1)], items(), queue_size=2)
+    index, output = next(results)
+
+    assert output == index * 10
+    # The second stage started before the first one finished the input
+    assert ("second", index) in events and len(events) < 40
+    # Backpressure: the input is not read far ahead of the consumer
+    assert started < 20
+
+    assert sorted(output for _, output in results) == sorted(
+        x * 10 for x in range(20) if x != index
+    )
+
+
+def test_staged_map_propagates_context_variables():
+    variable = contextvars.ContextVar("variable", default=None)
+    variable.set("caller")
+    stages = [(lambda _: variable.get(), 2), (lambda value: (value, variable.get()), 1)]
+
+    results = [output for _, output in staged_map(stages, range(3))]
+
+    assert results == [("caller", "caller")] * 3
+
+
+def test_staged_map_raises_stage_errors():
+    def fail(x):
+        if x == 3:
+            raise ValueError("bad item")
+        return x
+
+    with pytest.raises(ValueError):
+        list(staged_map([(fail, 2), (lambda x: x, 2)], range(10)))
+
+
+def test_astaged_map_overlaps_stages():
+    async def first(x):
+        await asyncio.sleep(0.001 * x)
+        return x
+
+    async def second(x):
+        return -x
+
+    async def items():
+        for i in range(5):
+            yield i
+
+    async def collect():
+        return [
+            value async for value in astaged_map([(first, 5), (second, 2)], items())
+        ]
+
+    results = asyncio.run(collect())
+
+    assert sorted(results) == [(i, -i) for i in range(5)]
+
+
+def test_astaged_map_raises_stage_errors():
+    async def fail(x):
+        raise KeyError(x)
+
+    async def collect():
+        return [value async for value in astaged_map([(fail, 1)], range(3))]
+
+    with pytest.raises(KeyError):
+        asyncio.run(collect())
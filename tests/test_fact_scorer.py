@@ -1,6 +1,9 @@
+import asyncio
 import pytest
-from unittest.mock import mock_open, patch
+from unittest.mock import mock_open, patch, MagicMock, AsyncMock
 from FactScoreLite.fact_scorer import FactScorer
+from FactScoreLite.cache import MemoCache, DiskCache
+from FactScoreLite.retrieval import Retriever
 import json
 from FactScoreLite import configs
 
@@ -13,7 +16,8 @@ def mock_openai_agent():
 
 @pytest.fixture
 def fact_scorer(mock_openai_agent):
-    return FactScorer()
+    # A fresh decision cache so that decisions do not leak between tests
+    return FactScorer(decision_cache=MemoCache())
 
 
 @pytest.mark.parametrize(
@@ -131,3 +135,227 @@ def test_get_instructions_true_false_demons(fact_scorer):
         "Output:\nFalse\n\n"
     )
     assert fact_scorer.get_instructions() == expected_instructions
+
+
+def test_aget_score_keeps_fact_order(fact_scorer):
+    async def generate(prompt, system=None):
+        # The first fact answers last
+        await asyncio.sleep(0.01 if "Fact 1 " in prompt else 0)
+        return "True" if "Fact 1 " in prompt else "False"
+
+    fact_scorer._async_openai_agent = MagicMock(generate=generate)
+
+    result = asyncio.run(fact_scorer.aget_score(["Fact 1", " Fact 2 "], "Knowledge"))
+
+    assert result == [
+        {"fact": "Fact 1", "is_supported": True, "output": "True"},
+        {"fact": "Fact 2", "is_supported": False, "output": "False"},
+    ]
+
+
+def test_aget_score_empty_input(fact_scorer):
+    assert asyncio.run(fact_scorer.aget_score([], "Some knowledge")) == []
+
+
+def test_get_score_with_thread_pool_keeps_fact_order(fact_scorer, mock_openai_agent):
+    fact_scorer.max_workers = 4
+    mock_openai_agent.generate.side_effect = lambda prompt, system=None: (
+        "True" if "Fact 1 " in prompt else "False"
+    )
+
+    result = fact_scorer.get_score(["Fact 1", "Fact 2", "Fact 3"], "Knowledge")
+
+    assert [decision["fact"] for decision in result] == ["Fact 1", "Fact 2", "Fact 3"]
+    assert [decision["is_supported"] for decision in result] == [True, False, False]
+
+
+# Batched verification
+def test_get_batch_prompt_lists_numbered_facts(fact_scorer):
+    fact_scorer.demons = mock_demons_data
+    prompt = fact_scorer.get_batch_prompt(["Fact 1", "Fact 2"], "Knowledge")
+
+    assert prompt.count("Context:\nKnowledge\n") == 1
+    assert "Statements:\n1. Fact 1\n2. Fact 2\n" in prompt
+    assert prompt.endswith("Output:\n")
+
+
+@pytest.mark.parametrize(
+    "output, expected",
+    [
+        ("1. True\n2. False\n3. True", [True, False, True]),
+        ("1) false\n2: TRUE\n3 - true", [False, True, True]),
+        ("1. True\n3. False", [True, None, False]),
+        ("1. True\n1. False\n2. True\n3. True", [None, True, True]),
+        ("I cannot answer.", [None, None, None]),
+    ],
+)
+def test_get_batch_decisions_parsing(fact_scorer, output, expected):
+    decisions = fact_scorer.get_batch_decisions(["Fact 1", "Fact 2", "Fact 3"], output)
+
+    assert [d if d is None else d["is_supported"] for d in decisions] == expected
+
+
+def test_get_score_batched_uses_one_call_per_batch(fact_scorer, mock_openai_agent):
+    fact_scorer.batch_size = 2
+    mock_openai_agent.generate.side_effect = ["1. True\n2. False", "1. False"]
+
+    result = fact_scorer.get_score(["Fact 1", "Fact 2", "Fact 3"], "Knowledge")
+
+    assert mock_openai_agent.generate.call_count == 2
+    assert [d["is_supported"] for d in result] == [True, False, False]
+    assert [d["fact"] for d in result] == ["Fact 1", "Fact 2", "Fact 3"]
+
+
+def test_get_score_batched_falls_back_to_single_fact_calls(
+    fact_scorer, mock_openai_agent
+):
+    fact_scorer.batch_size = 3
+    mock_openai_agent.generate.side_effect = ["1. True\n3. True", "False"]
+
+    result = fact_scorer.get_score(["Fact 1", "Fact 2", "Fact 3"], "Knowledge")
+
+    assert mock_openai_agent.generate.call_count == 2
+    fallback_prompt = mock_openai_agent.generate.call_args_list[1][0][0]
+    assert fallback_prompt.endswith("Fact 2 True or False?\nOutput:\n")
+    assert [d["is_supported"] for d in result] == [True, False, True]
+
+
+def test_aget_score_batched_falls_back_to_single_fact_calls(fact_scorer):
+    fact_scorer.batch_size = 2
+    fact_scorer._async_openai_agent = MagicMock(
+        generate=AsyncMock(side_effect=["2. False", "True"])
+    )
+
+    result = asyncio.run(fact_scorer.aget_score(["Fact 1", "Fact 2"], "Knowledge"))
+
+    assert [d["is_supported"] for d in result] == [True, False]
+    assert fact_scorer._async_openai_agent.generate.await_count == 2
+
+
+# Decision cache
+def test_repeated_fact_is_scored_once_across_generations(
+    fact_scorer, mock_openai_agent
+):
+    mock_openai_agent.generate.return_value = "True"
+
+    first = fact_scorer.get_score(["X is a vehicle."], "Knowledge")
+    second = fact_scorer.get_score(["x is a  vehicle", "Y is red."], "Knowledge")
+
+    assert mock_openai_agent.generate.call_count == 2
+    assert first[0]["is_supported"] and second[0]["is_supported"]
+    # The cached decision keeps the spelling of the fact it is returned for
+    assert second[0]["fact"] == "x is a  vehicle"
+    assert fact_scorer.get_cache_stats()["hits"] == 1
+
+
+def test_duplicated_facts_in_one_generation_are_scored_once(
+    fact_scorer, mock_openai_agent
+):
+    mock_openai_agent.generate.return_value = "False"
+
+    result = fact_scorer.get_score(["Fact 1", "Fact 1"], "Knowledge")
+
+    assert mock_openai_agent.generate.call_count == 1
+    assert [d["fact"] for d in result] == ["Fact 1", "Fact 1"]
+
+
+def test_decision_cache_depends_on_knowledge_source(fact_scorer, mock_openai_agent):
+    mock_openai_agent.generate.side_effect = ["True", "False"]
+
+    fact_scorer.get_score(["Fact 1"], "Knowledge 1")
+    result = fact_scorer.get_score(["Fact 1"], "Knowledge 2")
+
+    assert mock_openai_agent.generate.call_count == 2
+    assert result[0]["is_supported"] is False
+
+
+def test_decision_cache_persists_across_runs(mock_openai_agent, tmp_path):
+    mock_openai_agent.generate.return_value = "True"
+    path = tmp_path / "decisions.sqlite"
+
+    FactScorer(decision_cache=MemoCache(disk=DiskCache(path))).get_score(
+        ["Fact 1"], "Knowledge"
+    )
+    fact_scorer = FactScorer(decision_cache=MemoCache(disk=DiskCache(path)))
+    result = fact_scorer.get_score(["Fact 1"], "Knowledge")
+
+    assert mock_openai_agent.generate.call_count == 1
+    assert result == [{"fact": "Fact 1", "is_supported": True, "output": "True"}]
+
+
+def test_aget_score_uses_decision_cache(fact_scorer, mock_openai_agent):
+    mock_openai_agent.generate.return_value = "True"
+    fact_scorer.get_score(["Fact 1"], "Knowledge")
+    fact_scorer._async_openai_agent = MagicMock(
+        generate=AsyncMock(return_value="False")
+    )
+
+    result = asyncio.run(fact_scorer.aget_score(["Fact 1", "Fact 2"], "Knowledge"))
+
+    assert [d["is_supported"] for d in result] == [True, False]
+    fact_scorer._async_openai_agent.generate.assert_awaited_once()
+
+
+def test_retriever_narrows_the_prompt_context(mock_openai_agent):
+    retriever = Retriever(top_k=1, chunk_size=4, chunk_overlap=0)
+    fact_scorer = FactScorer(decision_cache=MemoCache(), retriever=retriever)
+    mock_openai_agent.generate.return_value = "True"
+    source = "Paris is in France. Rome is in Italy. Berlin is in Germany."
+
+    fact_scorer.get_score(["Berlin is in Germany"], source)
+
+    prompt = mock_openai_agent.generate.call_args[0][0]
+    assert prompt.endswith(
+        "Context:\nBerlin is in Germany.\nStatement:\nBerlin is in Germany True or False?\nOutput:\n"
+    )
+
+
+def test_retrieval_settings_are_part_of_the_decision_key(mock_openai_agent):
+    plain = FactScorer(decision_cache=MemoCache())
+    narrowed = FactScorer(
+        decision_cache=MemoCache(), retriever=Retriever(top_k=1, chunk_size=5)
+    )
+
+    assert plain.get_decision_key("Fact", "hash") != narrowed.get_decision_key(
+        "Fact", "hash"
+    )
+
+
+def test_prompt_settings_are_part_of_the_decision_key(mock_openai_agent, monkeypatch):
+    key = FactScorer(decision_cache=MemoCache()).get_decision_key("Fact", "hash")
+    batched = FactScorer(decision_cache=MemoCache(), batch_size=4)
+
+    assert batched.get_decision_key("Fact", "hash") != key
+
+    monkeypatch.setattr(configs, "prompt_seed", 1)
+    reseeded = FactScorer(decision_cache=MemoCache())
+
+    assert reseeded.get_decision_key("Fact", "hash") != key
+
+
+def test_get_instructions_is_deterministic_per_fact(fact_scorer, monkeypatch):
+    fact_scorer.demons = [
+        {"knowledge_source": f"knw {i}", "fact": f"fact {i}", "is_supported": i == 0}
+        for i in range(5)
+    ]
+
+    instructions = fact_scorer.get_instructions("The sky is blue.")
+
+    assert fact_scorer.get_instructions(" the sky is blue ") is instructions
+    assert len({fact_scorer.get_instructions(f"Fact {i}") for i in range(50)}) == 4
+
+    monkeypatch.setattr(configs, "prompt_seed", 1)
+    seeded = [fact_scorer.get_instructions(f"Fact {i}") for i in range(10)]
+    monkeypatch.setattr(configs, "prompt_seed", 0)
+    assert seeded != [fact_scorer.get_instructions(f"Fact {i}") for i in range(10)]
+
+
+def test_instructions_are_sent_as_system_message(fact_scorer, mock_openai_agent):
+    mock_openai_agent.generate.return_value = "True"
+
+    fact_scorer.get_score(["Fact 1"], "Knowledge")
+
+    args, kwargs = mock_openai_agent.generate.call_args
+    assert args[0].startswith("Context:\nKnowledge\n")
+    assert kwargs["system"] == fact_scorer.get_instructions("Fact 1")
+    assert len(fact_scorer.get_prompt_stats()) == 1
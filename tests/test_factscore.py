@@ -1,23 +1,29 @@
+import asyncio
+import os
+import shutil
 import pytest
-from unittest.mock import patch
-from FactScoreLite import FactScore
+from unittest.mock import patch, AsyncMock
+from FactScoreLite import FactScore, BudgetExceeded, configs
 
 
 @pytest.fixture
 def mock_atomic_fact_generator():
     with patch("FactScoreLite.factscore.AtomicFactGenerator") as mock:
+        # Part of the saved results' keys
+        mock().demons_hash = "atomic_facts_demons"
         yield mock()
 
 
 @pytest.fixture
 def mock_fact_scorer():
     with patch("FactScoreLite.factscore.FactScorer") as mock:
+        mock().demons_hash = "fact_scorer_demons"
         yield mock()
 
 
 @pytest.fixture
 def mock_state_handler():
-    with patch("FactScoreLite.factscore.StateHandler") as mock:
+    with patch("FactScoreLite.factscore.get_state_handler") as mock:
         yield mock()
 
 
@@ -50,7 +56,7 @@ def test_get_facts_non_empty_input(fact_score, mock_state_handler):
     ]
     result = fact_score.get_facts(generations)
     assert len(result) == len(generations)
-    fact_score.facts_handler.save.assert_called()
+    fact_score.facts_handler.append.assert_called()
 
 
 # Test 3: Fact Scoring
@@ -71,7 +77,7 @@ def test_get_decisions_with_valid_input(
 
     assert len(scores) == len(generation_facts_pairs)
 
-    fact_score.facts_handler.save.assert_called()
+    fact_score.facts_handler.append.assert_called()
 
 
 # Test 4: Final Fact Scoring
@@ -139,3 +145,270 @@ def test_gamma_zero(fact_score):
     decision = [{"is_supported": True} for _ in range(5)]
     score, init_score = fact_score.calculate_score(decision)
     assert score == init_score, "No penalty should apply when gamma is zero"
+
+
+# Test 5: Async API
+def test_aget_factscore_keeps_input_order(
+    fact_score, mock_state_handler, mock_atomic_fact_generator, mock_fact_scorer
+):
+    mock_state_handler.load.side_effect = [[], []]
+
+    async def arun(generation):
+        # The first generation finishes last
+        await asyncio.sleep(0.01 if generation == "gen1" else 0)
+        return [(generation, [f"{generation} fact"])]
+
+    async def aget_score(facts, knowledge_source):
+        return [{"fact": fact, "is_supported": True} for fact in facts]
+
+    mock_atomic_fact_generator.arun.side_effect = arun
+    mock_fact_scorer.aget_score.side_effect = aget_score
+
+    avg_score, avg_init_score = asyncio.run(
+        fact_score.aget_factscore(["gen1", "gen2"], ["source1", "source2"])
+    )
+
+    # Facts and decisions share the mocked handler, decisions are appended last
+    saved_decisions = [
+        call[0][0] for call in fact_score.decisions_handler.append.call_args_list[-2:]
+    ]
+    assert [entry["generation"] for entry in saved_decisions] == ["gen1", "gen2"]
+    assert saved_decisions[0]["decision"][0]["fact"] == "gen1 fact"
+    assert avg_init_score == 1.0
+
+
+def test_aget_factscore_resumes_from_saved_states(
+    fact_score, mock_state_handler, mock_atomic_fact_generator, mock_fact_scorer
+):
+    mock_state_handler.load.side_effect = [
+        [{"generation": "gen1", "facts": ["fact1"]}],
+        [
+            {
+                "generation": "gen1",
+                "decision": [{"fact": "fact1", "is_supported": True, "output": "True"}],
+            }
+        ],
+    ]
+    mock_atomic_fact_generator.arun = AsyncMock(return_value=[("gen2", ["fact2"])])
+    mock_fact_scorer.aget_score = AsyncMock(
+        return_value=[{"fact": "fact2", "is_supported": False}]
+    )
+
+    asyncio.run(fact_score.aget_factscore(["gen1", "gen2"], ["source1", "source2"]))
+
+    mock_atomic_fact_generator.arun.assert_awaited_once_with("gen2")
+    mock_fact_scorer.aget_score.assert_awaited_once_with(["fact2"], "source2")
+
+
+# Test 6: Thread pool
+def test_get_facts_with_thread_pool_keeps_input_order(
+    fact_score, mock_state_handler, mock_atomic_fact_generator
+):
+    mock_state_handler.load.return_value = []
+    fact_score.max_workers = 3
+    mock_atomic_fact_generator.run.side_effect = lambda generation: [
+        (generation, [f"{generation} fact"])
+    ]
+    generations = [f"gen{i}" for i in range(10)]
+
+    result = fact_score.get_facts(generations)
+
+    assert [entry["generation"] for entry in result] == generations
+    assert [entry["facts"] for entry in result] == [[f"{g} fact"] for g in generations]
+
+
+# Test 7: Packed extraction
+def test_get_facts_packed_uses_run_many(
+    fact_score, mock_state_handler, mock_atomic_fact_generator
+):
+    mock_state_handler.load.return_value = []
+    fact_score.pack_token_budget = 10_000
+    mock_atomic_fact_generator.run_many.side_effect = lambda generations: [
+        [(generation, [f"{generation} fact"])] for generation in generations
+    ]
+
+    result = fact_score.get_facts(["gen1", "gen2", "gen3"])
+
+    mock_atomic_fact_generator.run_many.assert_called_once_with(
+        ["gen1", "gen2", "gen3"]
+    )
+    assert [entry["facts"] for entry in result] == [
+        ["gen1 fact"],
+        ["gen2 fact"],
+        ["gen3 fact"],
+    ]
+
+
+# Test 8: Content-hash resume
+@pytest.fixture
+def persistent_fact_score(
+    mock_atomic_fact_generator, mock_fact_scorer, tmp_path, monkeypatch
+):
+    # Real JSONL state files, mocked LLM calls
+    monkeypatch.setattr(configs, "facts_db_path", str(tmp_path / "facts.jsonl"))
+    monkeypatch.setattr(configs, "decisions_db_path", str(tmp_path / "decisions.jsonl"))
+    mock_atomic_fact_generator.run.side_effect = lambda generation: [
+        (generation, [f"{generation} fact"])
+    ]
+    mock_fact_scorer.get_score.side_effect = lambda facts, knowledge_source: [
+        {"fact": fact, "is_supported": knowledge_source == "good"} for fact in facts
+    ]
+
+    return lambda: FactScore(gamma=0)
+
+
+def test_resume_after_reordering_only_computes_missing_items(
+    persistent_fact_score, mock_atomic_fact_generator, mock_fact_scorer
+):
+    persistent_fact_score().get_factscore(["gen1", "gen2"], ["good", "bad"])
+    mock_atomic_fact_generator.run.reset_mock()
+    mock_fact_scorer.get_score.reset_mock()
+
+    fact_score = persistent_fact_score()
+    facts = fact_score.get_facts(["gen2", "gen1", "gen3"])
+    scores, _ = fact_score.get_decisions(facts, ["bad", "good", "good"])
+
+    mock_atomic_fact_generator.run.assert_called_once_with("gen3")
+    mock_fact_scorer.get_score.assert_called_once_with(["gen3 fact"], "good")
+    assert [entry["generation"] for entry in facts] == ["gen2", "gen1", "gen3"]
+    assert scores == [0.0, 1.0, 1.0]
+
+
+def test_resume_rescores_when_knowledge_source_changes(
+    persistent_fact_score, mock_atomic_fact_generator, mock_fact_scorer
+):
+    persistent_fact_score().get_factscore(["gen1"], ["good"])
+    mock_atomic_fact_generator.run.reset_mock()
+    mock_fact_scorer.get_score.reset_mock()
+
+    avg_score, _ = persistent_fact_score().get_factscore(["gen1"], ["bad"])
+
+    mock_atomic_fact_generator.run.assert_not_called()
+    mock_fact_scorer.get_score.assert_called_once_with(["gen1 fact"], "bad")
+    assert avg_score == 0.0
+
+
+def test_resume_recomputes_when_model_config_changes(
+    persistent_fact_score, mock_atomic_fact_generator, monkeypatch
+):
+    persistent_fact_score().get_facts(["gen1"])
+    monkeypatch.setattr(configs, "model_name", "another-model")
+
+    persistent_fact_score().get_facts(["gen1"])
+
+    assert mock_atomic_fact_generator.run.call_count == 2
+
+
+def test_duplicated_generations_are_computed_once(
+    persistent_fact_score, mock_atomic_fact_generator
+):
+    facts = persistent_fact_score().get_facts(["gen1", "gen1"])
+
+    mock_atomic_fact_generator.run.assert_called_once_with("gen1")
+    assert facts[0] == facts[1]
+
+
+def test_resume_from_states_saved_without_keys(
+    persistent_fact_score, mock_atomic_fact_generator, mock_fact_scorer
+):
+    with open(configs.facts_db_path, "w") as f:
+        f.write('{"generation": "gen1", "facts": ["fact1"]}\n')
+    with open(configs.decisions_db_path, "w") as f:
+        f.write(
+            '{"generation": "gen1", "decision": [{"fact": "fact1", "is_supported": true}]}\n'
+        )
+
+    avg_score, _ = persistent_fact_score().get_factscore(
+        ["gen1", "gen2"], ["source1", "good"]
+    )
+
+    mock_atomic_fact_generator.run.assert_called_once_with("gen2")
+    mock_fact_scorer.get_score.assert_called_once_with(["gen2 fact"], "good")
+    assert avg_score == 1.0
+
+
+def test_decisions_are_not_reused_for_re_extracted_facts(
+    persistent_fact_score, mock_atomic_fact_generator, mock_fact_scorer
+):
+    persistent_fact_score().get_factscore(["gen1"], ["good"])
+    mock_fact_scorer.get_score.reset_mock()
+
+    # The facts of gen1 are extracted again, with another output
+    os.remove(configs.facts_db_path)
+    mock_atomic_fact_generator.run.side_effect = lambda generation: [
+        (generation, ["fact1", "fact2"])
+    ]
+    fact_score = persistent_fact_score()
+    facts = fact_score.get_facts(["gen1"])
+    scores, _ = fact_score.get_decisions(facts, ["good"])
+
+    mock_fact_scorer.get_score.assert_called_once_with(["fact1", "fact2"], "good")
+    assert scores == [1.0]
+
+
+def test_keys_depend_on_the_demons_not_their_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(configs, "facts_db_path", str(tmp_path / "facts.jsonl"))
+    monkeypatch.setattr(configs, "decisions_db_path", str(tmp_path / "decisions.jsonl"))
+    key = FactScore().get_facts_key("gen1")
+
+    for name in ["atomic_facts_demons_path", "fact_scorer_demons_path"]:
+        path = tmp_path / os.path.basename(getattr(configs, name))
+        shutil.copy(getattr(configs, name), path)
+        monkeypatch.setattr(configs, name, str(path))
+
+    fact_score = FactScore()
+    assert fact_score.get_facts_key("gen1") == key
+
+    fact_score.fact_scorer.demons = fact_score.fact_scorer.demons[:1]
+    assert fact_score.get_facts_key("gen1") != key
+
+
+# Test 9: Budget
+def test_budget_exceeded_checkpoints_finished_generations(
+    persistent_fact_score, mock_atomic_fact_generator
+):
+    def run(generation):
+        if generation == "gen2":
+            raise BudgetExceeded("Token budget of 10 reached (10 tokens used).")
+        return [(generation, [f"{generation} fact"])]
+
+    mock_atomic_fact_generator.run.side_effect = run
+
+    with pytest.raises(BudgetExceeded):
+        persistent_fact_score().get_factscore(["gen1", "gen2"], ["good", "good"])
+
+    mock_atomic_fact_generator.run.reset_mock()
+    mock_atomic_fact_generator.run.side_effect = lambda generation: [
+        (generation, [f"{generation} fact"])
+    ]
+    persistent_fact_score().get_facts(["gen1", "gen2"])
+
+    mock_atomic_fact_generator.run.assert_called_once_with("gen2")
+
+
+def test_generation_usage_is_attributed_by_facts_key(
+    persistent_fact_score, mock_atomic_fact_generator
+):
+    fact_score = persistent_fact_score()
+    fact_score.max_workers = 2
+    mock_atomic_fact_generator.run.side_effect = lambda generation: (
+        fact_score.usage.record("extraction", "model", len(generation), 0)
+        or [(generation, [])]
+    )
+
+    fact_score.get_facts(["gen1", "generation2"])
+
+    assert fact_score.usage.summary()["generations"] == {
+        fact_score.get_facts_key("gen1"): {
+            "calls": 1,
+            "prompt_tokens": 4,
+            "completion_tokens": 0,
+            "cost": 0.0,
+        },
+        fact_score.get_facts_key("generation2"): {
+            "calls": 1,
+            "prompt_tokens": 11,
+            "completion_tokens": 0,
+            "cost": 0.0,
+        },
+    }
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+import FactScoreLite
+
+HEAVY_MODULES = ["openai", "nltk", "numpy"]
+
+
+def run_python(statement: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", statement], check=True, capture_output=True, text=True
+    ).stdout
+
+
+def test_import_is_lazy():
+    output = run_python(
+        "import sys, logging, FactScoreLite\n"
+        f"print([name for name in {HEAVY_MODULES} if name in sys.modules])\n"
+        "print(logging.getLogger().handlers)"
+    )
+
+    assert output.split("\n")[:2] == ["[]", "[]"]
+
+
+def test_fake_backend_pipeline_does_not_import_openai():
+    output = run_python(
+        "import sys\n"
+        "from FactScoreLite import FactScore, FakeBackend\n"
+        "FactScore(backend=FakeBackend())\n"
+        "print('openai' in sys.modules)"
+    )
+
+    assert output.strip() == "False"
+
+
+def test_default_factscore_does_not_import_openai():
+    output = run_python(
+        "import sys\n"
+        "from FactScoreLite import FactScore, OpenAIAgent, AsyncOpenAIAgent\n"
+        "FactScore()\n"
+        "OpenAIAgent()\n"
+        "AsyncOpenAIAgent()\n"
+        "print('openai' in sys.modules)"
+    )
+
+    assert output.strip() == "False"
+
+
+def test_exports():
+    assert set(FactScoreLite.__all__) <= set(dir(FactScoreLite))
+    assert FactScoreLite.FactScore.__name__ == "FactScore"
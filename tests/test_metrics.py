@@ -0,0 +1,132 @@
+import json
+from unittest.mock import MagicMock, patch
+from openai import RateLimitError
+from FactScoreLite import FactScore, FakeBackend, Metrics, OpenAIAgent, configs
+from FactScoreLite.cache import MemoCache
+from FactScoreLite.retry import CircuitBreaker
+
+
+def test_counters_gauges_and_callbacks():
+    events = []
+    metrics = Metrics(callbacks=[lambda *event: events.append(event)])
+
+    metrics.increment("retries_total", stage="extraction")
+    metrics.increment("retries_total", 2, stage="extraction")
+    metrics.add_gauge("in_flight", 1, stage="verification")
+    metrics.add_gauge("in_flight", -1, stage="verification")
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["counters"] == [
+        {"name": "retries_total", "labels": {"stage": "extraction"}, "value": 3}
+    ]
+    assert snapshot["gauges"][0]["value"] == 0
+    assert events[1] == ("counter", "retries_total", 2, {"stage": "extraction"})
+    assert events[-1] == ("gauge", "in_flight", 0, {"stage": "verification"})
+
+
+def test_histogram_and_prometheus_format():
+    metrics = Metrics(buckets=[0.1, 1])
+
+    for value in [0.05, 0.5, 5]:
+        metrics.observe("stage_seconds", value, stage="extraction")
+
+    text = metrics.to_prometheus()
+
+    assert "# TYPE factscore_stage_seconds histogram" in text
+    assert 'factscore_stage_seconds_bucket{stage="extraction",le="0.1"} 1' in text
+    assert 'factscore_stage_seconds_bucket{stage="extraction",le="1.0"} 2' in text
+    assert 'factscore_stage_seconds_bucket{stage="extraction",le="+Inf"} 3' in text
+    assert 'factscore_stage_seconds_sum{stage="extraction"} 5.55' in text
+    assert 'factscore_stage_seconds_count{stage="extraction"} 3' in text
+
+
+def test_track_call_times_and_counts_in_flight():
+    metrics = Metrics()
+
+    with metrics.track_call("verification"):
+        assert metrics.gauges[("in_flight", (("stage", "verification"),))] == 1
+
+    histogram = metrics.snapshot()["histograms"][0]
+    assert histogram["labels"] == {"stage": "verification"}
+    assert histogram["count"] == 1
+    assert metrics.gauges[("in_flight", (("stage", "verification"),))] == 0
+
+
+def test_dump(tmp_path):
+    metrics = Metrics()
+    metrics.record_cache("sentence", {"hits": 3, "misses": 1, "hit_rate": 0.75})
+
+    metrics.dump(tmp_path / "metrics.json")
+    metrics.dump(tmp_path / "metrics.prom")
+
+    with open(tmp_path / "metrics.json") as f:
+        assert json.load(f)["gauges"][2] == {
+            "name": "cache_hit_rate",
+            "labels": {"cache": "sentence"},
+            "value": 0.75,
+        }
+
+    assert (
+        'factscore_cache_hit_rate{cache="sentence"} 0.75'
+        in (tmp_path / "metrics.prom").read_text()
+    )
+
+
+def test_agent_counts_rate_limits_and_retries():
+    metrics = Metrics()
+    error = RateLimitError(
+        "Rate limited", response=MagicMock(status_code=429, headers={}), body=None
+    )
+    response = MagicMock()
+    response.choices = [MagicMock(message=MagicMock(content="ok"))]
+
+    with patch("FactScoreLite.openai_agent.OpenAI") as client, patch("time.sleep"):
+        client.return_value.chat.completions.create.side_effect = [error, response]
+        agent = OpenAIAgent(stage="extraction", metrics=metrics)
+        agent.retry_policy.circuit_breaker = CircuitBreaker()
+
+        assert agent.generate("prompt") == "ok"
+
+    counters = {
+        (entry["name"], tuple(entry["labels"].items())): entry["value"]
+        for entry in metrics.snapshot()["counters"]
+    }
+    assert counters[("rate_limited_total", (("stage", "extraction"),))] == 1
+    assert counters[("retries_total", (("stage", "extraction"),))] == 1
+    assert (
+        counters[
+            ("errors_total", (("stage", "extraction"), ("type", "RateLimitError")))
+        ]
+        == 1
+    )
+
+
+def test_factscore_records_stages(tmp_path, monkeypatch):
+    monkeypatch.setattr(configs, "facts_db_path", str(tmp_path / "facts.jsonl"))
+    monkeypatch.setattr(configs, "decisions_db_path", str(tmp_path / "decisions.jsonl"))
+    monkeypatch.setattr(configs, "metrics_path", str(tmp_path / "metrics.prom"))
+
+    fs = FactScore(backend=FakeBackend())
+    fs.atomic_fact_generator.sentence_cache = MemoCache()
+    fs.fact_scorer.decision_cache = MemoCache()
+
+    with patch(
+        "FactScoreLite.atomic_facts.sent_tokenize", lambda text: text.split("\n")
+    ):
+        fs.get_factscore(["A is B.\nC is D."], ["A is B."])
+
+    stages = {
+        entry["labels"]["stage"]: entry["count"]
+        for entry in fs.metrics.snapshot()["histograms"]
+    }
+    assert stages == {
+        "sentence_splitting": 1,
+        "extraction": 2,
+        "extraction_parsing": 2,
+        "checkpointing": 4,
+        "verification": 4,
+        "verification_parsing": 4,
+    }
+    text = (tmp_path / "metrics.prom").read_text()
+    assert 'factscore_cache_hit_rate{cache="decision"}' in text
@@ -1,175 +1,15 @@
 # test_openai_agent.py
+import asyncio
+import contextlib
 import pytest
-from unittest.mock import patch, MagicMock
-from FactScoreLite import OpenAIAgent
-from FactScoreLite.openai_agent import retry_with_exponential_backoff
+from unittest.mock import MagicMock, AsyncMock
+from FactScoreLite import OpenAIAgent, AsyncOpenAIAgent
+from FactScoreLite.cache import DiskCache
+from FactScoreLite.usage import UsageStats, BudgetExceeded
+from FactScoreLite.rate_limit import RateLimiter
+from FactScoreLite.retry import RetryPolicy, CircuitBreaker, RetryError
 from openai import RateLimitError
 
-# Decorator
-
-
-def mock_function_to_decorate(*args, **kwargs):
-    """A simple mock function that simulates a successful operation."""
-    return "Success"
-
-
-@pytest.fixture
-def successful_function():
-    """Applies the retry_with_exponential_backoff decorator to a mock function that simulates a successful call."""
-    decorated_function = retry_with_exponential_backoff(mock_function_to_decorate)
-    return decorated_function
-
-
-def test_retry_decorator_with_successful_call(successful_function):
-    """Test the retry_with_exponential_backoff decorator with a function that succeeds on the first attempt."""
-    # Call the decorated function
-    result = successful_function()
-
-    # Assert that the function returns the expected result without retrying
-    assert (
-        result == "Success"
-    ), "The decorated function should return 'Success' on the first call without any retries."
-
-
-# A mock function to decorate, designed to fail once with a RateLimitError, then succeed
-def mock_function_with_initial_failure(
-    attempts=[0],
-):  # Using a mutable default argument as a simple static counter
-    if attempts[0] == 0:
-        attempts[0] += 1
-        raise RateLimitError(
-            "Simulated retryable error", response=MagicMock(), body=MagicMock()
-        )
-    else:
-        return "Recovered Success"
-
-
-@pytest.fixture
-def function_with_retry_logic():
-    """Applies the retry_with_exponential_backoff decorator to a mock function that initially fails."""
-    decorated_function = retry_with_exponential_backoff(
-        mock_function_with_initial_failure, errors=(RateLimitError,)
-    )
-    return decorated_function
-
-
-def test_retry_decorator_activates_on_failure(function_with_retry_logic):
-    """Test that the retry_with_exponential_backoff decorator retries the function upon an initial failure."""
-    # Call the decorated function
-    result = function_with_retry_logic()
-
-    # Assert that the function returns the expected recovery result after retrying
-    assert (
-        result == "Recovered Success"
-    ), "The decorated function should retry and return 'Recovered Success' after the initial failure."
-
-
-# A mock function to decorate, designed to always fail with a RateLimitError
-def mock_function_always_fails():
-    raise RateLimitError(
-        "Simulated retryable error", response=MagicMock(), body=MagicMock()
-    )
-
-
-@pytest.fixture
-def function_with_retry_limit():
-    """Applies the retry_with_exponential_backoff decorator to a mock function that always fails."""
-    # Here, you can adjust initial_delay to a smaller value to make the test run faster
-    decorated_function = retry_with_exponential_backoff(
-        mock_function_always_fails,
-        max_retries=3,
-        initial_delay=0.1,
-        errors=(RateLimitError,),
-    )
-    return decorated_function
-
-
-def test_retry_decorator_exceeds_max_retries(function_with_retry_limit):
-    """Test that the retry_with_exponential_backoff decorator raises an exception after exceeding the maximum retry attempts."""
-    with pytest.raises(Exception) as exc_info:
-        function_with_retry_limit()
-    assert "Maximum number of retries" in str(
-        exc_info.value
-    ), "The decorated function should raise an exception indicating the maximum retries have been exceeded."
-
-
-# A mock function to decorate, designed to fail twice before succeeding
-def mock_function_fails_then_succeeds(attempts=[0]):
-    if attempts[0] < 2:
-        attempts[0] += 1
-        raise RateLimitError(
-            "Simulated retryable error", response=MagicMock(), body=MagicMock()
-        )
-    else:
-        return "Success"
-
-
-@pytest.fixture
-def function_with_exponential_backoff():
-    """Applies the retry_with_exponential_backoff decorator with jitter to a function that initially fails."""
-    decorated_function = retry_with_exponential_backoff(
-        mock_function_fails_then_succeeds,
-        initial_delay=1,
-        exponential_base=2,
-        jitter=True,
-        max_retries=3,
-        errors=(RateLimitError,),
-    )
-    return decorated_function
-
-
-def test_exponential_backoff_and_jitter(function_with_exponential_backoff):
-    """Test that retry_with_exponential_backoff applies an increasing delay with jitter between retries."""
-    with patch("time.sleep") as mock_sleep:
-        function_with_exponential_backoff()
-
-        assert (
-            mock_sleep.call_count == 2
-        ), "The function should have been retried twice, with time.sleep called twice."
-
-        # Check the calls to mock_sleep to ensure they match the expected pattern of delays
-        delays = [call_args[0][0] for call_args in mock_sleep.call_args_list]
-
-        # Verify that each delay is greater than the last, accounting for jitter
-        assert delays[0] >= 1, "The first retry delay should be at least 1 second."
-        assert (
-            delays[1] >= 2 * delays[0]
-        ), "The second retry delay should be at least double the first delay."
-
-
-class NonRetryableError(Exception):
-    """A custom exception class to represent errors that should not trigger retries."""
-
-    pass
-
-
-# A mock function to decorate, designed to always fail with NonRetryableError
-def mock_function_raises_non_retryable_error():
-    raise NonRetryableError("This error is not supposed to trigger retries.")
-
-
-@pytest.fixture
-def function_with_non_retryable_error_handling():
-    """Applies the retry_with_exponential_backoff decorator to a function, specifying that it should not retry for NonRetryableError."""
-    decorated_function = retry_with_exponential_backoff(
-        mock_function_raises_non_retryable_error,
-        errors=(RateLimitError,),  # Specify only retryable errors here
-    )
-    return decorated_function
-
-
-def test_non_retryable_errors_are_not_retried(
-    function_with_non_retryable_error_handling,
-):
-    """Test that non-retryable errors immediately raise an exception without triggering retry logic."""
-    with pytest.raises(NonRetryableError) as exc_info:
-        function_with_non_retryable_error_handling()
-
-    assert "This error is not supposed to trigger retries." in str(
-        exc_info.value
-    ), "The function should raise NonRetryableError without retry attempts."
-
-
 # OPENAI CLASS
 
 
@@ -194,7 +34,9 @@ def agent(mocker):
 
     # Instantiate and return the OpenAIAgent, which now uses the mocked OpenAI class,
     # along with the mocked create method for custom behavior in tests
-    return OpenAIAgent(), create_method_mock
+    # (with its own circuit breaker so that failures do not pause other tests)
+    retry_policy = RetryPolicy(circuit_breaker=CircuitBreaker())
+    return OpenAIAgent(retry_policy=retry_policy), create_method_mock
 
 
 def test_successful_text_generation_without_retry(agent):
@@ -265,7 +107,7 @@ def test_text_generation_failure_on_max_retries(agent, mocker):
     mocker.patch("time.sleep", return_value=None)
 
     # Attempt to execute the generate method with a test prompt
-    with pytest.raises(Exception) as exc_info:
+    with pytest.raises(RetryError) as exc_info:
         openai_agent.generate("Test prompt")
 
     # Assert that an exception indicating max retries exceeded is raised
@@ -278,3 +120,307 @@ def test_text_generation_failure_on_max_retries(agent, mocker):
     assert (
         create_method_mock.call_count == max_retries + 1
     ), f"Expected {max_retries + 1} calls (1 initial + {max_retries} retries)."
+
+
+# ASYNC OPENAI CLASS
+
+
+@pytest.fixture
+def async_agent(mocker):
+    """Fixture to create an AsyncOpenAIAgent instance with the async OpenAI client's create method mocked."""
+    create_method_mock = AsyncMock()
+    mock_chat_method = MagicMock(completions=MagicMock(create=create_method_mock))
+    mocker.patch(
+        "FactScoreLite.openai_agent.AsyncOpenAI",
+        return_value=MagicMock(chat=mock_chat_method),
+    )
+
+    retry_policy = RetryPolicy(circuit_breaker=CircuitBreaker())
+    return (
+        AsyncOpenAIAgent(max_concurrency=2, retry_policy=retry_policy),
+        create_method_mock,
+    )
+
+
+def make_response(content):
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock(message=MagicMock(content=content))]
+    return mock_response
+
+
+def test_async_generation_without_retry(async_agent):
+    """Test that AsyncOpenAIAgent.generate returns the expected output."""
+    openai_agent, create_method_mock = async_agent
+    create_method_mock.return_value = make_response("Async response")
+
+    response = asyncio.run(openai_agent.generate("Test prompt"))
+
+    assert response == "Async response"
+    assert create_method_mock.call_count == 1
+
+
+def test_async_generation_with_retry(async_agent, mocker):
+    """Test that AsyncOpenAIAgent.generate retries on rate limit errors without blocking the loop."""
+    openai_agent, create_method_mock = async_agent
+    create_method_mock.side_effect = [
+        RateLimitError("Rate limit exceeded", response=MagicMock(), body=None),
+        make_response("Recovered"),
+    ]
+    mock_sleep = mocker.patch("asyncio.sleep", new=AsyncMock())
+
+    response = asyncio.run(openai_agent.generate("Test prompt"))
+
+    assert response == "Recovered"
+    assert create_method_mock.call_count == 2
+    mock_sleep.assert_awaited_once()
+
+
+def test_async_generation_respects_max_concurrency(async_agent):
+    """Test that no more than max_concurrency requests are in flight at the same time."""
+    openai_agent, create_method_mock = async_agent
+    in_flight = []
+    peak = []
+
+    async def create(**kwargs):
+        in_flight.append(1)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+        return make_response(kwargs["messages"][0]["content"])
+
+    create_method_mock.side_effect = create
+
+    async def run():
+        return await asyncio.gather(
+            *[openai_agent.generate(f"prompt {i}") for i in range(10)]
+        )
+
+    responses = asyncio.run(run())
+
+    assert responses == [f"prompt {i}" for i in range(10)]
+    assert max(peak) == 2
+
+
+# RESPONSE CACHE
+
+
+def test_cache_hit_skips_request_and_retries(agent, tmp_path):
+    openai_agent, create_method_mock = agent
+    openai_agent.cache = DiskCache(tmp_path / "cache.sqlite")
+    create_method_mock.return_value = make_response("Cached response")
+
+    assert openai_agent.generate("Test prompt") == "Cached response"
+    assert openai_agent.generate("Test prompt") == "Cached response"
+
+    assert create_method_mock.call_count == 1
+    assert openai_agent.cache.stats()["hits"] == 1
+
+
+def test_cache_key_depends_on_model_settings(agent, tmp_path):
+    openai_agent, create_method_mock = agent
+    openai_agent.cache = DiskCache(tmp_path / "cache.sqlite")
+    create_method_mock.return_value = make_response("Response")
+
+    openai_agent.generate("Test prompt")
+    openai_agent.temp = 0.0
+    openai_agent.generate("Test prompt")
+
+    assert create_method_mock.call_count == 2
+
+
+def test_sync_and_async_agents_send_the_same_requests():
+    openai_agent = OpenAIAgent()
+    async_agent = AsyncOpenAIAgent()
+
+    assert openai_agent.get_cache_key("prompt", "system") == async_agent.get_cache_key(
+        "prompt", "system"
+    )
+    assert openai_agent.get_request_kwargs(
+        "prompt", "system"
+    ) == async_agent.get_request_kwargs("prompt", "system")
+    assert openai_agent.estimate_request_tokens(
+        "prompt"
+    ) == async_agent.estimate_request_tokens("prompt")
+
+
+def test_system_prompt_is_sent_first_and_keyed(agent, tmp_path):
+    openai_agent, create_method_mock = agent
+    openai_agent.cache = DiskCache(tmp_path / "cache.sqlite")
+    create_method_mock.return_value = make_response("Response")
+
+    openai_agent.generate("Test prompt", system="Instructions")
+    openai_agent.generate("Test prompt", system="Other instructions")
+    openai_agent.generate("Test prompt", system="Instructions")
+
+    assert create_method_mock.call_count == 2
+    assert create_method_mock.call_args_list[0][1]["messages"] == [
+        {"role": "system", "content": "Instructions"},
+        {"role": "user", "content": "Test prompt"},
+    ]
+
+
+def test_async_cache_hit_skips_request(async_agent, tmp_path):
+    openai_agent, create_method_mock = async_agent
+    openai_agent.cache = DiskCache(tmp_path / "cache.sqlite")
+    create_method_mock.return_value = make_response("Cached response")
+
+    async def run():
+        return [await openai_agent.generate("Test prompt") for _ in range(2)]
+
+    assert asyncio.run(run()) == ["Cached response", "Cached response"]
+    assert create_method_mock.call_count == 1
+
+
+def make_stream(*contents, usage=None):
+    chunks = [
+        MagicMock(choices=[MagicMock(delta=MagicMock(content=content))], usage=None)
+        for content in contents
+    ]
+    chunks.append(MagicMock(choices=[], usage=usage))
+
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    return stream()
+
+
+def test_async_stream_yields_chunks_and_caches_output(async_agent, tmp_path):
+    openai_agent, create_method_mock = async_agent
+    openai_agent.cache = DiskCache(tmp_path / "cache.sqlite")
+    openai_agent.usage = UsageStats()
+    openai_agent.stage = "extraction"
+    create_method_mock.return_value = make_stream(
+        "- A is", " B.\n- C", usage=MagicMock(prompt_tokens=10, completion_tokens=5)
+    )
+
+    async def collect():
+        return [chunk async for chunk in openai_agent.stream("Test prompt")]
+
+    assert asyncio.run(collect()) == ["- A is", " B.\n- C"]
+    assert create_method_mock.call_args[1]["stream"] is True
+    assert openai_agent.usage.summary()["prompt_tokens"] == 10
+    # The slot of the stream is released
+    assert openai_agent.semaphore._value == 2
+
+    # The full output is cached
+    assert asyncio.run(collect()) == ["- A is B.\n- C"]
+    assert create_method_mock.call_count == 1
+
+
+def test_async_stream_releases_the_slot_it_took(async_agent):
+    openai_agent, create_method_mock = async_agent
+    create_method_mock.side_effect = lambda **kwargs: make_stream("- A", " is B.")
+
+    async def stop_early():
+        async with contextlib.aclosing(openai_agent.stream("Test prompt")) as stream:
+            async for chunk in stream:
+                held = openai_agent.semaphore._value
+                break
+
+        return held
+
+    assert asyncio.run(stop_early()) == 1
+    assert openai_agent.semaphore._value == 2
+
+    async def replace_semaphore():
+        async for chunk in openai_agent.stream("Other prompt"):
+            acquired = openai_agent.semaphore
+            # e.g. replaced by get_semaphore for another event loop
+            openai_agent.semaphore = asyncio.Semaphore(2)
+
+        return acquired
+
+    acquired = asyncio.run(replace_semaphore())
+    assert acquired._value == 2
+    assert openai_agent.semaphore._value == 2
+
+
+def test_async_stream_takes_no_slot_while_waiting(async_agent, mocker):
+    openai_agent, create_method_mock = async_agent
+    free_slots = []
+
+    async def aacquire(tokens):
+        free_slots.append(openai_agent.get_semaphore()._value)
+
+    async def sleep(delay):
+        free_slots.append(openai_agent.get_semaphore()._value)
+
+    openai_agent.rate_limiter = MagicMock(spec=RateLimiter, aacquire=aacquire)
+    mocker.patch("asyncio.sleep", new=sleep)
+    create_method_mock.side_effect = [
+        RateLimitError("Rate limit exceeded", response=MagicMock(), body=None),
+        make_stream("- A is B."),
+    ]
+
+    async def collect():
+        return [chunk async for chunk in openai_agent.stream("Test prompt")]
+
+    assert asyncio.run(collect()) == ["- A is B."]
+    # Waiting for the rate limiter (twice) and backing off (once) hold no slot
+    assert free_slots == [2, 2, 2]
+    assert openai_agent.semaphore._value == 2
+
+
+# TOKEN ACCOUNTING
+
+
+def test_usage_is_recorded_per_stage(agent):
+    openai_agent, create_method_mock = agent
+    openai_agent.usage = UsageStats(prices={openai_agent.model_name: (1.0, 1.0)})
+    openai_agent.stage = "extraction"
+    response = make_response("Response")
+    response.usage = MagicMock(prompt_tokens=12, completion_tokens=3)
+    create_method_mock.return_value = response
+
+    openai_agent.generate("Test prompt")
+
+    summary = openai_agent.usage.summary()
+    assert summary["stages"]["extraction"]["prompt_tokens"] == 12
+    assert summary["completion_tokens"] == 3
+    assert summary["cost"] == 15 / 1_000_000
+
+
+def test_spent_budget_stops_new_requests(agent):
+    openai_agent, create_method_mock = agent
+    openai_agent.usage = UsageStats(max_tokens=10)
+    openai_agent.usage.record("extraction", "model", 10, 0)
+
+    with pytest.raises(BudgetExceeded):
+        openai_agent.generate("Test prompt")
+
+    create_method_mock.assert_not_called()
+
+
+# RATE LIMITER
+
+
+def test_rate_limiter_is_acquired_and_updated_from_headers(agent):
+    openai_agent, create_method_mock = agent
+    openai_agent.rate_limiter = MagicMock(spec=RateLimiter)
+    raw_create = openai_agent.client.chat.completions.with_raw_response.create
+    raw_create.return_value.headers = {"x-ratelimit-remaining-requests": "10"}
+    raw_create.return_value.parse.return_value = make_response("Limited response")
+
+    assert openai_agent.generate("x" * 40) == "Limited response"
+
+    openai_agent.rate_limiter.acquire.assert_called_once_with(
+        11 + 1 + openai_agent.max_tokens
+    )
+    openai_agent.rate_limiter.update.assert_called_once_with(
+        {"x-ratelimit-remaining-requests": "10"}
+    )
+    create_method_mock.assert_not_called()
+
+
+def test_async_rate_limiter_is_acquired(async_agent):
+    openai_agent, create_method_mock = async_agent
+    openai_agent.rate_limiter = MagicMock(spec=RateLimiter)
+    raw_create = AsyncMock()
+    openai_agent.client.chat.completions.with_raw_response.create = raw_create
+    raw_create.return_value.parse = MagicMock(return_value=make_response("Response"))
+
+    assert asyncio.run(openai_agent.generate("Test prompt")) == "Response"
+
+    openai_agent.rate_limiter.aacquire.assert_awaited_once()
+    openai_agent.rate_limiter.update.assert_called_once()
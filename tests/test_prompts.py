@@ -0,0 +1,40 @@
+from FactScoreLite.prompts import PromptPrefixes, select_demon
+
+
+def test_select_demon_is_deterministic_and_seeded():
+    picks = [select_demon(f"fact {i}", 4) for i in range(100)]
+
+    assert picks == [select_demon(f"fact {i}", 4) for i in range(100)]
+    assert set(picks) == {0, 1, 2, 3}
+    assert picks != [select_demon(f"fact {i}", 4, seed=1) for i in range(100)]
+
+
+def test_prompt_prefixes_are_built_once():
+    prefixes = PromptPrefixes()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return "x" * 40
+
+    assert prefixes.get("name", build) == prefixes.get("name", build)
+    assert len(calls) == 1
+    assert prefixes.stats() == {"name": 11}
+
+
+def test_prompt_prefixes_are_shared_by_inputs():
+    calls = []
+
+    def build():
+        calls.append(1)
+        return "prefix " * 10
+
+    first = PromptPrefixes("shared-inputs")
+    second = PromptPrefixes("shared-inputs")
+
+    assert first.get("name", build) is second.get("name", build)
+    assert len(calls) == 1
+    assert second.stats() == {"name": 18}
+
+    PromptPrefixes("other-inputs").get("name", build)
+    assert len(calls) == 2
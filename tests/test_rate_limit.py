@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from FactScoreLite import configs
+from FactScoreLite.rate_limit import RateLimiter, get_rate_limiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # A frozen clock so that the buckets do not refill between reservations
+    now = [1000.0]
+    monkeypatch.setattr("FactScoreLite.rate_limit.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_requests_wait_in_reservation_order(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+
+    waits = [limiter.reserve(0) for _ in range(63)]
+
+    assert waits[:60] == [0.0] * 60
+    assert waits[60:] == pytest.approx([1.0, 2.0, 3.0])
+
+
+def test_bucket_refills_over_time(clock):
+    limiter = RateLimiter(tokens_per_minute=600)
+
+    assert limiter.reserve(600) == 0.0
+    clock[0] += 30
+
+    assert limiter.reserve(300) == 0.0
+    assert limiter.reserve(100) == pytest.approx(10.0)
+
+
+def test_request_larger_than_quota_waits_for_a_full_bucket(clock):
+    limiter = RateLimiter(tokens_per_minute=100)
+
+    assert limiter.reserve(1000) == 0.0
+    assert limiter.reserve(10) == pytest.approx(6.0)
+
+
+def test_headers_lower_the_budget(clock):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000)
+
+    limiter.update(
+        {
+            "x-ratelimit-limit-requests": "60",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-limit-tokens": "6000",
+            "x-ratelimit-remaining-tokens": "5000",
+        }
+    )
+
+    assert limiter.reserve(0) == pytest.approx(1.0)
+
+
+def test_headers_set_unconfigured_limits(clock):
+    limiter = RateLimiter(requests_per_minute=60)
+
+    limiter.update(
+        {"x-ratelimit-limit-tokens": "600", "x-ratelimit-remaining-tokens": "0"}
+    )
+
+    assert limiter.reserve(60) == pytest.approx(6.0)
+
+
+def test_aacquire_sleeps_without_blocking_the_loop(clock, monkeypatch):
+    limiter = RateLimiter(requests_per_minute=1)
+    sleep = MagicMock()
+
+    async def fake_sleep(delay):
+        sleep(delay)
+
+    monkeypatch.setattr("FactScoreLite.rate_limit.asyncio.sleep", fake_sleep)
+
+    async def run():
+        await limiter.aacquire(0)
+        await limiter.aacquire(0)
+
+    asyncio.run(run())
+
+    sleep.assert_called_once_with(pytest.approx(60.0))
+
+
+def test_get_rate_limiter_is_opt_in_and_shared(monkeypatch):
+    assert get_rate_limiter("model") is None
+
+    monkeypatch.setattr(configs, "requests_per_minute", 100)
+
+    assert get_rate_limiter("model") is get_rate_limiter("model")
+    assert get_rate_limiter("model") is not get_rate_limiter("other-model")
@@ -0,0 +1,58 @@
+from unittest.mock import MagicMock
+from FactScoreLite.retrieval import BM25Index, Retriever, chunk_text, tokenize
+
+
+def test_tokenize_lowercases_words():
+    assert tokenize("The Eiffel-Tower, 1889!") == ["the", "eiffel", "tower", "1889"]
+
+
+def test_chunk_text_overlaps_passages():
+    text = " ".join(f"w{i}" for i in range(10))
+
+    assert chunk_text(text, 4, 1) == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+
+
+def test_chunk_text_short_text_is_one_passage():
+    assert chunk_text("One short\npassage.", 128, 32) == ["One short\npassage."]
+
+
+def test_bm25_ranks_matching_passage_first():
+    index = BM25Index(
+        [
+            "The Eiffel Tower is in Paris.",
+            "The Colosseum is in Rome.",
+            "Big Ben is in London.",
+        ]
+    )
+
+    assert index.search("Colosseum Rome", 2)[0] == 1
+    assert len(index.search("Colosseum Rome", 2)) == 2
+
+
+def test_retriever_keeps_top_k_passages_in_source_order():
+    retriever = Retriever(top_k=1, chunk_size=4, chunk_overlap=0)
+    source = "Paris is in France. Rome is in Italy. Berlin is in Germany."
+
+    context = retriever.retrieve(["Berlin is in Germany", "Paris"], source)
+
+    assert context == "Paris is in France.\n...\nBerlin is in Germany."
+
+
+def test_retriever_returns_short_source_unchanged():
+    retriever = Retriever(top_k=3, chunk_size=128, chunk_overlap=32)
+
+    assert retriever.retrieve(["fact"], "Short source.") == "Short source."
+
+
+def test_retriever_builds_index_once_per_source():
+    index_factory = MagicMock(side_effect=BM25Index)
+    retriever = Retriever(
+        top_k=1, chunk_size=2, chunk_overlap=0, index_factory=index_factory
+    )
+    source = "a b c d e f"
+
+    retriever.retrieve(["a"], source)
+    retriever.retrieve(["c"], source)
+    retriever.retrieve(["a"], "other source text here")
+
+    assert index_factory.call_count == 2
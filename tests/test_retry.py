@@ -0,0 +1,131 @@
+import asyncio
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+from openai import (
+    APIConnectionError,
+    BadRequestError,
+    InternalServerError,
+    RateLimitError,
+)
+from FactScoreLite.retry import CircuitBreaker, RetryError, RetryPolicy, get_retry_after
+
+
+def make_error(error_class, status_code, headers=None):
+    response = MagicMock(status_code=status_code, headers=headers or {})
+    return error_class("Simulated error", response=response, body=None)
+
+
+def flaky(errors, result="Success"):
+    """Returns a mock that raises the given errors, then returns result."""
+    return MagicMock(side_effect=[*errors, result], __name__="flaky")
+
+
+@pytest.fixture
+def no_sleep():
+    with patch("time.sleep") as mock_sleep:
+        yield mock_sleep
+
+
+def test_successful_call_is_not_retried(no_sleep):
+    func = flaky([])
+
+    assert RetryPolicy()(func)() == "Success"
+    assert func.call_count == 1
+    no_sleep.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        make_error(RateLimitError, 429),
+        make_error(InternalServerError, 500),
+        APIConnectionError(request=MagicMock()),
+    ],
+)
+def test_transient_errors_are_retried(error, no_sleep):
+    func = flaky([error])
+
+    assert RetryPolicy(circuit_breaker=CircuitBreaker())(func)() == "Success"
+    assert func.call_count == 2
+
+
+def test_non_retryable_errors_are_not_retried(no_sleep):
+    func = flaky([make_error(BadRequestError, 400)])
+
+    with pytest.raises(BadRequestError):
+        RetryPolicy()(func)()
+
+    assert func.call_count == 1
+
+
+def test_gives_up_after_max_retries(no_sleep):
+    func = MagicMock(side_effect=make_error(RateLimitError, 429), __name__="func")
+
+    with pytest.raises(RetryError, match="Maximum number of retries") as exc_info:
+        RetryPolicy(max_retries=3)(func)()
+
+    assert func.call_count == 4
+    assert isinstance(exc_info.value.__cause__, RateLimitError)
+
+
+def test_delays_are_capped_decorrelated_jitter(no_sleep):
+    errors = [make_error(InternalServerError, 503)] * 10
+    policy = RetryPolicy(base_delay=1, max_delay=5, max_retries=10, deadline=None)
+
+    policy(flaky(errors))()
+
+    delays = [call[0][0] for call in no_sleep.call_args_list]
+    assert len(delays) == 10
+    assert all(1 <= delay <= 5 for delay in delays)
+    assert delays[0] <= 3
+
+
+def test_retry_after_is_honored(no_sleep):
+    errors = [make_error(RateLimitError, 429, {"retry-after": "7"})]
+
+    RetryPolicy(base_delay=0.1, max_delay=1)(flaky(errors))()
+
+    assert no_sleep.call_args[0][0] == 7.0
+
+
+def test_get_retry_after_in_milliseconds():
+    error = make_error(RateLimitError, 429, {"retry-after-ms": "250"})
+
+    assert get_retry_after(error) == 0.25
+    assert get_retry_after(ValueError()) is None
+
+
+def test_deadline_stops_retries(no_sleep):
+    errors = [make_error(RateLimitError, 429, {"retry-after": "30"})]
+    func = flaky(errors)
+
+    with pytest.raises(RetryError, match="Deadline"):
+        RetryPolicy(deadline=10)(func)()
+
+    assert func.call_count == 1
+
+
+def test_circuit_breaker_pauses_every_caller(no_sleep):
+    breaker = CircuitBreaker(threshold=2, timeout=30)
+    policy = RetryPolicy(circuit_breaker=breaker, base_delay=0.01, max_delay=0.01)
+    error = make_error(InternalServerError, 502)
+
+    policy(flaky([error, error]))()
+    no_sleep.reset_mock()
+
+    # Another caller arriving while the circuit is open waits for it to close
+    policy(flaky([]))()
+
+    assert no_sleep.call_args[0][0] == pytest.approx(30, abs=1)
+    assert breaker.failures == 0
+
+
+def test_async_retries_do_not_block_the_loop():
+    func = AsyncMock(side_effect=[make_error(RateLimitError, 429), "Recovered"])
+    policy = RetryPolicy(circuit_breaker=CircuitBreaker())
+
+    with patch("asyncio.sleep", new=AsyncMock()) as mock_sleep:
+        result = asyncio.run(policy.acall(func))
+
+    assert result == "Recovered"
+    mock_sleep.assert_awaited_once()
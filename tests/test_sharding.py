@@ -0,0 +1,228 @@
+import json
+import multiprocessing
+import pytest
+from FactScoreLite import FactScore, FakeBackend, configs
+from FactScoreLite.cache import MemoCache
+from FactScoreLite.sharding import (
+    get_shard,
+    get_shard_path,
+    get_shard_paths,
+    merge_shards,
+    partition,
+    run_shards,
+)
+from FactScoreLite.state_handler import (
+    JSONLStateHandler,
+    SQLiteStateHandler,
+    read_state,
+)
+
+GENERATIONS = [f"A{i} is B. C{i} is D." for i in range(12)]
+KNOWLEDGE_SOURCES = ["A is B."] * 12
+
+
+def split_sentences(text):
+    return [sent.strip() + "." for sent in text.split(".") if sent.strip()]
+
+
+def create_factscore(**kwargs):
+    fs = FactScore(backend=FakeBackend(), **kwargs)
+    fs.atomic_fact_generator.sentence_cache = MemoCache()
+    fs.atomic_fact_generator.split_sentences = split_sentences
+    fs.fact_scorer.decision_cache = MemoCache()
+    return fs
+
+
+def test_get_shard_is_stable():
+    shards = [get_shard(g, k, 4) for g, k in zip(GENERATIONS, KNOWLEDGE_SOURCES)]
+
+    assert all(0 <= shard < 4 for shard in shards)
+    assert len(set(shards)) > 1
+    assert get_shard("generation", "source", 4) == 2
+    assert get_shard("generation", "other source", 4) == 1
+
+
+def test_shard_paths():
+    assert get_shard_path("states/facts.jsonl", 2, 8) == (
+        "states/facts-00002-of-00008.jsonl"
+    )
+    assert get_shard_paths("decisions.sqlite", 2) == [
+        "decisions-00000-of-00002.sqlite",
+        "decisions-00001-of-00002.sqlite",
+    ]
+
+
+def test_partition_keeps_input_order():
+    shards = partition(GENERATIONS, KNOWLEDGE_SOURCES, 3)
+
+    assert sorted(i for indices, _, _ in shards for i in indices) == list(range(12))
+
+    for indices, generations, knowledge_sources in shards:
+        assert indices == sorted(indices)
+        assert generations == [GENERATIONS[i] for i in indices]
+
+
+def test_run_shards_matches_a_single_run(tmp_path):
+    facts_path = str(tmp_path / "facts.jsonl")
+    decisions_path = str(tmp_path / "decisions.jsonl")
+
+    score, init_score = run_shards(
+        GENERATIONS,
+        KNOWLEDGE_SOURCES,
+        3,
+        processes=2,
+        facts_path=facts_path,
+        decisions_path=decisions_path,
+        factory=create_factscore,
+    )
+
+    fs = create_factscore(
+        facts_path=str(tmp_path / "single-facts.jsonl"),
+        decisions_path=str(tmp_path / "single-decisions.jsonl"),
+    )
+    assert (score, init_score) == pytest.approx(
+        fs.get_factscore(GENERATIONS, KNOWLEDGE_SOURCES)
+    )
+
+    for shard, (indices, _, _) in enumerate(
+        partition(GENERATIONS, KNOWLEDGE_SOURCES, 3)
+    ):
+        handler = JSONLStateHandler(get_shard_path(decisions_path, shard, 3))
+        assert len(handler.load()) == len(indices)
+
+    merged = merge_shards(get_shard_paths(decisions_path, 3))
+
+    assert merged["count"] == 12
+    assert merged["score"] == pytest.approx(score)
+    assert merged["init_score"] == pytest.approx(init_score)
+    assert sum(merged["shards"]) == 12
+
+
+def test_merge_counts_each_generation_once(tmp_path):
+    entry = {"key": "a", "generation": "A", "decision": [{"is_supported": True}]}
+    JSONLStateHandler(tmp_path / "a.jsonl").append(entry)
+    handler = JSONLStateHandler(tmp_path / "b.jsonl")
+    handler.append(entry)
+    handler.append(
+        {"key": "b", "generation": "B", "decision": [{"is_supported": False}]}
+    )
+    handler.flush()
+
+    merged = merge_shards(
+        [tmp_path / "a.jsonl", tmp_path / "b.jsonl", tmp_path / "missing.jsonl"],
+        gamma=0,
+    )
+
+    assert merged == {
+        "count": 2,
+        "score": 0.5,
+        "init_score": 0.5,
+        "shards": [1, 1, 0],
+        "skipped": 0,
+    }
+
+
+def test_merge_only_reads_the_files(tmp_path):
+    entry = {"key": "a", "generation": "A", "decision": [{"is_supported": True}]}
+    path = tmp_path / "a.jsonl"
+    # A shard still writing its second line
+    content = (json.dumps(entry) + "\n" + '{"key": "b", "gen').encode()
+    path.write_bytes(content)
+    legacy = tmp_path / "b.jsonl"
+    legacy.write_text(json.dumps([dict(entry, key="b")]))
+
+    merged = merge_shards([path, legacy], gamma=0)
+
+    assert merged["shards"] == [1, 1]
+    assert path.read_bytes() == content
+    assert legacy.read_text().startswith("[")
+
+
+def test_merge_sqlite_shards(tmp_path):
+    handler = SQLiteStateHandler(tmp_path / "decisions.sqlite")
+    handler.append(
+        {"key": "a", "generation": "A", "decision": [{"is_supported": True}]}
+    )
+    handler.flush()
+
+    merged = merge_shards([tmp_path / "decisions.sqlite"], gamma=0, backend="sqlite")
+
+    assert merged["count"] == 1
+
+
+def test_merge_counts_repeated_input_pairs_like_run_shards(tmp_path):
+    generations = ["A is B.", "A is B.", "C is D. E is F."]
+    knowledge_sources = ["A is B."] * 3
+    decisions_path = str(tmp_path / "decisions.jsonl")
+
+    score, init_score = run_shards(
+        generations,
+        knowledge_sources,
+        2,
+        processes=1,
+        facts_path=str(tmp_path / "facts.jsonl"),
+        decisions_path=decisions_path,
+        factory=create_factscore,
+    )
+    paths = get_shard_paths(decisions_path, 2)
+
+    merged = merge_shards(
+        paths, generations=generations, knowledge_sources=knowledge_sources
+    )
+
+    assert merged["count"] == 3
+    assert merged["missing"] == 0
+    assert (merged["score"], merged["init_score"]) == pytest.approx((score, init_score))
+    # Without the input, each scored pair is counted once
+    assert merge_shards(paths)["count"] == 2
+
+
+def test_merge_refuses_decisions_of_other_settings(tmp_path, monkeypatch):
+    decisions_path = str(tmp_path / "decisions.jsonl")
+    kwargs = dict(
+        processes=1,
+        facts_path=str(tmp_path / "facts.jsonl"),
+        decisions_path=decisions_path,
+        factory=create_factscore,
+    )
+    run_shards(GENERATIONS[:4], KNOWLEDGE_SOURCES[:4], 2, **kwargs)
+    # An earlier run of another model left its decisions in the same files
+    monkeypatch.setattr(configs, "model_name", "other-model")
+    run_shards(GENERATIONS[4:6], KNOWLEDGE_SOURCES[4:6], 2, **kwargs)
+    paths = get_shard_paths(decisions_path, 2)
+
+    with pytest.raises(ValueError, match="different model settings"):
+        merge_shards(paths)
+
+    config = create_factscore(
+        facts_path=str(tmp_path / "f.jsonl"), decisions_path=str(tmp_path / "d.jsonl")
+    ).get_config_key()
+    merged = merge_shards(paths, config=config)
+
+    assert (merged["count"], merged["skipped"]) == (2, 4)
+
+
+def test_run_shards_sends_the_configs_to_spawned_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(configs, "model_name", "spawned-model")
+    decisions_path = str(tmp_path / "decisions.jsonl")
+
+    run_shards(
+        GENERATIONS[:2],
+        KNOWLEDGE_SOURCES[:2],
+        1,
+        facts_path=str(tmp_path / "facts.jsonl"),
+        decisions_path=decisions_path,
+        factory=create_factscore,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    config = create_factscore(
+        facts_path=str(tmp_path / "f.jsonl"), decisions_path=str(tmp_path / "d.jsonl")
+    ).get_config_key()
+
+    entries = read_state(get_shard_path(decisions_path, 0, 1))
+    assert [entry["config"] for entry in entries] == [config] * 2
+
+
+def test_run_shards_rejects_unpicklable_arguments(tmp_path):
+    with pytest.raises(TypeError, match="build the backend"):
+        run_shards(GENERATIONS, KNOWLEDGE_SOURCES, 2, backend=FakeBackend())
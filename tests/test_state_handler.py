@@ -1,5 +1,14 @@
 import os
-from FactScoreLite.state_handler import StateHandler
+import pytest
+from FactScoreLite.state_handler import (
+    StateHandler,
+    JSONLStateHandler,
+    SQLiteStateHandler,
+    SavedEntries,
+    get_state_handler,
+    get_state_path,
+    read_state,
+)
 
 
 def test_save_load_data():
@@ -55,3 +64,256 @@ def test_save_data_integrity():
 
     # Cleanup
     os.remove("test_integrity.json")
+
+
+# JSONL backend
+
+
+def test_jsonl_append_load(tmp_path):
+    handler = JSONLStateHandler(tmp_path / "facts.jsonl")
+    handler.append({"generation": "gen1", "facts": ["fact1"]})
+    handler.append({"generation": "gen2", "facts": []})
+    handler.close()
+
+    assert JSONLStateHandler(tmp_path / "facts.jsonl").load() == [
+        {"generation": "gen1", "facts": ["fact1"]},
+        {"generation": "gen2", "facts": []},
+    ]
+
+
+def test_jsonl_append_only_writes_the_new_item(tmp_path):
+    path = tmp_path / "facts.jsonl"
+    handler = JSONLStateHandler(path)
+    handler.append({"item": 1})
+    size = path.stat().st_size
+    handler.append({"item": 2})
+
+    assert path.stat().st_size == 2 * size
+
+
+def test_jsonl_load_nonexistent_file(tmp_path):
+    assert JSONLStateHandler(tmp_path / "missing.jsonl").load() == []
+
+
+def test_jsonl_load_drops_torn_tail(tmp_path):
+    path = tmp_path / "facts.jsonl"
+    path.write_text('{"item": 1}\n{"item": 2}\n{"ite')
+
+    handler = JSONLStateHandler(path)
+    assert handler.load() == [{"item": 1}, {"item": 2}]
+    # The torn bytes are removed so the next append starts on a clean line
+    handler.append({"item": 3})
+    handler.close()
+    assert handler.load() == [{"item": 1}, {"item": 2}, {"item": 3}]
+
+
+def test_jsonl_load_keeps_complete_line_without_newline(tmp_path):
+    path = tmp_path / "facts.jsonl"
+    path.write_text('{"item": 1}\n{"item": 2}')
+
+    handler = JSONLStateHandler(path)
+    assert handler.load() == [{"item": 1}, {"item": 2}]
+    handler.append({"item": 3})
+    handler.close()
+    assert handler.load() == [{"item": 1}, {"item": 2}, {"item": 3}]
+    assert read_state(path, "jsonl") == [{"item": 1}, {"item": 2}, {"item": 3}]
+
+
+def test_jsonl_load_raises_on_corruption_in_the_middle(tmp_path):
+    path = tmp_path / "facts.jsonl"
+    path.write_text('{"item": 1}\nnot json\n{"item": 3}\n')
+
+    with pytest.raises(ValueError):
+        JSONLStateHandler(path).load()
+
+
+def test_jsonl_imports_legacy_json(tmp_path):
+    legacy_path = tmp_path / "facts.json"
+    StateHandler(legacy_path).save([{"item": 1}, {"item": 2}])
+    path = tmp_path / "facts.jsonl"
+
+    handler = JSONLStateHandler(path, legacy_path=legacy_path)
+
+    assert handler.load() == [{"item": 1}, {"item": 2}]
+    assert path.read_text() == '{"item": 1}\n{"item": 2}\n'
+
+
+def test_jsonl_imports_json_list_under_the_same_path(tmp_path):
+    path = tmp_path / "facts.jsonl"
+    StateHandler(path).save([{"item": 1}])
+
+    assert JSONLStateHandler(path).load() == [{"item": 1}]
+    assert path.read_text() == '{"item": 1}\n'
+
+
+def test_jsonl_save_replaces_items(tmp_path):
+    handler = JSONLStateHandler(tmp_path / "facts.jsonl")
+    handler.append({"item": 1})
+    handler.save([{"item": 2}])
+
+    assert handler.load() == [{"item": 2}]
+
+
+def test_get_state_handler_backends(tmp_path):
+    handler = get_state_handler(tmp_path / "facts.jsonl", "jsonl")
+    assert isinstance(handler, JSONLStateHandler)
+    assert handler.legacy_path == str(tmp_path / "facts.json")
+
+    assert isinstance(get_state_handler(tmp_path / "facts.json", "json"), StateHandler)
+
+    with pytest.raises(ValueError):
+        get_state_handler(tmp_path / "facts", "unknown")
+
+
+# SQLite backend
+
+
+def test_sqlite_append_load(tmp_path):
+    handler = SQLiteStateHandler(tmp_path / "facts.sqlite")
+    handler.append({"generation": "gen1", "facts": ["fact1"]})
+    handler.extend([{"generation": "gen2", "facts": []}, {"generation": "gen3"}])
+    handler.close()
+
+    handler = SQLiteStateHandler(tmp_path / "facts.sqlite")
+    assert handler.load() == [
+        {"generation": "gen1", "facts": ["fact1"]},
+        {"generation": "gen2", "facts": []},
+        {"generation": "gen3"},
+    ]
+    assert len(handler) == 3
+
+
+def test_sqlite_batches_commits(tmp_path):
+    path = tmp_path / "facts.sqlite"
+    handler = SQLiteStateHandler(path, commit_every=2)
+    reader = SQLiteStateHandler(path)
+
+    handler.append({"generation": "gen1"})
+    assert len(reader) == 0
+    handler.append({"generation": "gen2"})
+    assert len(reader) == 2
+
+
+def test_sqlite_keyed_and_partial_lookups(tmp_path):
+    handler = SQLiteStateHandler(tmp_path / "facts.sqlite")
+    handler.extend([{"generation": f"gen{i}", "facts": [i]} for i in range(5)])
+
+    assert handler.get(3) == {"generation": "gen3", "facts": [3]}
+    assert handler.get(10) is None
+    assert handler.load_range(1, 3) == [
+        {"generation": "gen1", "facts": [1]},
+        {"generation": "gen2", "facts": [2]},
+    ]
+    assert handler.find("gen4") == [{"generation": "gen4", "facts": [4]}]
+
+
+def test_sqlite_unsupported_facts(tmp_path):
+    handler = SQLiteStateHandler(tmp_path / "decisions.sqlite")
+    handler.append(
+        {
+            "generation": "gen1",
+            "decision": [
+                {"fact": "fact1", "is_supported": True, "output": "True"},
+                {"fact": "fact2", "is_supported": False, "output": "False"},
+            ],
+        }
+    )
+
+    assert handler.unsupported_facts() == [
+        (0, "gen1", {"fact": "fact2", "is_supported": False, "output": "False"})
+    ]
+
+
+def test_sqlite_save_replaces_items(tmp_path):
+    handler = SQLiteStateHandler(tmp_path / "facts.sqlite")
+    handler.append({"generation": "gen1"})
+    handler.save([{"generation": "gen2"}])
+
+    assert handler.load() == [{"generation": "gen2"}]
+
+
+def test_sqlite_imports_jsonl_state(tmp_path):
+    jsonl = JSONLStateHandler(tmp_path / "facts.jsonl")
+    jsonl.append({"generation": "gen1"})
+    jsonl.close()
+
+    handler = get_state_handler(tmp_path / "facts.sqlite", "sqlite")
+
+    assert isinstance(handler, SQLiteStateHandler)
+    assert handler.load() == [{"generation": "gen1"}]
+    assert len(handler) == 1
+
+
+def test_sqlite_switches_from_an_existing_jsonl_state(tmp_path):
+    path = tmp_path / "facts.jsonl"
+    jsonl = JSONLStateHandler(path)
+    jsonl.append({"generation": "gen1"})
+    jsonl.close()
+    content = path.read_bytes()
+
+    handler = get_state_handler(path, "sqlite")
+
+    assert handler.db_path == get_state_path(path, "sqlite")
+    assert handler.db_path == str(tmp_path / "facts.sqlite")
+    assert handler.load() == [{"generation": "gen1"}]
+    handler.append({"generation": "gen2"})
+    handler.close()
+
+    # The JSONL state is only read
+    assert path.read_bytes() == content
+    assert read_state(path, "sqlite") == [
+        {"generation": "gen1"},
+        {"generation": "gen2"},
+    ]
+
+
+def test_sqlite_get_by_key(tmp_path):
+    handler = SQLiteStateHandler(tmp_path / "facts.sqlite")
+    handler.extend(
+        [
+            {"key": "abc", "generation": "gen1", "facts": []},
+            {"key": "def", "generation": "gen2", "facts": ["fact"]},
+        ]
+    )
+
+    assert handler.get_by_key("def") == {
+        "key": "def",
+        "generation": "gen2",
+        "facts": ["fact"],
+    }
+    assert handler.get_by_key("missing") is None
+
+
+def test_saved_entries_keeps_recent_entries_bounded(tmp_path):
+    handler = JSONLStateHandler(tmp_path / "facts.jsonl")
+    saved = SavedEntries(handler, {"old": {"key": "old"}}, max_size=1)
+
+    assert saved.add({"key": "a", "value": 1}) == {"key": "a", "value": 1}
+    assert saved.add({"key": "a", "value": 2}) == {"key": "a", "value": 1}
+    saved.add({"key": "b"})
+
+    assert saved.get("old") == {"key": "old"}
+    assert saved.get("a") is None
+    assert saved.get("b") == {"key": "b"}
+    assert handler.load() == [{"key": "a", "value": 1}, {"key": "b"}]
+
+
+def test_saved_entries_looks_up_sqlite(tmp_path):
+    handler = SQLiteStateHandler(tmp_path / "facts.sqlite")
+    saved = SavedEntries(handler, max_size=1)
+
+    saved.add({"key": "a", "generation": "gen1", "facts": []})
+    saved.add({"key": "b", "generation": "gen2", "facts": []})
+
+    assert saved.get("a") == {"key": "a", "generation": "gen1", "facts": []}
+
+
+def test_read_state_does_not_write(tmp_path):
+    path = tmp_path / "facts.jsonl"
+    content = b'{"key": "a"}\n{"key": "b"}\n{"key"'
+    path.write_bytes(content)
+
+    assert read_state(path, "jsonl") == [{"key": "a"}, {"key": "b"}]
+    assert path.read_bytes() == content
+    assert read_state(tmp_path / "missing.sqlite", "sqlite") == []
+    assert not (tmp_path / "missing.sqlite").exists()
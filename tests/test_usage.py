@@ -0,0 +1,80 @@
+import threading
+import pytest
+from FactScoreLite.usage import UsageStats, BudgetExceeded, track_generation
+
+
+def test_record_totals_by_stage_and_generation():
+    usage = UsageStats(prices={"model": (1.0, 2.0)})
+
+    with track_generation("gen1"):
+        usage.record("extraction", "model", 100, 10)
+    usage.record("verification", "model", 1_000_000, 0)
+
+    summary = usage.summary()
+    assert summary["calls"] == 2
+    assert summary["prompt_tokens"] == 1_000_100
+    assert summary["cost"] == pytest.approx(1.00012)
+    assert summary["stages"]["extraction"]["completion_tokens"] == 10
+    assert summary["generations"] == {
+        "gen1": {
+            "calls": 1,
+            "prompt_tokens": 100,
+            "completion_tokens": 10,
+            "cost": pytest.approx(0.00012),
+        }
+    }
+
+
+def test_pop_generation():
+    usage = UsageStats(prices={"model": (1.0, 2.0)})
+
+    with track_generation("gen1"):
+        usage.record("extraction", "model", 100, 10)
+
+    assert usage.pop_generation("gen1")["calls"] == 1
+    assert usage.pop_generation("gen1")["calls"] == 0
+    assert usage.summary()["generations"] == {}
+    assert usage.summary()["calls"] == 1
+
+
+def test_unknown_models_cost_nothing():
+    assert UsageStats(prices={}).get_cost("model", 1000, 1000) == 0.0
+
+
+def test_token_budget():
+    usage = UsageStats(max_tokens=100)
+    usage.record("extraction", "model", 60, 30)
+    usage.check_budget()
+
+    usage.record("extraction", "model", 10, 0)
+
+    with pytest.raises(BudgetExceeded):
+        usage.check_budget()
+
+
+def test_cost_budget():
+    usage = UsageStats(max_cost=1.0, prices={"model": (1.0, 0.0)})
+    usage.record("verification", "model", 1_000_000, 0)
+
+    with pytest.raises(BudgetExceeded):
+        usage.check_budget()
+
+
+def test_track_generation_is_per_thread():
+    usage = UsageStats()
+
+    def record(key):
+        with track_generation(key):
+            for _ in range(100):
+                usage.record("extraction", "model", 1, 1)
+
+    threads = [threading.Thread(target=record, args=(f"gen{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    generations = usage.summary()["generations"]
+    assert {key: t["calls"] for key, t in generations.items()} == {
+        f"gen{i}": 100 for i in range(4)
+    }